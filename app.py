@@ -1,3 +1,4 @@
+import atexit
 import os
 import sqlalchemy
 from flask import Flask, redirect
@@ -5,11 +6,18 @@ from flask_jwt_extended import JWTManager
 from flask_cors import CORS
 from dotenv import load_dotenv
 from src.models import db
+from src.models.schema_upgrades import upgrade_schema
 from src.routes import init_app
 from flasgger import Swagger
-from apscheduler.schedulers.background import BackgroundScheduler
-from datetime import datetime, UTC
-from src.models.listing_model import Listing
+from src.schedulers.leader_scheduler import LeaderScheduler
+from src.schedulers.listing_scheduler import init_listing_scheduler
+from src.services.notification_queue import notification_queue
+from src.services.popularity_index import popularity_index
+from src.services.analytics_service import RestaurantAnalyticsService
+from src.services.gamification_services import rebuild_discount_leaderboard
+from src.services.environmental_service import EnvironmentalService
+from src.services.reward_backfill_service import backfill_rewards
+from src.services.achievement_service import AchievementService
 
 load_dotenv()
 
@@ -48,7 +56,10 @@ def create_app():
     with app.app_context():
         db.create_all()
         try:
-            from src.services.achievement_service import AchievementService
+            upgrade_schema()
+        except Exception as e:
+            print(f"Error upgrading the database schema: {e}")
+        try:
             AchievementService.initialize_achievements()
             print("Achievements initialized successfully")
         except Exception as e:
@@ -111,27 +122,91 @@ def create_app():
 
     Swagger(app, config=swagger_config)
 
-    def update_all_listings():
-        with app.app_context():
-            try:
-                listings = Listing.query.filter(Listing.expires_at > datetime.now(UTC)).all()
-                for listing in listings:
-                    listing.update_expiry()
-                db.session.commit()
-            except Exception as e:
-                db.session.rollback()
-                print(f"Error updating listings: {str(e)}")
-
-    scheduler = BackgroundScheduler()
+    def purge_sent_notifications():
+        return {"deleted": notification_queue.purge_sent()}
+
+    # Every worker process starts the scheduler, only the lease holder runs the jobs
+    scheduler = LeaderScheduler(app, name='freshdeal')
+    init_listing_scheduler(scheduler)
+    scheduler.add_job(
+        func=purge_sent_notifications,
+        trigger='interval',
+        hours=24,
+        id='purge_sent_notifications_job',
+        name='Delete delivered notifications from the outbox'
+    )
     scheduler.add_job(
-        func=update_all_listings,
+        func=popularity_index.refresh,
         trigger='interval',
-        hours=2,
-        id='update_listings_job',
-        name='Update listings fresh score and consume within time',
-        replace_existing=True
+        minutes=30,
+        id='refresh_popularity_index_job',
+        name='Rank the most purchased restaurants overall, per category and per area'
+    )
+    scheduler.add_job(
+        func=RestaurantAnalyticsService.reconcile_daily_stats,
+        trigger='cron',
+        hour=3,
+        id='reconcile_daily_stats_job',
+        name='Re-count the daily restaurant analytics rollups of the last two days'
+    )
+    scheduler.add_job(
+        func=backfill_rewards,
+        trigger='cron',
+        hour=3,
+        minute=30,
+        id='backfill_rewards_job',
+        name='Record contributions and discount points missing for past purchases'
+    )
+    scheduler.add_job(
+        func=rebuild_discount_leaderboard,
+        trigger='cron',
+        hour=4,
+        id='rebuild_discount_leaderboard_job',
+        name='Recompute the discount leaderboard totals and daily buckets'
+    )
+    scheduler.add_job(
+        func=EnvironmentalService.rebuild_contribution_totals,
+        trigger='cron',
+        hour=4,
+        minute=30,
+        id='rebuild_contribution_totals_job',
+        name='Recompute the per-user CO2 avoided totals, daily buckets and leaderboard'
+    )
+    scheduler.add_job(
+        func=AchievementService.rebuild_activity_counters,
+        trigger='cron',
+        hour=5,
+        id='rebuild_activity_counters_job',
+        name='Recompute the per-user purchase and comment counters achievements are awarded on'
+    )
+    # Rollup tables added after the data they summarise start out empty, the
+    # leader fills them once instead of every worker at startup
+    scheduler.add_once_job(
+        func=RestaurantAnalyticsService.backfill_daily_stats,
+        id='backfill_daily_stats_job',
+        name='Fill the daily restaurant analytics rollups from the whole purchase history'
+    )
+    scheduler.add_once_job(
+        func=rebuild_discount_leaderboard,
+        id='backfill_discount_leaderboard_job',
+        name='Fill the discount leaderboard totals and daily buckets from existing discount points'
+    )
+    scheduler.add_once_job(
+        func=EnvironmentalService.rebuild_contribution_totals,
+        id='backfill_contribution_totals_job',
+        name='Fill the per-user CO2 avoided totals and daily buckets from existing contributions'
+    )
+    scheduler.add_once_job(
+        func=AchievementService.rebuild_activity_counters,
+        id='backfill_activity_counters_job',
+        name='Fill the per-user activity counters from existing purchases and comments'
     )
     scheduler.start()
+    app.extensions['leader_scheduler'] = scheduler
+    atexit.register(scheduler.shutdown)
+
+    # Deliver queued notifications, including those left over from a previous run
+    notification_queue.start(app)
 
     init_app(app)
 
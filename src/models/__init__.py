@@ -18,6 +18,13 @@ from .achievement_model import Achievement, UserAchievement, AchievementType
 from .comment_badges_model import CommentBadge
 from .restaurant_punishment_model import RestaurantPunishment, RefundRecord
 from .enviromental_contribution_model import EnvironmentalContribution
+from .notification_outbox_model import NotificationOutbox
+from .scheduler_model import SchedulerLease, ScheduledJobRun
+from .restaurant_popularity_model import RestaurantPopularity
+from .restaurant_daily_stats_model import RestaurantDailyStats, RestaurantDailyDistrictStats
+from .discount_leaderboard_model import UserDiscountTotal, UserDiscountDaily
+from .environmental_totals_model import UserEnvironmentalTotal, UserEnvironmentalDaily
+from .user_activity_model import UserActivityTotal, UserActivityDaily
 
 __all__ = [
     'db',
@@ -41,4 +48,16 @@ __all__ = [
     'RestaurantPunishment',
     'RefundRecord',
     'EnvironmentalContribution',
+    'NotificationOutbox',
+    'SchedulerLease',
+    'ScheduledJobRun',
+    'RestaurantPopularity',
+    'RestaurantDailyStats',
+    'RestaurantDailyDistrictStats',
+    'UserDiscountTotal',
+    'UserDiscountDaily',
+    'UserEnvironmentalTotal',
+    'UserEnvironmentalDaily',
+    'UserActivityTotal',
+    'UserActivityDaily',
 ]
\ No newline at end of file
@@ -1,8 +1,14 @@
 from . import db
 from sqlalchemy import Integer, String, DECIMAL, Boolean, CheckConstraint
+from ..utils.geo import bounding_box_predicate
 
 class CustomerAddress(db.Model):
     __tablename__ = 'customeraddresses'
+
+    __table_args__ = (
+        db.Index('idx_customer_address_primary_location', 'is_primary', 'latitude', 'longitude'),
+    )
+
     id = db.Column(Integer, primary_key=True, autoincrement=True, nullable=False)
     user_id = db.Column(Integer, db.ForeignKey('users.id'), nullable=False)
     title = db.Column(String(80), nullable=False)
@@ -18,6 +24,10 @@ class CustomerAddress(db.Model):
     doorNo = db.Column(String(6), nullable=True)
     is_primary = db.Column(Boolean, nullable=False, default=False)
 
+    @classmethod
+    def bounding_box_filter(cls, lat, lon, radius_km):
+        """SQL predicate matching addresses inside the lat/lon box around a circle."""
+        return bounding_box_predicate(cls.latitude, cls.longitude, lat, lon, radius_km)
 
     def to_dict(self):
         return {
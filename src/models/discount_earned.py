@@ -5,5 +5,11 @@ class DiscountEarned(db.Model):
     __tablename__ = 'discountearned'
     id = db.Column(Integer, primary_key=True, autoincrement=True)
     user_id = db.Column(Integer, db.ForeignKey('users.id'), nullable=False)
+    # Rows recorded before purchases were linked have no purchase
+    purchase_id = db.Column(Integer, db.ForeignKey('purchases.id'), nullable=True)
     discount = db.Column(DECIMAL(10, 2), nullable=False)
-    earned_at = db.Column(DateTime, nullable=False, default=func.now())
\ No newline at end of file
+    earned_at = db.Column(DateTime, nullable=False, default=func.now())
+
+    __table_args__ = (
+        db.Index('idx_discount_earned_purchase', 'purchase_id'),
+    )
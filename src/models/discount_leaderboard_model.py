@@ -0,0 +1,26 @@
+from . import db
+from sqlalchemy import Integer, Date, DECIMAL
+
+
+class UserDiscountTotal(db.Model):
+    """All-time discount earned per user, kept up to date from DiscountEarned, see gamification_services."""
+    __tablename__ = 'user_discount_totals'
+    __table_args__ = (
+        # Rank lookups count the users ahead of a total with an index range scan
+        db.Index('idx_user_discount_total_rank', 'total_discount', 'user_id'),
+    )
+
+    user_id = db.Column(Integer, db.ForeignKey('users.id'), primary_key=True)
+    total_discount = db.Column(DECIMAL(12, 2), nullable=False, default=0)
+
+
+class UserDiscountDaily(db.Model):
+    """Discount earned per user and earning day, monthly rankings sum the last 30 of them."""
+    __tablename__ = 'user_discount_daily'
+    __table_args__ = (
+        db.Index('idx_user_discount_daily_day', 'day', 'user_id'),
+    )
+
+    user_id = db.Column(Integer, db.ForeignKey('users.id'), primary_key=True)
+    day = db.Column(Date, primary_key=True)
+    discount = db.Column(DECIMAL(12, 2), nullable=False, default=0)
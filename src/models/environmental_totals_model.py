@@ -0,0 +1,22 @@
+from . import db
+from sqlalchemy import Integer, Date, DECIMAL
+
+
+class UserEnvironmentalTotal(db.Model):
+    """All-time CO2 avoided per user, kept up to date from EnvironmentalContribution, see EnvironmentalService."""
+    __tablename__ = 'user_environmental_totals'
+    __table_args__ = (
+        db.Index('idx_user_environmental_total_rank', 'total_co2_avoided', 'user_id'),
+    )
+
+    user_id = db.Column(Integer, db.ForeignKey('users.id'), primary_key=True)
+    total_co2_avoided = db.Column(DECIMAL(12, 2), nullable=False, default=0)
+
+
+class UserEnvironmentalDaily(db.Model):
+    """CO2 avoided per user and contribution day (UTC), monthly figures sum the last 30 of them."""
+    __tablename__ = 'user_environmental_daily'
+
+    user_id = db.Column(Integer, db.ForeignKey('users.id'), primary_key=True)
+    day = db.Column(Date, primary_key=True)
+    co2_avoided = db.Column(DECIMAL(12, 2), nullable=False, default=0)
@@ -1,7 +1,14 @@
+from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.orm import relationship
 from . import db, Restaurant
-from sqlalchemy import Integer, String, ForeignKey, DECIMAL, DateTime, Float
+from sqlalchemy import Integer, String, ForeignKey, DECIMAL, DateTime, Float, case, cast, func, literal
 from datetime import datetime, timedelta, UTC
+from src.utils.sql_time import seconds_between
+
+
+def _as_utc(value):
+    """Datetimes come back naive from some drivers, they are always stored in UTC."""
+    return value.replace(tzinfo=UTC) if value.tzinfo is None else value
 
 
 class Listing(db.Model):
@@ -56,12 +63,12 @@ class Listing(db.Model):
             "original_price": float(self.original_price),
             "pick_up_price": float(self.pick_up_price) if self.pick_up_price is not None else None,
             "delivery_price": float(self.delivery_price) if self.delivery_price is not None else None,
-            "consume_within": self.consume_within,
-            "consume_within_type": self.consume_within_type,
+            "consume_within": self.current_consume_within,
+            "consume_within_type": self.current_consume_within_type,
             "expires_at": self.expires_at.strftime("%Y-%m-%d %H:%M:%S"),
             "created_at": self.created_at.strftime("%Y-%m-%d %H:%M:%S"),
             "update_count": self.update_count,
-            "fresh_score": round(self.fresh_score, 2),
+            "fresh_score": round(self.current_fresh_score, 2),
             "available_for_pickup": self.available_for_pickup,
             "available_for_delivery": self.available_for_delivery
         }
@@ -96,30 +103,89 @@ class Listing(db.Model):
     def is_expired(self):
         return datetime.now(UTC) > self.expires_at
 
+    # Listings closer than this to expiry are taken down
+    MIN_HOURS_LEFT = 6
+
+    # Below this many hours left, consume-within is shown in hours instead of days
+    CONSUME_WITHIN_HOURS_LIMIT = 12
+
+    # fresh_score, consume_within and consume_within_type columns keep the values
+    # the listing was created (or last edited) with. The current_* properties
+    # derive the up-to-date values from created_at/expires_at at read time, and
+    # are also SQL expressions, so they can be used in filters and ORDER BY.
+
+    @hybrid_property
+    def hours_left(self):
+        return (_as_utc(self.expires_at) - datetime.now(UTC)).total_seconds() / 3600
+
+    @hours_left.expression
+    def hours_left(cls):
+        return seconds_between(literal(datetime.now(UTC), DateTime(timezone=True)), cls.expires_at) / 3600.0
+
+    @hybrid_property
+    def lifetime_hours(self):
+        return (_as_utc(self.expires_at) - _as_utc(self.created_at)).total_seconds() / 3600
+
+    @lifetime_hours.expression
+    def lifetime_hours(cls):
+        return seconds_between(cls.created_at, cls.expires_at) / 3600.0
+
+    @hybrid_property
+    def current_fresh_score(self):
+        """Share of the listing's lifetime that is still ahead of it, 100 when created and 0 at expiry."""
+        lifetime = self.lifetime_hours
+        if lifetime <= 0:
+            return 0.0
+        return min(100.0, max(0.0, 100.0 * self.hours_left / lifetime))
+
+    @current_fresh_score.expression
+    def current_fresh_score(cls):
+        hours_left, lifetime = cls.hours_left, cls.lifetime_hours
+        return case(
+            (lifetime <= 0, 0.0),
+            (hours_left <= 0, 0.0),
+            (hours_left >= lifetime, 100.0),
+            else_=100.0 * hours_left / lifetime
+        )
+
+    @hybrid_property
+    def current_consume_within(self):
+        hours_left = max(0.0, self.hours_left)
+        if hours_left < self.CONSUME_WITHIN_HOURS_LIMIT:
+            return round(hours_left)
+        return round(hours_left / 24)
+
+    @current_consume_within.expression
+    def current_consume_within(cls):
+        hours_left = cls.hours_left
+        return cast(case(
+            (hours_left <= 0, 0),
+            (hours_left < cls.CONSUME_WITHIN_HOURS_LIMIT, func.round(hours_left, 0)),
+            else_=func.round(hours_left / 24, 0)
+        ), Integer)
+
+    @hybrid_property
+    def current_consume_within_type(self):
+        return 'HOURS' if self.hours_left < self.CONSUME_WITHIN_HOURS_LIMIT else 'DAYS'
+
+    @current_consume_within_type.expression
+    def current_consume_within_type(cls):
+        return case((cls.hours_left < cls.CONSUME_WITHIN_HOURS_LIMIT, 'HOURS'), else_='DAYS')
+
     def update_expiry(self):
-        current_time = datetime.now(UTC)
-        if current_time > self.expires_at:
+        """Store the current freshness in the columns, or take the listing down when it is about to expire."""
+        if self.hours_left < 0:
             return False
 
-        total_lifetime = (self.expires_at - self.created_at).total_seconds() / 3600
-        decrease_percentage = (2 / total_lifetime) * 100
-
-        self.fresh_score = max(0, self.fresh_score - decrease_percentage)
         self.update_count += 1
 
-        time_left = self.expires_at - current_time
-        hours_left = time_left.total_seconds() / 3600
-
-        if hours_left <= 6:
+        if self.hours_left <= self.MIN_HOURS_LEFT:
             self.delete_listing(self.id)
             return False
 
-        if hours_left < 12:
-            self.consume_within = round(hours_left)
-            self.consume_within_type = 'HOURS'
-        else:
-            self.consume_within = round(hours_left / 24)
-            self.consume_within_type = 'DAYS'
+        self.fresh_score = self.current_fresh_score
+        self.consume_within = self.current_consume_within
+        self.consume_within_type = self.current_consume_within_type
 
         db.session.add(self)
         return True
@@ -0,0 +1,36 @@
+import json
+from datetime import datetime, UTC
+from . import db
+
+
+class NotificationOutbox(db.Model):
+    """A notification waiting to be (or already) delivered by the notification workers."""
+    __tablename__ = 'notification_outbox'
+
+    STATUS_PENDING = 'pending'
+    STATUS_PROCESSING = 'processing'
+    STATUS_SENT = 'sent'
+    STATUS_FAILED = 'failed'
+
+    CHANNEL_EXPO = 'expo'
+    CHANNEL_WEB = 'web'
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    channel = db.Column(db.String(20), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    payload = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default=STATUS_PENDING)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=lambda: datetime.now(UTC))
+    available_at = db.Column(db.DateTime, nullable=False, default=lambda: datetime.now(UTC))
+    locked_at = db.Column(db.DateTime, nullable=True)
+    sent_at = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (
+        db.Index('idx_notification_outbox_status_available', 'status', 'available_at'),
+    )
+
+    @property
+    def payload_data(self) -> dict:
+        return json.loads(self.payload)
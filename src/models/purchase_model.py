@@ -1,6 +1,6 @@
 from . import db
 from sqlalchemy import Integer, ForeignKey, DECIMAL, DateTime, Boolean
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import column_property, relationship
 from datetime import datetime
 from enum import Enum as PyEnum
 
@@ -42,7 +42,12 @@ class Purchase(db.Model):
 
     total_price = db.Column(DECIMAL(10, 2), nullable=False)
     purchase_date = db.Column(DateTime, nullable=False, default=datetime.utcnow)
-    status = db.Column(db.Enum(PurchaseStatus), default=PurchaseStatus.PENDING, nullable=False)
+    # active_history loads the old status on assignment, so the rollup listeners
+    # see the status a purchase is leaving even when it was expired
+    status = column_property(
+        db.Column(db.Enum(PurchaseStatus), default=PurchaseStatus.PENDING, nullable=False),
+        active_history=True
+    )
     is_delivery = db.Column(db.Boolean, default=False, nullable=False)
     is_flash_deal = db.Column(Boolean, default=False, nullable=False)
 
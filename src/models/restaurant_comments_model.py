@@ -5,6 +5,10 @@ from . import db
 class RestaurantComment(db.Model):
     __tablename__ = 'restaurant_comments'
 
+    __table_args__ = (
+        db.Index('idx_restaurant_comment_restaurant_timestamp', 'restaurant_id', 'timestamp'),
+    )
+
     id = db.Column(Integer, primary_key=True, autoincrement=True, nullable=False)
     restaurant_id = db.Column(Integer, ForeignKey('restaurants.id'), nullable=False)
     user_id = db.Column(Integer, ForeignKey('users.id'), nullable=False)
@@ -0,0 +1,24 @@
+from . import db
+from sqlalchemy import Integer, String, Date, DECIMAL
+
+
+class RestaurantDailyStats(db.Model):
+    """Completed and rejected purchases of a restaurant per purchase day (UTC), see RestaurantAnalyticsService."""
+    __tablename__ = 'restaurant_daily_stats'
+
+    restaurant_id = db.Column(Integer, primary_key=True)
+    day = db.Column(Date, primary_key=True)
+    completed_purchases = db.Column(Integer, nullable=False, default=0)
+    rejected_purchases = db.Column(Integer, nullable=False, default=0)
+    units_sold = db.Column(Integer, nullable=False, default=0)
+    revenue = db.Column(DECIMAL(12, 2), nullable=False, default=0)
+
+
+class RestaurantDailyDistrictStats(db.Model):
+    """Completed purchases of a restaurant per purchase day (UTC) and delivery district."""
+    __tablename__ = 'restaurant_daily_district_stats'
+
+    restaurant_id = db.Column(Integer, primary_key=True)
+    day = db.Column(Date, primary_key=True)
+    district = db.Column(String(80), primary_key=True)
+    purchase_count = db.Column(Integer, nullable=False, default=0)
@@ -4,11 +4,17 @@ from sqlalchemy import Integer, String, DECIMAL, Boolean, Float
 from sqlalchemy.orm import validates, relationship
 from datetime import datetime, UTC
 from .restaurant_punishment_model import RestaurantPunishment
+from ..utils.geo import bounding_box_predicate
 
 
 class Restaurant(db.Model):
     __tablename__ = 'restaurants'
 
+    __table_args__ = (
+        db.Index('idx_restaurant_location', 'latitude', 'longitude'),
+        db.Index('idx_restaurant_flash_deals_location', 'flash_deals_available', 'latitude', 'longitude'),
+    )
+
     id = db.Column(Integer, primary_key=True, autoincrement=True, nullable=False)
     owner_id = db.Column(Integer, db.ForeignKey('users.id'), nullable=False)
 
@@ -44,6 +50,14 @@ class Restaurant(db.Model):
     purchases = relationship('Purchase', back_populates='restaurant')
     punishments = relationship('RestaurantPunishment', backref='restaurant', lazy=True)
 
+    @classmethod
+    def bounding_box_filter(cls, lat, lon, radius_km):
+        """
+        SQL predicate matching restaurants inside the lat/lon box around a circle,
+        so that only candidate rows are loaded before exact distance filtering.
+        """
+        return bounding_box_predicate(cls.latitude, cls.longitude, lat, lon, radius_km)
+
     @validates('workingDays')
     def validate_working_days(self, key, working_days):
         valid_days = {'Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday'}
@@ -0,0 +1,14 @@
+from . import db
+
+
+class RestaurantPopularity(db.Model):
+    """One entry of a persisted "most purchased" restaurant ranking, see PopularityIndex."""
+    __tablename__ = 'restaurant_popularity'
+
+    # 'global', 'category' or 'cell'; scope_key is the category or geohash cell, '' for global
+    scope = db.Column(db.String(20), primary_key=True)
+    scope_key = db.Column(db.String(80), primary_key=True)
+    rank = db.Column(db.Integer, primary_key=True)
+    restaurant_id = db.Column(db.Integer, nullable=False)
+    purchase_count = db.Column(db.Integer, nullable=False, default=0)
+    generated_at = db.Column(db.DateTime, nullable=False)
@@ -0,0 +1,51 @@
+import json
+from . import db
+
+
+class SchedulerLease(db.Model):
+    """Lease held by the process that runs the scheduled jobs, renewed by its heartbeat."""
+    __tablename__ = 'scheduler_leases'
+
+    name = db.Column(db.String(100), primary_key=True)
+    owner = db.Column(db.String(255), nullable=True)
+    acquired_at = db.Column(db.DateTime, nullable=True)
+    heartbeat_at = db.Column(db.DateTime, nullable=True)
+    expires_at = db.Column(db.DateTime, nullable=True)
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "owner": self.owner,
+            "acquired_at": self.acquired_at.isoformat() if self.acquired_at else None,
+            "heartbeat_at": self.heartbeat_at.isoformat() if self.heartbeat_at else None,
+            "expires_at": self.expires_at.isoformat() if self.expires_at else None,
+        }
+
+
+class ScheduledJobRun(db.Model):
+    """Statistics of the last run of a scheduled job, whichever process ran it."""
+    __tablename__ = 'scheduled_job_runs'
+
+    job_id = db.Column(db.String(100), primary_key=True)
+    run_count = db.Column(db.Integer, nullable=False, default=0)
+    failure_count = db.Column(db.Integer, nullable=False, default=0)
+    last_owner = db.Column(db.String(255), nullable=True)
+    last_started_at = db.Column(db.DateTime, nullable=True)
+    last_finished_at = db.Column(db.DateTime, nullable=True)
+    last_duration_seconds = db.Column(db.Float, nullable=True)
+    last_status = db.Column(db.String(20), nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+    last_result = db.Column(db.Text, nullable=True)
+
+    def to_dict(self):
+        return {
+            "run_count": self.run_count,
+            "failure_count": self.failure_count,
+            "last_owner": self.last_owner,
+            "last_started_at": self.last_started_at.isoformat() if self.last_started_at else None,
+            "last_finished_at": self.last_finished_at.isoformat() if self.last_finished_at else None,
+            "last_duration_seconds": self.last_duration_seconds,
+            "last_status": self.last_status,
+            "last_error": self.last_error,
+            "last_result": json.loads(self.last_result) if self.last_result else None,
+        }
@@ -0,0 +1,83 @@
+import logging
+from typing import List
+
+from sqlalchemy import inspect
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.schema import AddConstraint, CreateColumn, CreateIndex
+
+from . import db
+
+logger = logging.getLogger(__name__)
+
+
+def _execute(engine, statement, exists) -> bool:
+    """Run one DDL statement, returns False if another process applied it first."""
+    try:
+        with engine.begin() as connection:
+            connection.execute(statement)
+        return True
+    except DBAPIError:
+        if exists():
+            return False
+        raise
+
+
+def upgrade_schema() -> List[str]:
+    """
+    Add the columns and indexes models gained after their tables were created.
+
+    db.create_all() creates missing tables but never alters existing ones.
+    Missing nullable columns are added with their foreign keys, and missing
+    indexes are created; a missing NOT NULL column needs a manual migration
+    and is only logged. Safe to run in every worker at startup. Needs an
+    app context.
+
+    Returns:
+        List[str]: The columns and indexes added, as "table.name"
+    """
+    engine = db.engine
+    preparer = engine.dialect.identifier_preparer
+    existing_tables = set(inspect(engine).get_table_names())
+    added = []
+
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+
+        def columns():
+            return {column['name'] for column in inspect(engine).get_columns(table.name)}
+
+        def indexes():
+            return {index['name'] for index in inspect(engine).get_indexes(table.name)}
+
+        present, new_columns = columns(), []
+        for column in table.columns:
+            if column.name in present:
+                continue
+            if not column.nullable:
+                logger.warning(f"Column {table.name}.{column.name} is missing and NOT NULL, add it manually")
+                continue
+
+            definition = CreateColumn(column).compile(dialect=engine.dialect)
+            statement = db.text(f"ALTER TABLE {preparer.format_table(table)} ADD {definition}")
+            if _execute(engine, statement, lambda: column.name in columns()):
+                new_columns.append(column.name)
+                added.append(f"{table.name}.{column.name}")
+
+        # SQLite cannot add constraints to an existing table
+        if new_columns and engine.dialect.name != 'sqlite':
+            for constraint in table.foreign_key_constraints:
+                if set(constraint.column_keys) <= set(new_columns):
+                    with engine.begin() as connection:
+                        connection.execute(AddConstraint(constraint))
+
+        present = indexes()
+        for index in table.indexes:
+            if index.name in present:
+                continue
+            if _execute(engine, CreateIndex(index), lambda: index.name in indexes()):
+                added.append(f"{table.name}.{index.name}")
+
+    if added:
+        logger.info(f"Upgraded the database schema: {', '.join(added)}")
+    return added
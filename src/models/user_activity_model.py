@@ -0,0 +1,20 @@
+from . import db
+from sqlalchemy import Integer, Date
+
+
+class UserActivityTotal(db.Model):
+    """Lifetime completed purchases per user, kept up to date from Purchase, see AchievementService."""
+    __tablename__ = 'user_activity_totals'
+
+    user_id = db.Column(Integer, db.ForeignKey('users.id'), primary_key=True)
+    completed_purchases = db.Column(Integer, nullable=False, default=0)
+
+
+class UserActivityDaily(db.Model):
+    """Completed purchases per purchase day and comments per comment day (UTC), for the rolling achievement windows."""
+    __tablename__ = 'user_activity_daily'
+
+    user_id = db.Column(Integer, db.ForeignKey('users.id'), primary_key=True)
+    day = db.Column(Date, primary_key=True)
+    completed_purchases = db.Column(Integer, nullable=False, default=0)
+    comments = db.Column(Integer, nullable=False, default=0)
@@ -4,6 +4,9 @@ import sys
 import os
 from src.models import db
 from src.services.achievement_service import AchievementService
+from src.services.notification_queue import notification_queue
+from src.services.reward_backfill_service import backfill_rewards
+from src.utils.background import run_in_background
 
 admin_bp = Blueprint('admin_bp', __name__)
 
@@ -121,3 +124,87 @@ def clear_database():
     except Exception as e:
         print(f"Error clearing database: {str(e)}")
         return jsonify({"message": "Failed to clear database.", "error": str(e)}), 500
+
+
+@admin_bp.route('/notification-queue/metrics', methods=['GET'])
+def notification_queue_metrics():
+    """
+    Notification Queue Metrics
+    ---
+    tags:
+      - Admin
+    summary: Returns depth and delivery latency of the notification queue
+    description: |
+      Queue depth is read from the notification outbox table. Delivery counters
+      and enqueue-to-delivery latency cover the workers of the answering process.
+    responses:
+      200:
+        description: Current notification queue metrics.
+      500:
+        description: Failed to read the metrics.
+    """
+    try:
+        return jsonify(notification_queue.get_metrics()), 200
+    except Exception as e:
+        print(f"Error reading notification queue metrics: {str(e)}")
+        return jsonify({"message": "Failed to read notification queue metrics.", "error": str(e)}), 500
+
+
+@admin_bp.route('/scheduler/jobs', methods=['GET'])
+def scheduler_jobs():
+    """
+    Scheduled Jobs
+    ---
+    tags:
+      - Admin
+    summary: Lists the scheduled jobs and their last run
+    description: |
+      Jobs run only in the process holding the scheduler lease. The response
+      shows the lease, whether the answering process is the leader, and for
+      every job its trigger, next run on this process and last run on any process.
+    responses:
+      200:
+        description: Scheduler registry and last-run statistics.
+      503:
+        description: The scheduler is not running in this process.
+      500:
+        description: Failed to read the scheduler state.
+    """
+    scheduler = current_app.extensions.get('leader_scheduler')
+    if scheduler is None:
+        return jsonify({"message": "Scheduler is not running."}), 503
+    try:
+        return jsonify(scheduler.get_jobs()), 200
+    except Exception as e:
+        print(f"Error reading scheduler jobs: {str(e)}")
+        return jsonify({"message": "Failed to read scheduler jobs.", "error": str(e)}), 500
+
+
+@admin_bp.route('/backfill-rewards', methods=['POST'])
+def backfill_rewards_route():
+    """
+    Backfill Rewards
+    ---
+    tags:
+      - Admin
+    summary: Records contributions and discount points missing for completed purchases
+    description: |
+      Runs in the background. When the scheduler runs in this process the
+      backfill runs as its backfill_rewards_job, so its progress and result
+      show up under /admin/scheduler/jobs.
+    responses:
+      202:
+        description: Backfill started.
+      500:
+        description: Failed to start the backfill.
+    """
+    try:
+        scheduler = current_app.extensions.get('leader_scheduler')
+        if scheduler is not None:
+            run_in_background(scheduler.run_job, 'backfill_rewards_job')
+        else:
+            run_in_background(backfill_rewards)
+        return jsonify({"message": "Reward backfill started."}), 202
+    except Exception as e:
+        print(f"Error starting reward backfill: {str(e)}")
+        return jsonify({"message": "Failed to start reward backfill.", "error": str(e)}), 500
@@ -38,6 +38,29 @@ def get_owner_analytics():
       - Analytics
     security:
       - BearerAuth: []
+    parameters:
+      - name: period
+        in: query
+        required: false
+        schema:
+          type: string
+          enum: [month, week, custom]
+          default: month
+        description: Period to report, the current month or week so far, or start_date to end_date
+      - name: start_date
+        in: query
+        required: false
+        schema:
+          type: string
+          format: date
+        description: First day of a custom period (YYYY-MM-DD)
+      - name: end_date
+        in: query
+        required: false
+        schema:
+          type: string
+          format: date
+        description: Last day of a custom period (YYYY-MM-DD)
     responses:
       200:
         description: Analytics dashboard data
@@ -60,6 +83,10 @@ def get_owner_analytics():
                           type: string
                         period:
                           type: string
+                        start_date:
+                          type: string
+                        end_date:
+                          type: string
                     regional_distribution:
                       type: object
                     restaurant_ratings:
@@ -86,6 +113,8 @@ def get_owner_analytics():
                                   type: string
                                 timestamp:
                                   type: string
+      400:
+        description: Invalid period
       403:
         description: User is not a restaurant owner
       404:
@@ -101,7 +130,8 @@ def get_owner_analytics():
         print(json.dumps({"request": request_log}, indent=2))
 
         owner_id = get_jwt_identity()
-        response, status_code = RestaurantAnalyticsService.get_owner_analytics(owner_id)
+        response, status_code = RestaurantAnalyticsService.get_owner_analytics(
+            owner_id, request.args.get('period'), request.args.get('start_date'), request.args.get('end_date'))
 
         print(json.dumps({"response": response, "status": status_code}, indent=2))
         return jsonify(response), status_code
@@ -137,6 +167,28 @@ def get_restaurant_analytics(restaurant_id):
         schema:
           type: integer
         description: ID of the restaurant to get analytics for
+      - name: period
+        in: query
+        required: false
+        schema:
+          type: string
+          enum: [month, week, custom]
+          default: month
+        description: Period to report, the current month or week so far, or start_date to end_date
+      - name: start_date
+        in: query
+        required: false
+        schema:
+          type: string
+          format: date
+        description: First day of a custom period (YYYY-MM-DD)
+      - name: end_date
+        in: query
+        required: false
+        schema:
+          type: string
+          format: date
+        description: Last day of a custom period (YYYY-MM-DD)
     responses:
       200:
         description: Restaurant analytics data
@@ -159,6 +211,10 @@ def get_restaurant_analytics(restaurant_id):
                           type: string
                         period:
                           type: string
+                        start_date:
+                          type: string
+                        end_date:
+                          type: string
                     regional_distribution:
                       type: object
                     restaurant_stats:
@@ -194,6 +250,8 @@ def get_restaurant_analytics(restaurant_id):
                                       type: string
                                     is_positive:
                                       type: boolean
+      400:
+        description: Invalid period
       403:
         description: User is not a restaurant owner
       404:
@@ -227,7 +285,8 @@ def get_restaurant_analytics(restaurant_id):
             print(json.dumps({"error_response": error_response, "status": 403}, indent=2))
             return jsonify(error_response), 403
 
-        response, status_code = RestaurantAnalyticsService.get_restaurant_analytics(restaurant_id)
+        response, status_code = RestaurantAnalyticsService.get_restaurant_analytics(
+            restaurant_id, request.args.get('period'), request.args.get('start_date'), request.args.get('end_date'))
 
         print(json.dumps({"response": response, "status": status_code}, indent=2))
         return jsonify(response), status_code
@@ -242,4 +301,118 @@ def get_restaurant_analytics(restaurant_id):
             "error": str(e)
         }
         print(json.dumps({"error_response": error_response}, indent=2))
-        return jsonify(error_response), 500
\ No newline at end of file
+        return jsonify(error_response), 500
+
+@analytics_bp.route('/analytics/timeseries', methods=['GET'])
+@jwt_required()
+@owner_required
+def get_analytics_timeseries():
+    """
+    Get analytics of the authenticated owner's restaurants as a time series
+    ---
+    tags:
+      - Analytics
+    security:
+      - BearerAuth: []
+    parameters:
+      - name: granularity
+        in: query
+        required: false
+        schema:
+          type: string
+          enum: [hour, day, week, month]
+          default: day
+        description: Bucket size, buckets are in UTC and weeks start on Monday
+      - name: start_date
+        in: query
+        required: false
+        schema:
+          type: string
+          format: date
+        description: First day of the range (YYYY-MM-DD), defaults to the start of the current month
+      - name: end_date
+        in: query
+        required: false
+        schema:
+          type: string
+          format: date
+        description: Last day of the range (YYYY-MM-DD), defaults to today
+      - name: restaurant_id
+        in: query
+        required: false
+        schema:
+          type: integer
+        description: Limit the series to one of the owner's restaurants
+    responses:
+      200:
+        description: One entry per bucket of the range, empty buckets included
+        content:
+          application/json:
+            schema:
+              type: object
+              properties:
+                success:
+                  type: boolean
+                data:
+                  type: object
+                  properties:
+                    granularity:
+                      type: string
+                    start_date:
+                      type: string
+                    end_date:
+                      type: string
+                    restaurant_ids:
+                      type: array
+                      items:
+                        type: integer
+                    buckets:
+                      type: array
+                      items:
+                        type: object
+                        properties:
+                          start:
+                            type: string
+                          revenue:
+                            type: string
+                          units_sold:
+                            type: integer
+                          orders:
+                            type: integer
+                          rejected_orders:
+                            type: integer
+                          rejection_rate:
+                            type: number
+                          average_rating:
+                            type: number
+                            nullable: true
+                          rating_count:
+                            type: integer
+      400:
+        description: Invalid granularity or range, or too many buckets
+      403:
+        description: User is not a restaurant owner
+      404:
+        description: No restaurants found for this owner, or the restaurant is not theirs
+    """
+    try:
+        restaurant_id = request.args.get('restaurant_id', type=int)
+        response, status_code = RestaurantAnalyticsService.get_timeseries(
+            get_jwt_identity(),
+            request.args.get('granularity', 'day'),
+            request.args.get('start_date'),
+            request.args.get('end_date'),
+            restaurant_id
+        )
+        return jsonify(response), status_code
+    except Exception as e:
+        print("An error occurred:", str(e))
+        traceback.print_exc(file=sys.stderr)
+
+        error_response = {
+            "success": False,
+            "message": "An error occurred while fetching analytics time series.",
+            "error": str(e)
+        }
+        print(json.dumps({"error_response": error_response}, indent=2))
+        return jsonify(error_response), 500
@@ -1,4 +1,4 @@
-from flask import Blueprint, jsonify
+from flask import Blueprint, jsonify, request
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from src.services.environmental_service import EnvironmentalService
 import json
@@ -37,6 +37,9 @@ def get_user_environmental_contributions():
                     monthly_co2_avoided:
                       type: number
                       description: CO2 avoided in the last month (kg CO2 equivalent)
+                    rank:
+                      type: integer
+                      description: The user's position on the environmental leaderboard
                     unit:
                       type: string
                       description: Unit of measurement
@@ -72,6 +75,17 @@ def get_environmental_leaderboard():
       - Environmental
     security:
       - BearerAuth: []
+    parameters:
+      - name: limit
+        in: query
+        type: integer
+        required: false
+        description: Page size, at most 100. Without it the whole leaderboard is returned
+      - name: offset
+        in: query
+        type: integer
+        required: false
+        description: Number of leaderboard entries to skip
     responses:
       200:
         description: Environmental contribution leaderboard
@@ -87,6 +101,8 @@ def get_environmental_leaderboard():
                   items:
                     type: object
                     properties:
+                      rank:
+                        type: integer
                       user_id:
                         type: integer
                       total_co2_avoided:
@@ -101,7 +117,10 @@ def get_environmental_leaderboard():
         description: Internal server error
     """
     try:
-        response = EnvironmentalService.get_all_users_contributions()
+        response = EnvironmentalService.get_all_users_contributions(
+            request.args.get('limit', type=int),
+            request.args.get('offset', 0, type=int)
+        )
         return jsonify(response), 200
     except Exception as e:
         print("An error occurred:", str(e))
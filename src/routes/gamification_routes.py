@@ -1,7 +1,7 @@
 from flask import Blueprint, jsonify, request
 from flask_jwt_extended import jwt_required
 from src.services.gamification_services import get_user_rankings, get_single_user_rank, get_single_user_monthly_rank, \
-    get_monthly_user_rankings
+    get_monthly_user_rankings, get_user_rank_neighbourhood, DEFAULT_NEIGHBOURHOOD_RADIUS
 import json
 import traceback
 import sys
@@ -17,6 +17,17 @@ def get_user_rankings_route():
     ---
     tags:
       - Rankings
+    parameters:
+      - name: limit
+        in: query
+        type: integer
+        required: false
+        description: Page size, at most 100. Without it the whole ranking is returned
+      - name: offset
+        in: query
+        type: integer
+        required: false
+        description: Number of ranking entries to skip
     security:
       - BearerAuth: []
     responses:
@@ -50,7 +61,7 @@ def get_user_rankings_route():
         }
         print(json.dumps({"request": request_log}, indent=2))
 
-        response = get_user_rankings()
+        response = get_user_rankings(request.args.get('limit', type=int), request.args.get('offset', 0, type=int))
 
         print(json.dumps({"response": response[0], "status": response[1]}, indent=2))
         return response
@@ -166,6 +177,17 @@ def get_monthly_user_rankings_route():
     ---
     tags:
       - Rankings
+    parameters:
+      - name: limit
+        in: query
+        type: integer
+        required: false
+        description: Page size, at most 100. Without it the whole ranking is returned
+      - name: offset
+        in: query
+        type: integer
+        required: false
+        description: Number of ranking entries to skip
     security:
       - BearerAuth: []
     responses:
@@ -175,7 +197,8 @@ def get_monthly_user_rankings_route():
         description: An error occurred.
     """
     try:
-        return get_monthly_user_rankings()
+        return get_monthly_user_rankings(request.args.get('limit', type=int),
+                                         request.args.get('offset', 0, type=int))
     except Exception as e:
         print("An error occurred:", str(e))
         return jsonify({
@@ -218,3 +241,83 @@ def get_single_user_monthly_rank_route(user_id):
             "message": "An error occurred while fetching user's monthly rank",
             "error": str(e)
         }), 500
+
+
+@gamification_bp.route("/user/rank/<int:user_id>/neighbourhood", methods=["GET"])
+@jwt_required()
+def get_user_rank_neighbourhood_route(user_id):
+    """
+    Get the ranking entries just above and below a specific user.
+    ---
+    tags:
+      - Rankings
+    parameters:
+      - name: user_id
+        in: path
+        type: integer
+        required: true
+        description: The ID of the user to centre the rankings on
+      - name: radius
+        in: query
+        type: integer
+        required: false
+        description: Number of entries above and below the user, at most 25 (default 5)
+      - name: window
+        in: query
+        type: string
+        enum: [all, monthly]
+        required: false
+        description: Rank by all-time discounts or by those earned in the last 30 days (default all)
+    security:
+      - BearerAuth: []
+    responses:
+      200:
+        description: Rankings around the user fetched successfully.
+        content:
+          application/json:
+            schema:
+              type: object
+              properties:
+                user_id:
+                  type: integer
+                rank:
+                  type: integer
+                total_discount:
+                  type: number
+                  format: float
+                rankings:
+                  type: array
+                  items:
+                    type: object
+                    properties:
+                      rank:
+                        type: integer
+                      user_id:
+                        type: integer
+                      user_name:
+                        type: string
+                      total_discount:
+                        type: number
+                        format: float
+      400:
+        description: Invalid radius.
+      404:
+        description: User not found.
+      500:
+        description: An error occurred.
+    """
+    try:
+        response = get_user_rank_neighbourhood(
+            user_id,
+            request.args.get('radius', DEFAULT_NEIGHBOURHOOD_RADIUS, type=int),
+            monthly=request.args.get('window') == 'monthly'
+        )
+        return response
+    except Exception as e:
+        print("An error occurred:", str(e))
+        traceback.print_exc(file=sys.stderr)
+        return jsonify({
+            "success": False,
+            "message": "An error occurred while fetching the rankings around the user",
+            "error": str(e)
+        }), 500
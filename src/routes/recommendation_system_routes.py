@@ -2,7 +2,7 @@ from flask import Blueprint, jsonify, request
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from flasgger import swag_from
 from src.services.recommendation_system_service import RecommendationSystemService, \
-    RestaurantRecommendationSystemService
+    RestaurantRecommendationSystemService, MAX_BATCH_LISTING_IDS
 from src.models import Listing
 import json
 import traceback
@@ -355,4 +355,132 @@ def get_recommendations_for_user(user_id):
             "error": str(e)
         }
         print(json.dumps({"error_response": error_response, "status": 500}, indent=2))
-        return jsonify(error_response), 500
\ No newline at end of file
+        return jsonify(error_response), 500
+
+
+@recommendation_bp.route('/api/recommendations/batch', methods=['POST'])
+@jwt_required()
+@swag_from({
+    "tags": ["Recommendations"],
+    "summary": "Get recommendations with their restaurant and listing cards in one request",
+    "description": (
+            "Returns recommendations for many listings at once, or restaurant recommendations for a user, "
+            "together with the full restaurant and listing data needed to render them.\n\n"
+            "Send listing_ids for listing recommendations. Otherwise recommendations are made for user_id, "
+            "or for the authenticated user when user_id is omitted."
+    ),
+    "security": [{"BearerAuth": []}],
+    "requestBody": {
+        "required": False,
+        "content": {
+            "application/json": {
+                "schema": {
+                    "type": "object",
+                    "properties": {
+                        "listing_ids": {
+                            "type": "array",
+                            "items": {"type": "integer"},
+                            "maxItems": MAX_BATCH_LISTING_IDS,
+                            "example": [12, 34, 56]
+                        },
+                        "user_id": {"type": "integer", "example": 51},
+                        "limit": {"type": "integer", "example": 9,
+                                  "description": "Recommendations per listing"}
+                    }
+                }
+            }
+        }
+    },
+    "responses": {
+        "200": {
+            "description": "Recommendations and cards retrieved successfully",
+            "content": {
+                "application/json": {
+                    "schema": {
+                        "type": "object",
+                        "properties": {
+                            "success": {"type": "boolean", "example": True},
+                            "recommendations": {
+                                "type": "array",
+                                "description": "Listing mode: recommended listing IDs per requested listing",
+                                "items": {
+                                    "type": "object",
+                                    "properties": {
+                                        "listing_id": {"type": "integer", "example": 12},
+                                        "data": {"type": "array", "items": {"type": "integer"}, "example": [7, 9]}
+                                    }
+                                }
+                            },
+                            "data": {
+                                "type": "array",
+                                "description": "User mode: recommended restaurant IDs",
+                                "items": {"type": "integer"},
+                                "example": [42, 1, 234]
+                            },
+                            "listings": {"type": "array", "items": {"type": "object"}},
+                            "restaurants": {"type": "array", "items": {"type": "object"}},
+                            "generated_at": {"type": "string", "format": "date-time"}
+                        }
+                    }
+                }
+            }
+        },
+        "400": {
+            "description": "Invalid request body",
+            "content": {
+                "application/json": {
+                    "schema": {
+                        "type": "object",
+                        "properties": {
+                            "success": {"type": "boolean", "example": False},
+                            "message": {"type": "string", "example": "listing_ids must be a list of integers"}
+                        }
+                    }
+                }
+            }
+        },
+        "404": {
+            "description": "Recommendation model not available",
+            "content": {
+                "application/json": {
+                    "schema": {
+                        "type": "object",
+                        "properties": {
+                            "success": {"type": "boolean", "example": False},
+                            "message": {"type": "string", "example": "Could not initialize recommendation model"}
+                        }
+                    }
+                }
+            }
+        }
+    }
+})
+def get_batch_recommendations():
+    try:
+        data = request.get_json(silent=True) or {}
+
+        if "listing_ids" in data:
+            listing_ids = data["listing_ids"]
+            if not isinstance(listing_ids, list) or not all(
+                    isinstance(listing_id, int) and not isinstance(listing_id, bool) for listing_id in listing_ids):
+                return jsonify({"success": False, "message": "listing_ids must be a list of integers"}), 400
+            limit = data.get("limit")
+            if limit is not None and (not isinstance(limit, int) or limit <= 0):
+                return jsonify({"success": False, "message": "limit must be a positive integer"}), 400
+
+            response, status = RecommendationSystemService.get_batch_recommendations(
+                list(dict.fromkeys(listing_ids)), limit)
+        else:
+            user_id = data.get("user_id") or get_jwt_identity()
+            response, status = RestaurantRecommendationSystemService.get_batch_recommendations_by_user(user_id)
+
+        return jsonify(response), status
+    except Exception as e:
+        print("An error occurred:", str(e))
+        traceback.print_exc(file=sys.stderr)
+
+        return jsonify({
+            "success": False,
+            "message": "An error occurred while fetching recommendations",
+            "error": str(e)
+        }), 500
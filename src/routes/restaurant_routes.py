@@ -9,6 +9,7 @@ from flask_jwt_extended import jwt_required, get_jwt_identity
 from werkzeug.utils import secure_filename
 
 from src.services.restaurant_comment_service import add_comment_service
+from src.services.achievement_service import AchievementService
 from src.services.restaurant_service import (
     create_restaurant_service,
     get_restaurants_service,
@@ -16,7 +17,7 @@ from src.services.restaurant_service import (
     delete_restaurant_service,
     get_restaurants_in_proximity, update_restaurant_service,
 )
-from src.models import User, RestaurantComment, Achievement, AchievementType, UserAchievement
+from src.models import User, RestaurantComment, AchievementType
 from src.utils.cloud_storage import UPLOAD_FOLDER
 
 restaurant_bp = Blueprint("restaurant", __name__)
@@ -749,23 +750,15 @@ def get_restaurant_comments(restaurant_id):
         comments = RestaurantComment.query.filter_by(restaurant_id=restaurant_id).all()
         comments_data = []
 
-        # Get the Regular Commenter achievement
-        regular_commenter_achievement = Achievement.query.filter_by(
-            achievement_type=AchievementType.REGULAR_COMMENTER
-        ).first()
+        # Commenters holding the Regular Commenter achievement, from the achievement caches
+        regular_commenters = AchievementService.users_with_achievement_type(
+            [comment.user_id for comment in comments], AchievementType.REGULAR_COMMENTER
+        )
 
         for comment in comments:
             badges_data = [{"name": badge.badge_name, "is_positive": badge.is_positive} for badge in comment.badges]
 
-            # Check if the user has the Regular Commenter achievement
-            should_highlight = False
-            if regular_commenter_achievement:
-                user_has_achievement = UserAchievement.query.filter_by(
-                    user_id=comment.user_id,
-                    achievement_id=regular_commenter_achievement.id
-                ).first() is not None
-
-                should_highlight = user_has_achievement
+            should_highlight = comment.user_id in regular_commenters
 
             comment_data = {
                 "id": comment.id,
@@ -0,0 +1,284 @@
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, UTC
+from typing import Any, Callable, Dict, List, Optional
+
+from apscheduler.schedulers.background import BackgroundScheduler
+from sqlalchemy import or_, update
+from sqlalchemy.exc import IntegrityError
+
+from src.models import db, SchedulerLease, ScheduledJobRun
+
+logger = logging.getLogger(__name__)
+
+HEARTBEAT_JOB_ID = 'scheduler_leader_heartbeat'
+ONCE_JOBS_JOB_ID = 'scheduler_once_jobs'
+# How long a leader waits before retrying a once job that failed
+ONCE_JOB_RETRY_SECONDS = 15 * 60
+
+
+class LeaderScheduler:
+    """
+    BackgroundScheduler whose jobs run in one process only.
+
+    Every process (e.g. every gunicorn worker) starts the scheduler, but jobs
+    run only in the process holding the lease row named after the scheduler.
+    The holder renews the lease from a heartbeat every lease_seconds / 3;
+    when it dies, another process takes the lease over once it expires. A
+    leader whose heartbeat is late stops running jobs before its lease can
+    expire, so two processes never both think they lead.
+
+    Each run is recorded in scheduled_job_runs, so any process can report
+    the job registry and last-run statistics. Once jobs, e.g. back-fills of
+    a new rollup table, run on the leader until one run succeeds; that
+    recorded run is what keeps them from running again on any process.
+    """
+
+    def __init__(self, app, name: str = 'default', lease_seconds: float = 60):
+        self.app = app
+        self.name = name
+        self.lease_seconds = lease_seconds
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+        self.scheduler = BackgroundScheduler()
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._lease_valid_until = 0.0
+        self._once_pending: List[str] = []
+        self._once_attempted_at: Optional[float] = None
+
+    @property
+    def is_leader(self) -> bool:
+        # Checked against a local clock that stops short of the lease expiry
+        return time.monotonic() < self._lease_valid_until
+
+    def try_acquire(self) -> bool:
+        """Acquire or renew the lease. Returns whether this process is now the leader."""
+        started = time.monotonic()
+        now = datetime.now(UTC)
+        values = dict(owner=self.owner, heartbeat_at=now, expires_at=now + timedelta(seconds=self.lease_seconds))
+
+        try:
+            acquired = db.session.execute(
+                update(SchedulerLease)
+                .where(SchedulerLease.name == self.name,
+                       or_(SchedulerLease.owner == self.owner,
+                           SchedulerLease.owner.is_(None),
+                           SchedulerLease.expires_at < now))
+                .values(**values)
+                .execution_options(synchronize_session=False)
+            ).rowcount == 1
+
+            if not acquired and db.session.get(SchedulerLease, self.name) is None:
+                db.session.add(SchedulerLease(name=self.name, acquired_at=now, **values))
+                acquired = True
+            db.session.commit()
+
+        except IntegrityError:
+            # Another process created the lease row first
+            db.session.rollback()
+            acquired = False
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Error renewing scheduler lease {self.name}: {str(e)}")
+            acquired = False
+
+        was_leader = self.is_leader
+        # Renewal counts from before the round-trip, and leaves a third of the lease as margin
+        self._lease_valid_until = started + self.lease_seconds * 2 / 3 if acquired else 0.0
+
+        if acquired and not was_leader:
+            self._mark_acquired(now)
+            logger.info(f"{self.owner} is now the leader of scheduler {self.name}")
+        elif was_leader and not acquired:
+            logger.warning(f"{self.owner} lost the lease of scheduler {self.name}")
+        return acquired
+
+    def _mark_acquired(self, now: datetime) -> None:
+        try:
+            db.session.execute(
+                update(SchedulerLease)
+                .where(SchedulerLease.name == self.name, SchedulerLease.owner == self.owner)
+                .values(acquired_at=now)
+                .execution_options(synchronize_session=False)
+            )
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+
+    def release(self) -> None:
+        """Give the lease up, so another process can take over without waiting for it to expire."""
+        self._lease_valid_until = 0.0
+        with self.app.app_context():
+            try:
+                db.session.execute(
+                    update(SchedulerLease)
+                    .where(SchedulerLease.name == self.name, SchedulerLease.owner == self.owner)
+                    .values(owner=None, expires_at=None)
+                    .execution_options(synchronize_session=False)
+                )
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"Error releasing scheduler lease {self.name}: {str(e)}")
+
+    def _heartbeat(self) -> None:
+        with self.app.app_context():
+            if self.try_acquire() and self._once_jobs_due():
+                # Off the heartbeat thread, a long back-fill must not delay the lease renewal
+                self._once_attempted_at = time.monotonic()
+                self.scheduler.add_job(func=self.run_once_jobs, id=ONCE_JOBS_JOB_ID, name='Run pending once jobs',
+                                       replace_existing=True, max_instances=1)
+
+    def _once_jobs_due(self) -> bool:
+        with self._lock:
+            if not self._once_pending:
+                return False
+        return self._once_attempted_at is None \
+            or time.monotonic() - self._once_attempted_at >= ONCE_JOB_RETRY_SECONDS
+
+    def add_job(self, func: Callable[[], Any], id: str, name: str, trigger: str = 'interval', **trigger_args) -> None:
+        """
+        Register a job that runs, inside an app context, only on the leader.
+
+        Args:
+            func (Callable[[], Any]): The job; a dict it returns is stored as the run's result
+            id (str): Job id, also the key of its statistics
+            name (str): Human readable description
+            trigger (str): APScheduler trigger name, trigger_args are passed along
+        """
+        def run():
+            if self.is_leader:
+                self.run_job(id)
+
+        with self._lock:
+            self._jobs[id] = {"func": func, "name": name, "trigger": trigger, "trigger_args": trigger_args}
+        self.scheduler.add_job(func=run, trigger=trigger, id=id, name=name, replace_existing=True,
+                               max_instances=1, coalesce=True, **trigger_args)
+
+    def add_once_job(self, func: Callable[[], Any], id: str, name: str) -> None:
+        """
+        Register a job that runs, inside an app context, on the leader until it has succeeded once.
+
+        Args:
+            func (Callable[[], Any]): The job; a dict it returns is stored as the run's result
+            id (str): Job id, also the key of its statistics
+            name (str): Human readable description
+        """
+        with self._lock:
+            self._jobs[id] = {"func": func, "name": name, "trigger": 'once', "trigger_args": {}}
+            if id not in self._once_pending:
+                self._once_pending.append(id)
+
+    def run_once_jobs(self) -> List[str]:
+        """Run the once jobs no process has completed yet, while this process leads. Returns the ids run."""
+        with self._lock:
+            pending = list(self._once_pending)
+        if not pending:
+            return []
+
+        with self.app.app_context():
+            succeeded = {job_id for (job_id,) in db.session.query(ScheduledJobRun.job_id).filter(
+                ScheduledJobRun.job_id.in_(pending), ScheduledJobRun.last_status == 'succeeded')}
+
+        ran = []
+        for job_id in pending:
+            if job_id not in succeeded:
+                if not self.is_leader:
+                    break
+                self.run_job(job_id)
+                ran.append(job_id)
+                with self.app.app_context():
+                    run = db.session.get(ScheduledJobRun, job_id)
+                    if run is None or run.last_status != 'succeeded':
+                        continue
+            with self._lock:
+                self._once_pending.remove(job_id)
+        return ran
+
+    def run_job(self, job_id: str) -> Any:
+        """Run a registered job right away in this process and record its statistics."""
+        func = self._jobs[job_id]["func"]
+        started_at = datetime.now(UTC)
+        started = time.monotonic()
+        result, error = None, None
+
+        with self.app.app_context():
+            try:
+                result = func()
+            except Exception as e:
+                db.session.rollback()
+                error = str(e)
+                logger.error(f"Scheduled job {job_id} failed: {error}")
+
+            self._record_run(job_id, started_at, time.monotonic() - started, result, error)
+        return result
+
+    def _record_run(self, job_id: str, started_at: datetime, duration: float, result: Any, error: Optional[str]) -> None:
+        try:
+            run = db.session.get(ScheduledJobRun, job_id)
+            if run is None:
+                run = ScheduledJobRun(job_id=job_id, run_count=0, failure_count=0)
+                db.session.add(run)
+
+            run.run_count += 1
+            run.failure_count += 1 if error is not None else 0
+            run.last_owner = self.owner
+            run.last_started_at = started_at
+            run.last_finished_at = datetime.now(UTC)
+            run.last_duration_seconds = round(duration, 3)
+            run.last_status = 'failed' if error is not None else 'succeeded'
+            run.last_error = error
+            run.last_result = json.dumps(result, default=str) if isinstance(result, dict) else None
+            db.session.commit()
+
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Error recording run of scheduled job {job_id}: {str(e)}")
+
+    def start(self) -> None:
+        # The heartbeat runs in every process, the first one also holds the first election
+        self.scheduler.add_job(func=self._heartbeat, trigger='interval', seconds=self.lease_seconds / 3,
+                               id=HEARTBEAT_JOB_ID, name='Renew the scheduler leader lease',
+                               replace_existing=True, max_instances=1, coalesce=True,
+                               next_run_time=datetime.now(UTC))
+        self.scheduler.start()
+
+    def shutdown(self) -> None:
+        if self.scheduler.running:
+            self.scheduler.shutdown(wait=False)
+        if self.is_leader:
+            self.release()
+
+    def get_jobs(self) -> Dict[str, Any]:
+        """Job registry with each job's next run on this process and its last run on any process."""
+        runs = {run.job_id: run.to_dict() for run in ScheduledJobRun.query.all()}
+        lease = db.session.get(SchedulerLease, self.name)
+
+        jobs: List[Dict[str, Any]] = []
+        with self._lock:
+            registered = dict(self._jobs)
+        for job_id, job in registered.items():
+            scheduled = self.scheduler.get_job(job_id) if self.scheduler.running else None
+            next_run = getattr(scheduled, 'next_run_time', None)
+            jobs.append({
+                "id": job_id,
+                "name": job["name"],
+                "trigger": job["trigger"],
+                "trigger_args": job["trigger_args"],
+                "next_run_time": next_run.isoformat() if next_run else None,
+                "last_run": runs.get(job_id),
+            })
+
+        return {
+            "scheduler": self.name,
+            "process": self.owner,
+            "is_leader": self.is_leader,
+            "lease": lease.to_dict() if lease else None,
+            "jobs": jobs,
+        }
@@ -1,28 +1,111 @@
-from datetime import datetime, timedelta
-from pytz import UTC
-from apscheduler.schedulers.background import BackgroundScheduler
-from apscheduler.triggers.interval import IntervalTrigger
-from src.models.listing_model import Listing
-from src.models import db
-
-def update_all_listings():
-    try:
-        listings = Listing.query.filter(Listing.expires_at > datetime.now(UTC)).all()
-        for listing in listings:
-            listing.update_expiry()
-        db.session.commit()
-    except Exception as e:
-        db.session.rollback()
-        print(f"Error updating listings: {str(e)}")
-
-def init_listing_scheduler():
-    scheduler = BackgroundScheduler()
+import logging
+import time
+from datetime import datetime, timedelta, UTC
+from typing import Dict, List
+
+from sqlalchemy import delete, select, update
+
+from src.models import db, Listing, Purchase, PurchaseStatus, PurchaseReport, UserCart
+from src.services.analytics_service import count_rejected_purchases
+
+logger = logging.getLogger(__name__)
+
+# Listings deleted per statement and per transaction
+LISTING_UPDATE_CHUNK_SIZE = 1000
+
+
+def delete_expiring_listings(listing_ids: List[int]) -> int:
+    """
+    Take down listings in a few set-based statements: reject their active
+    purchases, detach purchases and reports, drop cart entries and delete
+    the listings. The caller commits.
+
+    Returns:
+        int: Number of purchases rejected
+    """
+    is_active = [Purchase.listing_id.in_(listing_ids), Purchase.status.in_(PurchaseStatus.active_statuses())]
+    # Locked until the commit, so the purchases counted are the ones rejected below
+    rejecting = db.session.execute(
+        select(Purchase.restaurant_id, Purchase.purchase_date).where(*is_active).with_for_update()
+    ).all()
+    rejected = db.session.execute(
+        update(Purchase).where(*is_active).values(status=PurchaseStatus.REJECTED)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    # The bulk update skips the mapper events that keep the analytics rollups
+    count_rejected_purchases(db.session.connection(), rejecting)
+    db.session.execute(
+        update(Purchase).where(Purchase.listing_id.in_(listing_ids)).values(listing_id=None)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.execute(
+        update(PurchaseReport).where(PurchaseReport.listing_id.in_(listing_ids)).values(listing_id=None)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.execute(
+        delete(UserCart).where(UserCart.listing_id.in_(listing_ids))
+        .execution_options(synchronize_session=False)
+    )
+    db.session.execute(
+        delete(Listing).where(Listing.id.in_(listing_ids))
+        .execution_options(synchronize_session=False)
+    )
+    return rejected
+
+
+def update_all_listings(chunk_size: int = LISTING_UPDATE_CHUNK_SIZE) -> Dict[str, float]:
+    """
+    Take down listings within six hours of expiry.
+
+    Freshness itself is no longer written here, Listing derives it at read
+    time. Expiring listings are selected by an expires_at range, chunk_size at
+    a time, and deleted in batched statements with one commit per chunk.
+
+    Returns:
+        Dict[str, float]: Run statistics (listings deleted, purchases rejected, duration)
+    """
+    started = time.monotonic()
+    current_time = datetime.now(UTC)
+    cutoff = current_time + timedelta(hours=Listing.MIN_HOURS_LEFT)
+    stats = {"deleted": 0, "purchases_rejected": 0}
+    last_id = 0
+
+    while True:
+        expiring_ids = []
+        try:
+            expiring_ids = [row.id for row in db.session.query(Listing.id).filter(
+                Listing.expires_at > current_time,
+                Listing.expires_at <= cutoff,
+                Listing.id > last_id
+            ).order_by(Listing.id).limit(chunk_size)]
+
+            if not expiring_ids:
+                break
+            last_id = expiring_ids[-1]
+
+            stats["purchases_rejected"] += delete_expiring_listings(expiring_ids)
+            db.session.commit()
+            stats["deleted"] += len(expiring_ids)
+
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Error taking down listings in the chunk ending at id {last_id}: {str(e)}")
+            if not expiring_ids:
+                break
+        finally:
+            db.session.expunge_all()
+
+    stats["duration_seconds"] = round(time.monotonic() - started, 3)
+    logger.info(f"Listing expiry run finished: {stats}")
+    return stats
+
+
+def init_listing_scheduler(scheduler):
+    """Register the listing expiry job on the app's LeaderScheduler."""
     scheduler.add_job(
         func=update_all_listings,
-        trigger=IntervalTrigger(hours=2),
+        trigger='interval',
+        hours=2,
         id='update_listings_job',
-        name='Update listings fresh score and consume within time',
-        replace_existing=True
+        name='Take down listings that are about to expire'
     )
-    scheduler.start()
-    return scheduler
\ No newline at end of file
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Record the environmental contributions and discount points missing for
+past purchases, e.g. after importing purchase history or when the
+purchase hooks failed. Safe to re-run: purchases already covered are skipped.
+
+Connects with the same DB_* environment variables as the app.
+
+Usage:
+    python -m src.scripts.backfill_rewards [--chunk-size 2000]
+"""
+import argparse
+import os
+
+from dotenv import load_dotenv
+from flask import Flask
+
+from src.models import db
+from src.models.schema_upgrades import upgrade_schema
+from src.services.reward_backfill_service import BACKFILL_CHUNK_SIZE, backfill_rewards
+
+
+def create_backfill_app():
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = (
+        f"mssql+pyodbc://{os.getenv('DB_USERNAME')}:{os.getenv('DB_PASSWORD')}@"
+        f"{os.getenv('DB_SERVER')}/{os.getenv('DB_NAME')}?driver={os.getenv('DB_DRIVER')}"
+    )
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    return app
+
+
+def print_progress(kind, processed, total, elapsed):
+    rate = processed / elapsed if elapsed else 0
+    print(f"{kind:>16} {processed:>9}/{total:<9} {elapsed:>8.1f}s {rate:>10.0f} purchases/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunk-size", type=int, default=BACKFILL_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    load_dotenv()
+    with create_backfill_app().app_context():
+        db.create_all()
+        upgrade_schema()
+        result = backfill_rewards(chunk_size=args.chunk_size, progress=print_progress)
+
+    for kind, stats in result.items():
+        print(f"{kind}: {stats['recorded']} recorded for {stats['missing']} purchases in {stats['seconds']}s "
+              f"({stats['per_second']} purchases/s)")
+
+
+if __name__ == '__main__':
+    main()
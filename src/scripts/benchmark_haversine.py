@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark of the scalar haversine loop against the vectorized kernel in
+src.utils.geo, including the maxDeliveryDistance mask.
+
+Usage:
+    python -m src.scripts.benchmark_haversine [--sizes 10000 100000 1000000]
+"""
+import argparse
+import random
+import time
+
+import numpy as np
+
+from src.utils.geo import haversine, distances_within
+
+ORIGIN_LAT, ORIGIN_LON = 41.015137, 28.979530
+RADIUS_KM = 10
+
+
+def scalar_loop(lats, lons, max_distances):
+    in_range = []
+    for lat, lon, max_distance in zip(lats, lons, max_distances):
+        dist = haversine(ORIGIN_LAT, ORIGIN_LON, lat, lon)
+        if dist <= RADIUS_KM and (max_distance is None or dist <= max_distance):
+            in_range.append(True)
+        else:
+            in_range.append(False)
+    return in_range
+
+
+def vectorized(lats, lons, max_distances):
+    _, mask = distances_within(ORIGIN_LAT, ORIGIN_LON, lats, lons, RADIUS_KM, max_distances)
+    return mask.tolist()
+
+
+def best_of(func, repeat, *args):
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    rng = random.Random(2024)
+    print(f"{'points':>10} {'scalar (Mpts/s)':>16} {'numpy (Mpts/s)':>15} {'speedup':>9}")
+    for size in args.sizes:
+        lats = [ORIGIN_LAT + rng.uniform(-0.5, 0.5) for _ in range(size)]
+        lons = [ORIGIN_LON + rng.uniform(-0.5, 0.5) for _ in range(size)]
+        max_distances = [rng.choice([None, 5.0, 10.0, 20.0]) for _ in range(size)]
+
+        scalar_time, scalar_result = best_of(scalar_loop, args.repeat, lats, lons, max_distances)
+        numpy_time, numpy_result = best_of(vectorized, args.repeat, lats, lons, max_distances)
+
+        mismatches = int(np.sum(np.array(scalar_result) != np.array(numpy_result)))
+        if mismatches:
+            raise SystemExit(f"{mismatches} mask mismatches at {size} points")
+
+        print(f"{size:>10} {size / scalar_time / 1e6:>16.2f} {size / numpy_time / 1e6:>15.2f} "
+              f"{scalar_time / numpy_time:>8.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Memory and latency benchmark of the sparse recommendation model against the
+previous dense pivot_table + NearestNeighbors pipeline, on synthetic purchases.
+The top-k rows time lookups served from the precomputed TopKSimilarityTable;
+their build column includes computing the table.
+
+The dense pipeline is skipped once its items x users matrix would exceed
+--dense-limit-mb, which it does long before 100k users.
+
+Usage:
+    python -m src.scripts.benchmark_recommendations [--users 10000 100000] [--items 5000]
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+from sklearn.neighbors import NearestNeighbors
+
+from src.services.recommendation_model_registry import ItemSimilarityModel, TopKSimilarityTable
+
+
+def synthetic_entries(rng, users, items, purchases_per_user):
+    # Popularity follows a power law, as real listing sales do
+    popularity = 1 / np.arange(1, items + 1) ** 0.8
+    popularity /= popularity.sum()
+    user_ids = np.repeat(np.arange(users), purchases_per_user)
+    item_ids = rng.choice(items, size=len(user_ids), p=popularity)
+    quantities = rng.integers(1, 4, size=len(user_ids))
+    return list(zip(item_ids.tolist(), user_ids.tolist(), quantities.astype(float).tolist()))
+
+
+def dense_pipeline(entries, query_items, k):
+    df = pd.DataFrame(entries, columns=['listing_id', 'user_id', 'quantity'])
+    matrix = pd.pivot_table(df, index='listing_id', columns='user_id', values='quantity',
+                            aggfunc='sum', fill_value=0)
+    listing_ids = matrix.index.tolist()
+    model = NearestNeighbors(n_neighbors=k, metric='cosine', algorithm='brute').fit(matrix.values)
+    started = time.perf_counter()
+    for item in query_items:
+        model.kneighbors([matrix.values[listing_ids.index(item)]], n_neighbors=k)
+    return matrix.values.nbytes, (time.perf_counter() - started) / len(query_items)
+
+
+def sparse_pipeline(entries, query_items, k):
+    model = ItemSimilarityModel.from_entries(entries)
+    started = time.perf_counter()
+    for item in query_items:
+        model.neighbors(item, k)
+    return model.nbytes, (time.perf_counter() - started) / len(query_items)
+
+
+def table_pipeline(entries, query_items, k):
+    model = ItemSimilarityModel.from_entries(entries)
+    table = TopKSimilarityTable(model, top_k=k)
+    started = time.perf_counter()
+    for item in query_items:
+        table.neighbors(item, k)
+    return table.neighbor_rows.nbytes + table.scores.nbytes, (time.perf_counter() - started) / len(query_items)
+
+
+def timed(func, *args):
+    started = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - started, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--items", type=int, default=5000)
+    parser.add_argument("--purchases-per-user", type=int, default=5)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--dense-limit-mb", type=float, default=2048)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(2024)
+    print(f"{'users':>8} {'pairs':>9} {'pipeline':>8} {'build (s)':>10} {'memory (MB)':>12} {'lookup (ms)':>12}")
+    for users in args.users:
+        entries = synthetic_entries(rng, users, args.items, args.purchases_per_user)
+        present = sorted({item for item, _, _ in entries})
+        query_items = rng.choice(present, size=min(args.queries, len(present)), replace=False).tolist()
+
+        for name, pipeline in (('sparse', sparse_pipeline), ('top-k', table_pipeline)):
+            build, (memory, lookup) = timed(pipeline, entries, query_items, args.k)
+            print(f"{users:>8} {len(entries):>9} {name:>8} {build:>10.2f} {memory / 2**20:>12.1f} "
+                  f"{lookup * 1000:>12.3f}")
+
+        dense_mb = len(present) * users * 8 / 2**20
+        if dense_mb > args.dense_limit_mb:
+            print(f"{users:>8} {len(entries):>9} {'dense':>8} {'skipped':>10} {dense_mb:>12.1f} {'-':>12}")
+            continue
+        build, (memory, lookup) = timed(dense_pipeline, entries, query_items, args.k)
+        print(f"{users:>8} {len(entries):>9} {'dense':>8} {build:>10.2f} {memory / 2**20:>12.1f} "
+              f"{lookup * 1000:>12.2f}")
+
+
+if __name__ == '__main__':
+    main()
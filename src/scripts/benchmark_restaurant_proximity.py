@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Compare the bounding-box restaurant proximity search with the old
+full-table haversine scan on an in-memory SQLite database.
+
+Usage:
+    python -m src.scripts.benchmark_restaurant_proximity [--sizes 1000 10000 100000]
+"""
+import argparse
+import random
+import time
+
+from flask import Flask
+
+from src.models import db, Restaurant, User
+from src.services.restaurant_service import get_restaurants_in_proximity, restaurant_to_dict
+from src.utils.geo import haversine
+
+CENTER_LAT, CENTER_LON = 41.015137, 28.979530
+# Restaurants are spread over roughly a 300km x 300km area around the centre
+SPREAD_DEG = 1.5
+
+
+def full_scan_proximity(user_lat, user_lon, radius=10):
+    """The implementation used before the bounding box prefilter was introduced."""
+    restaurants = Restaurant.query.all()
+    nearby = []
+    for restaurant in restaurants:
+        dist = haversine(user_lat, user_lon, float(restaurant.latitude), float(restaurant.longitude))
+        if dist <= radius and (restaurant.maxDeliveryDistance is None or dist <= restaurant.maxDeliveryDistance):
+            restaurant_dict = restaurant_to_dict(restaurant)
+            restaurant_dict["distance_km"] = round(dist, 2)
+            nearby.append(restaurant_dict)
+
+    if not nearby:
+        return {"message": "No restaurants found within the specified radius"}, 404
+
+    nearby.sort(key=lambda x: x['distance_km'])
+    return {"restaurants": nearby}, 200
+
+
+def seed(size, rng):
+    db.drop_all()
+    db.create_all()
+    owner = User(name="Owner", email="owner@bench.local", phone_number="+900000000000",
+                 password="x", role="owner")
+    db.session.add(owner)
+    db.session.commit()
+
+    db.session.bulk_insert_mappings(Restaurant, [
+        {
+            "owner_id": owner.id,
+            "restaurantName": f"Restaurant {i}",
+            "category": "Bench",
+            "latitude": round(CENTER_LAT + rng.uniform(-SPREAD_DEG, SPREAD_DEG), 6),
+            "longitude": round(CENTER_LON + rng.uniform(-SPREAD_DEG, SPREAD_DEG), 6),
+            "maxDeliveryDistance": rng.choice([None, 5.0, 10.0, 20.0]),
+            "listings": 0,
+            "ratingCount": 0,
+            "pickup": True,
+            "delivery": True,
+            "flash_deals_available": False,
+            "flash_deals_count": 0,
+        }
+        for i in range(size)
+    ])
+    db.session.commit()
+
+
+def time_queries(func, queries):
+    start = time.perf_counter()
+    results = []
+    for lat, lon, radius in queries:
+        results.append(func(lat, lon, radius))
+        db.session.expunge_all()
+    return (time.perf_counter() - start) / len(queries), results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--radius", type=float, default=10)
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+
+    rng = random.Random(2024)
+    print(f"{'restaurants':>12} {'full scan (ms)':>16} {'bbox (ms)':>12} {'speedup':>9}")
+    with app.app_context():
+        for size in args.sizes:
+            seed(size, rng)
+            queries = [
+                (CENTER_LAT + rng.uniform(-1, 1), CENTER_LON + rng.uniform(-1, 1), args.radius)
+                for _ in range(args.queries)
+            ]
+
+            scan_time, scan_results = time_queries(full_scan_proximity, queries)
+            bbox_time, bbox_results = time_queries(get_restaurants_in_proximity, queries)
+
+            if scan_results != bbox_results:
+                raise SystemExit(f"Result mismatch between full scan and bounding box at {size} restaurants")
+
+            print(f"{size:>12} {scan_time * 1000:>16.2f} {bbox_time * 1000:>12.2f} "
+                  f"{scan_time / bbox_time:>8.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,201 @@
+import threading
+import time
 from datetime import datetime, timedelta, UTC
-from src.models import db, UserAchievement, Achievement, AchievementType, Purchase, PurchaseStatus, RestaurantComment
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+from flask import current_app, has_app_context
+from sqlalchemy import delete, event, func, insert, inspect, literal, select, union_all
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, object_session
+
+from src.models import db, UserAchievement, Achievement, AchievementType, Purchase, PurchaseStatus, \
+    RestaurantComment, UserActivityTotal, UserActivityDaily
+from src.utils.lru_cache import LRUCache
+from src.utils.rollups import increment_rollup
+from src.utils.sql_time import day_of
+
+WEEKLY_WINDOW_DAYS = 7
+COMMENT_WINDOW_DAYS = 90
+# Other workers' changes to achievements show up after at most this long
+CATALOGUE_TTL_SECONDS = 300
+EARNED_CACHE_SIZE = 10000
+EARNED_CACHE_TTL_SECONDS = 60
+ACHIEVEMENT_CACHE_KEY = 'achievement_cache'
+_CACHE_CHANGES_KEY = 'achievement_cache_changes'
+
+
+class AchievementRule(NamedTuple):
+    """An achievement as held in the in-process catalogue."""
+    id: int
+    name: str
+    description: str
+    badge_image_url: Optional[str]
+    achievement_type: AchievementType
+    threshold: Optional[int]
+    is_active: bool
+
+
+# The activity counter each achievement type is awarded on; other types are not awarded automatically
+RULE_COUNTERS = {
+    AchievementType.FIRST_PURCHASE: 'completed_purchases',
+    AchievementType.PURCHASE_COUNT: 'completed_purchases',
+    AchievementType.WEEKLY_PURCHASE: 'weekly_purchases',
+    AchievementType.REGULAR_COMMENTER: 'recent_comments',
+}
+
+
+def _activity_day(value):
+    """Day of a purchase date or comment timestamp, today when it is still unset."""
+    if not isinstance(value, datetime):
+        value = datetime.now(UTC)
+    return value.date()
+
+
+def _count_purchase(connection, purchase, status, sign):
+    """Count a purchase with the given status into (sign 1) or out of (sign -1) the user's activity counters."""
+    if purchase.user_id is None or status != PurchaseStatus.COMPLETED:
+        return
+
+    increment_rollup(connection, UserActivityTotal.__table__, dict(user_id=purchase.user_id),
+                     dict(completed_purchases=sign))
+    increment_rollup(connection, UserActivityDaily.__table__,
+                     dict(user_id=purchase.user_id, day=_activity_day(purchase.purchase_date)),
+                     dict(completed_purchases=sign))
+
+
+def _count_comment(connection, comment, sign):
+    # timestamp may still be the func.now() default here, which has no value until reloaded
+    timestamp = inspect(comment).dict.get('timestamp')
+    increment_rollup(connection, UserActivityDaily.__table__,
+                     dict(user_id=comment.user_id, day=_activity_day(timestamp)),
+                     dict(comments=sign))
+
+
+# Counters change in the same transaction as the purchase or comment they count
+@event.listens_for(Purchase, 'after_insert')
+def _count_inserted_purchase(mapper, connection, target):
+    _count_purchase(connection, target, target.status, 1)
+
+
+@event.listens_for(Purchase, 'after_update')
+def _count_updated_purchase(mapper, connection, target):
+    history = inspect(target).attrs.status.history
+    if not history.has_changes():
+        return
+
+    for previous in history.deleted or ():
+        _count_purchase(connection, target, previous, -1)
+    _count_purchase(connection, target, target.status, 1)
+
+
+@event.listens_for(Purchase, 'after_delete')
+def _count_deleted_purchase(mapper, connection, target):
+    _count_purchase(connection, target, target.status, -1)
+
+
+@event.listens_for(RestaurantComment, 'after_insert')
+def _count_inserted_comment(mapper, connection, target):
+    _count_comment(connection, target, 1)
+
+
+@event.listens_for(RestaurantComment, 'after_delete')
+def _count_deleted_comment(mapper, connection, target):
+    _count_comment(connection, target, -1)
+
+
+class AchievementCache:
+    """
+    In-process cache of the achievements table and, for recently seen users,
+    of the achievements they earned (achievement id -> earned_at).
+
+    The catalogue is versioned: a committed write to achievements bumps the
+    version and drops it, and a load that raced with a write is not kept.
+    It is also reloaded every CATALOGUE_TTL_SECONDS, and earned sets expire
+    after EARNED_CACHE_TTL_SECONDS, so writes made by other workers show up.
+    """
+
+    def __init__(self, clock=time.monotonic):
+        self.version = 0
+        self._clock = clock
+        self._catalogue: Optional[Dict[int, AchievementRule]] = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+        self.earned = LRUCache(EARNED_CACHE_SIZE, EARNED_CACHE_TTL_SECONDS, clock)
+
+    def catalogue(self) -> Dict[int, AchievementRule]:
+        """Every achievement by id, active or not. Needs an app context."""
+        with self._lock:
+            if self._catalogue is not None and self._clock() - self._loaded_at < CATALOGUE_TTL_SECONDS:
+                return self._catalogue
+            version = self.version
+
+        catalogue = {
+            achievement.id: AchievementRule(achievement.id, achievement.name, achievement.description,
+                                            achievement.badge_image_url, achievement.achievement_type,
+                                            achievement.threshold, achievement.is_active)
+            for achievement in Achievement.query.order_by(Achievement.id)
+        }
+        with self._lock:
+            if self.version == version:
+                self._catalogue, self._loaded_at = catalogue, self._clock()
+        return catalogue
+
+    def invalidate_catalogue(self) -> None:
+        with self._lock:
+            self.version += 1
+            self._catalogue = None
+
+
+def get_achievement_cache() -> AchievementCache:
+    """Return the achievement cache of the current app, creating it on first use."""
+    cache = current_app.extensions.get(ACHIEVEMENT_CACHE_KEY)
+    if cache is None:
+        cache = current_app.extensions.setdefault(ACHIEVEMENT_CACHE_KEY, AchievementCache())
+    return cache
+
+
+def _cache_changes(target):
+    session = object_session(target)
+    if session is None:
+        return None
+    return session.info.setdefault(_CACHE_CHANGES_KEY, {"catalogue": False, "users": set()})
+
+
+# Cached entries are dropped once the write that changes them commits
+@event.listens_for(Achievement, 'after_insert')
+@event.listens_for(Achievement, 'after_update')
+@event.listens_for(Achievement, 'after_delete')
+def _catalogue_changed(mapper, connection, target):
+    changes = _cache_changes(target)
+    if changes is not None:
+        changes["catalogue"] = True
+
+
+@event.listens_for(UserAchievement, 'after_insert')
+@event.listens_for(UserAchievement, 'after_update')
+@event.listens_for(UserAchievement, 'after_delete')
+def _earned_changed(mapper, connection, target):
+    changes = _cache_changes(target)
+    if changes is not None:
+        changes["users"].add(target.user_id)
+
+
+@event.listens_for(Session, 'after_commit')
+def _drop_changed_cache_entries(session):
+    changes = session.info.pop(_CACHE_CHANGES_KEY, None)
+    if not changes or not has_app_context():
+        return
+
+    cache = get_achievement_cache()
+    if changes["catalogue"]:
+        cache.invalidate_catalogue()
+    for user_id in changes["users"]:
+        cache.earned.pop(user_id)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_cache_changes(session):
+    session.info.pop(_CACHE_CHANGES_KEY, None)
 
 
 class AchievementService:
@@ -69,209 +265,200 @@ class AchievementService:
         db.session.commit()
 
     @staticmethod
-    def check_and_award_achievements(user_id):
-        """
-        Check if the user qualifies for any achievements and award them
-        """
-        newly_earned = []
-
-        # Check first purchase achievement
-        newly_earned.extend(AchievementService._check_first_purchase(user_id))
-
-        # Check purchase count achievements (5, 25, 50, 100)
-        newly_earned.extend(AchievementService._check_purchase_count_achievements(user_id))
-
-        # Check weekly purchase achievement (5 purchases in a week)
-        newly_earned.extend(AchievementService._check_weekly_purchase_achievement(user_id))
-
-        # Check comment achievement (100 comments in 90 days)
-        newly_earned.extend(AchievementService._check_comment_achievement(user_id))
-
-        return newly_earned
+    def get_catalogue() -> List[AchievementRule]:
+        """The active achievements, from the in-process cache. Needs an app context."""
+        return [rule for rule in get_achievement_cache().catalogue().values() if rule.is_active]
 
     @staticmethod
-    def _check_first_purchase(user_id):
-        """Check and award first purchase achievement"""
-        newly_earned = []
-
-        # Get the first purchase achievement
-        first_purchase_achievement = Achievement.query.filter_by(
-            achievement_type=AchievementType.FIRST_PURCHASE
-        ).first()
-
-        if not first_purchase_achievement:
-            return newly_earned
-
-        # Check if user already has this achievement
-        existing = UserAchievement.query.filter_by(
-            user_id=user_id,
-            achievement_id=first_purchase_achievement.id
-        ).first()
-
-        if existing:
-            return newly_earned
-
-        # Check if user has any completed purchases
-        purchase_count = Purchase.query.filter(
-            Purchase.user_id == user_id,
-            Purchase.status == PurchaseStatus.COMPLETED
-        ).count()
-
-        if purchase_count >= 1:
-            # Award the achievement
-            user_achievement = UserAchievement(
-                user_id=user_id,
-                achievement_id=first_purchase_achievement.id
-            )
-            db.session.add(user_achievement)
-            db.session.commit()
-            newly_earned.append(first_purchase_achievement)
+    def get_earned_achievements(user_ids: Iterable[int]) -> Dict[int, Dict[int, datetime]]:
+        """
+        Achievement id -> earned_at for each user, from the in-process cache.
 
-        return newly_earned
+        Users not cached are loaded together in one query. The returned dicts
+        are shared with the cache and must not be changed.
+        """
+        cache = get_achievement_cache()
+        earned = {}
+        missing = []
+        for user_id in dict.fromkeys(user_ids):
+            cached = cache.earned.get(user_id)
+            if cached is None:
+                missing.append(user_id)
+            else:
+                earned[user_id] = cached
+
+        if missing:
+            loaded = {user_id: {} for user_id in missing}
+            rows = db.session.execute(select(
+                UserAchievement.user_id, UserAchievement.achievement_id, UserAchievement.earned_at
+            ).where(UserAchievement.user_id.in_(missing)))
+            for user_id, achievement_id, earned_at in rows:
+                loaded[user_id][achievement_id] = earned_at
+            for user_id, achievements in loaded.items():
+                cache.earned.set(user_id, achievements)
+            earned.update(loaded)
+
+        return earned
 
     @staticmethod
-    def _check_purchase_count_achievements(user_id):
-        """Check and award purchase count achievements (5, 25, 50, 100)"""
-        newly_earned = []
-
-        # Get all purchase count achievements
-        purchase_count_achievements = Achievement.query.filter_by(
-            achievement_type=AchievementType.PURCHASE_COUNT
-        ).order_by(Achievement.threshold).all()
-
-        if not purchase_count_achievements:
-            return newly_earned
-
-        # Get user's completed purchase count
-        purchase_count = Purchase.query.filter(
-            Purchase.user_id == user_id,
-            Purchase.status == PurchaseStatus.COMPLETED
-        ).count()
-
-        # Check each achievement threshold
-        for achievement in purchase_count_achievements:
-            if purchase_count >= achievement.threshold:
-                # Check if user already has this achievement
-                existing = UserAchievement.query.filter_by(
-                    user_id=user_id,
-                    achievement_id=achievement.id
-                ).first()
-
-                if not existing:
-                    # Award the achievement
-                    user_achievement = UserAchievement(
-                        user_id=user_id,
-                        achievement_id=achievement.id
-                    )
-                    db.session.add(user_achievement)
-                    db.session.commit()
-                    newly_earned.append(achievement)
-
-        return newly_earned
+    def users_with_achievement_type(user_ids: Iterable[int], achievement_type) -> set:
+        """The given users who earned an achievement of the given type, served from the caches."""
+        type_ids = {rule.id for rule in get_achievement_cache().catalogue().values()
+                    if rule.achievement_type == achievement_type}
+        if not type_ids:
+            return set()
+        return {user_id for user_id, achievements in AchievementService.get_earned_achievements(user_ids).items()
+                if not type_ids.isdisjoint(achievements)}
 
     @staticmethod
-    def _check_weekly_purchase_achievement(user_id):
-
-        newly_earned = []
-
-
-        weekly_achievement = Achievement.query.filter_by(
-            achievement_type=AchievementType.WEEKLY_PURCHASE
-        ).first()
-
-        if not weekly_achievement:
-            return newly_earned
-
-
-        existing = UserAchievement.query.filter_by(
-            user_id=user_id,
-            achievement_id=weekly_achievement.id
-        ).first()
-
-
-        if not existing:
-            one_week_ago = datetime.now(UTC) - timedelta(days=7)
-
+    def get_activity_counters(user_id):
+        """
+        The counters the rules are evaluated against, read in one statement:
+        lifetime completed purchases, completed purchases over the last
+        WEEKLY_WINDOW_DAYS days and comments over the last COMMENT_WINDOW_DAYS
+        days, today included.
+        """
+        today = datetime.now(UTC).date()
+        daily = UserActivityDaily
+
+        def window_sum(column, days):
+            return select(func.coalesce(func.sum(column), 0)).where(
+                daily.user_id == user_id,
+                daily.day >= today - timedelta(days=days - 1)
+            ).scalar_subquery()
+
+        row = db.session.execute(select(
+            select(UserActivityTotal.completed_purchases)
+            .where(UserActivityTotal.user_id == user_id).scalar_subquery(),
+            window_sum(daily.completed_purchases, WEEKLY_WINDOW_DAYS),
+            window_sum(daily.comments, COMMENT_WINDOW_DAYS)
+        )).one()
+
+        return {
+            "completed_purchases": int(row[0] or 0),
+            "weekly_purchases": int(row[1] or 0),
+            "recent_comments": int(row[2] or 0),
+        }
 
-            weekly_purchase_count = Purchase.query.filter(
-                Purchase.user_id == user_id,
-                Purchase.status == PurchaseStatus.COMPLETED,
-                Purchase.purchase_date >= one_week_ago
-            ).count()
+    @staticmethod
+    def check_and_award_achievements(user_id):
+        """
+        Check if the user qualifies for any achievements and award them
 
-            if weekly_purchase_count >= weekly_achievement.threshold:
+        Every rule of the cached catalogue is evaluated against the user's
+        activity counters in one pass; the badges reached and not yet earned,
+        per the cached earned set, are awarded in one transaction. That is
+        one query when nothing new is reached and two when something is
+        awarded, plus one when the user's earned set is not cached.
 
-                user_achievement = UserAchievement(
-                    user_id=user_id,
-                    achievement_id=weekly_achievement.id
-                )
-                db.session.add(user_achievement)
+        Returns:
+            list: The AchievementRule of every newly earned achievement
+        """
+        counters = AchievementService.get_activity_counters(user_id)
+        reached = [rule for rule in AchievementService.get_catalogue()
+                   if rule.achievement_type in RULE_COUNTERS
+                   and counters[RULE_COUNTERS[rule.achievement_type]] >= (rule.threshold or 1)]
+        if not reached:
+            return []
+
+        cache = get_achievement_cache()
+        for attempt in range(2):
+            earned = AchievementService.get_earned_achievements([user_id])[user_id]
+            newly_earned = [rule for rule in reached if rule.id not in earned]
+            if not newly_earned:
+                return []
+
+            try:
+                # One executemany rather than an ORM insert per badge; it skips the mapper events,
+                # so the earned set is dropped here
+                db.session.execute(insert(UserAchievement),
+                                   [dict(user_id=user_id, achievement_id=rule.id) for rule in newly_earned])
                 db.session.commit()
-                newly_earned.append(weekly_achievement)
+                return newly_earned
+            except IntegrityError:
+                # Another worker awarded some of them and the cached set missed it; retry on a fresh one
+                db.session.rollback()
+            finally:
+                cache.earned.pop(user_id)
 
-        return newly_earned
+        return []
 
     @staticmethod
-    def _check_comment_achievement(user_id):
-
-        newly_earned = []
-
-        comment_achievement = Achievement.query.filter_by(
-            achievement_type=AchievementType.REGULAR_COMMENTER
-        ).first()
-
-        if not comment_achievement:
-            return newly_earned
-
-        existing = UserAchievement.query.filter_by(
-            user_id=user_id,
-            achievement_id=comment_achievement.id
-        ).first()
-
-        if not existing:
-            ninety_days_ago = datetime.now(UTC) - timedelta(days=90)
-
-            comment_count = db.session.query(RestaurantComment).filter(
-                RestaurantComment.user_id == user_id,
-                RestaurantComment.timestamp >= ninety_days_ago
-            ).count()
+    def rebuild_activity_counters():
+        """
+        Recompute the lifetime purchase counters and the daily buckets of the
+        rolling windows from purchases and comments. Buckets older than the
+        longest window are not rebuilt, which prunes them.
 
-            if comment_count >= comment_achievement.threshold:
-                user_achievement = UserAchievement(
-                    user_id=user_id,
-                    achievement_id=comment_achievement.id
-                )
-                db.session.add(user_achievement)
-                db.session.commit()
-                newly_earned.append(comment_achievement)
+        Scheduled to back-fill the counters and to repair any drift.
+        """
+        window_start = datetime.combine(datetime.now(UTC).date() - timedelta(days=COMMENT_WINDOW_DAYS - 1),
+                                        datetime.min.time())
+        completed = (Purchase.status == PurchaseStatus.COMPLETED, Purchase.user_id.isnot(None))
+        purchase_day = day_of(Purchase.purchase_date)
+        comment_day = day_of(RestaurantComment.timestamp)
+        activity = union_all(
+            select(Purchase.user_id.label('user_id'), purchase_day.label('day'),
+                   func.count().label('completed_purchases'), literal(0).label('comments'))
+            .where(*completed, Purchase.purchase_date >= window_start)
+            .group_by(Purchase.user_id, purchase_day),
+            select(RestaurantComment.user_id, comment_day, literal(0), func.count())
+            .where(RestaurantComment.timestamp >= window_start)
+            .group_by(RestaurantComment.user_id, comment_day)
+        ).subquery()
+
+        try:
+            db.session.execute(delete(UserActivityTotal))
+            db.session.execute(delete(UserActivityDaily))
+            written = db.session.execute(insert(UserActivityTotal).from_select(
+                ['user_id', 'completed_purchases'],
+                select(Purchase.user_id, func.count()).where(*completed).group_by(Purchase.user_id)
+            )).rowcount
+            db.session.execute(insert(UserActivityDaily).from_select(
+                ['user_id', 'day', 'completed_purchases', 'comments'],
+                select(activity.c.user_id, activity.c.day,
+                       func.sum(activity.c.completed_purchases), func.sum(activity.c.comments))
+                .group_by(activity.c.user_id, activity.c.day)
+            ))
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
 
-        return newly_earned
+        return {"users": written}
 
     @staticmethod
     def get_user_achievements(user_id):
-        """Get all achievements earned by a user"""
-        user_achievements = UserAchievement.query.filter_by(user_id=user_id).all()
+        """Get all achievements earned by a user, served from the caches"""
+        earned = AchievementService.get_earned_achievements([user_id])[user_id]
+        cache = get_achievement_cache()
+        catalogue = cache.catalogue()
+        if not earned.keys() <= catalogue.keys():
+            # Awarded an achievement another worker has just created
+            cache.invalidate_catalogue()
+            catalogue = cache.catalogue()
 
         achievements = []
-        for ua in user_achievements:
+        for achievement_id, earned_at in sorted(earned.items(), key=lambda item: (item[1], item[0])):
+            achievement = catalogue.get(achievement_id)
+            if achievement is None:
+                continue
             achievements.append({
-                "id": ua.achievement.id,
-                "name": ua.achievement.name,
-                "description": ua.achievement.description,
-                "badge_image_url": ua.achievement.badge_image_url,
-                "earned_at": ua.earned_at.isoformat(),
-                "achievement_type": ua.achievement.achievement_type.value
+                "id": achievement.id,
+                "name": achievement.name,
+                "description": achievement.description,
+                "badge_image_url": achievement.badge_image_url,
+                "earned_at": earned_at.isoformat(),
+                "achievement_type": achievement.achievement_type.value
             })
 
         return achievements
 
     @staticmethod
     def get_available_achievements():
-        """Get all available achievements"""
-        achievements = Achievement.query.filter_by(is_active=True).all()
-
+        """Get all available achievements, served from the catalogue cache"""
         result = []
-        for achievement in achievements:
+        for achievement in AchievementService.get_catalogue():
             result.append({
                 "id": achievement.id,
                 "name": achievement.name,
@@ -281,4 +468,4 @@ class AchievementService:
                 "threshold": achievement.threshold
             })
 
-        return result
\ No newline at end of file
+        return result
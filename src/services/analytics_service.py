@@ -1,13 +1,422 @@
-from datetime import datetime
-from src.models import Restaurant, Purchase, PurchaseStatus, RestaurantComment
+from datetime import date, datetime, timedelta
 from decimal import Decimal
 
+import numpy as np
+from sqlalchemy import case, delete, event, func, insert, inspect, select
+from sqlalchemy.orm import joinedload, selectinload
+
+from src.models import db, Restaurant, Purchase, PurchaseStatus, RestaurantComment, RestaurantDailyStats, \
+    RestaurantDailyDistrictStats
+from src.utils.rollups import increment_rollup, increment_rollups
+from src.utils.sql_time import day_of
+
+PERIOD_MONTH = 'month'
+PERIOD_WEEK = 'week'
+PERIOD_CUSTOM = 'custom'
+RECENT_COMMENTS_LIMIT = 5
+# Purchase statuses the daily rollups count
+ROLLUP_STATUSES = (PurchaseStatus.COMPLETED, PurchaseStatus.REJECTED)
+GRANULARITIES = ('hour', 'day', 'week', 'month')
+MAX_TIMESERIES_BUCKETS = 1000
+
+
+def _apply_purchase_to_rollups(connection, purchase, status, sign):
+    """Count a purchase with the given status into (sign 1) or out of (sign -1) the rollups."""
+    if purchase.restaurant_id is None or status not in ROLLUP_STATUSES:
+        return
+
+    keys = dict(restaurant_id=purchase.restaurant_id, day=(purchase.purchase_date or datetime.utcnow()).date())
+    if status == PurchaseStatus.REJECTED:
+        increment_rollup(connection, RestaurantDailyStats.__table__, keys, dict(rejected_purchases=sign))
+        return
+
+    increment_rollup(connection, RestaurantDailyStats.__table__, keys,
+                      dict(completed_purchases=sign,
+                           units_sold=sign * (purchase.quantity or 0),
+                           revenue=sign * Decimal(purchase.total_price or 0)))
+    if purchase.delivery_district:
+        increment_rollup(connection, RestaurantDailyDistrictStats.__table__,
+                          dict(keys, district=purchase.delivery_district),
+                          dict(purchase_count=sign))
+
+
+def count_rejected_purchases(connection, purchases):
+    """
+    Count purchases rejected by a bulk UPDATE, which skips the mapper events,
+    into the rollups. purchases are (restaurant_id, purchase_date) rows of
+    purchases whose previous status the rollups did not count.
+    """
+    now, days = datetime.utcnow(), {}
+    for restaurant_id, purchase_date in purchases:
+        if restaurant_id is not None:
+            key = (restaurant_id, (purchase_date or now).date())
+            days[key] = days.get(key, 0) + 1
+    increment_rollups(connection, RestaurantDailyStats.__table__, ['restaurant_id', 'day'], 'rejected_purchases', days)
+
+
+# Rollups change in the same transaction as the purchase they count
+@event.listens_for(Purchase, 'after_insert')
+def _rollup_inserted_purchase(mapper, connection, target):
+    _apply_purchase_to_rollups(connection, target, target.status, 1)
+
+
+@event.listens_for(Purchase, 'after_update')
+def _rollup_updated_purchase(mapper, connection, target):
+    history = inspect(target).attrs.status.history
+    if not history.has_changes():
+        return
+
+    for previous in history.deleted or ():
+        _apply_purchase_to_rollups(connection, target, previous, -1)
+    _apply_purchase_to_rollups(connection, target, target.status, 1)
+
+
+@event.listens_for(Purchase, 'after_delete')
+def _rollup_deleted_purchase(mapper, connection, target):
+    _apply_purchase_to_rollups(connection, target, target.status, -1)
+
+
+def _bucket_starts(granularity, start_day, end_day):
+    """Start of every bucket covering [start_day, end_day], the first one containing start_day."""
+    end = datetime.combine(end_day + timedelta(days=1), datetime.min.time())
+    if granularity == 'month':
+        current = datetime(start_day.year, start_day.month, 1)
+    elif granularity == 'week':
+        current = datetime.combine(start_day - timedelta(days=start_day.weekday()), datetime.min.time())
+    else:
+        current = datetime.combine(start_day, datetime.min.time())
+
+    starts = []
+    while current < end:
+        starts.append(current)
+        if len(starts) > MAX_TIMESERIES_BUCKETS:
+            raise ValueError(f"The range holds more than {MAX_TIMESERIES_BUCKETS} {granularity} buckets")
+        if granularity == 'month':
+            current = datetime(current.year + current.month // 12, current.month % 12 + 1, 1)
+        else:
+            current += {'hour': timedelta(hours=1), 'day': timedelta(days=1), 'week': timedelta(weeks=1)}[granularity]
+    return starts
+
+
+def _bucket_sums(bucket_starts, times, *weights):
+    """Sum each weight array per bucket, times (datetime64) falling before the first bucket excluded."""
+    edges = np.array(bucket_starts, dtype='datetime64[s]')
+    index = np.searchsorted(edges, np.asarray(times, dtype='datetime64[s]'), side='right') - 1
+    keep = index >= 0
+    return [np.bincount(index[keep], weights=np.asarray(weight, dtype=float)[keep], minlength=len(edges))
+            for weight in weights]
+
 
 class RestaurantAnalyticsService:
     @staticmethod
-    def get_owner_analytics(owner_id):
-        today = datetime.utcnow()
-        start_date = datetime(today.year, today.month, 1)
+    def resolve_period(period=None, start_date=None, end_date=None, today=None):
+        """
+        Turn a period name, or a custom range of ISO dates, into an inclusive day range.
+
+        Returns:
+            tuple: (first day, last day, period label)
+
+        Raises:
+            ValueError: On an unknown period or an invalid custom range
+        """
+        today = today or datetime.utcnow().date()
+        period = period or (PERIOD_CUSTOM if start_date or end_date else PERIOD_MONTH)
+
+        if period == PERIOD_MONTH:
+            return date(today.year, today.month, 1), today, f"{today.year}-{today.month:02d}"
+        if period == PERIOD_WEEK:
+            year, week, _ = today.isocalendar()
+            return today - timedelta(days=today.weekday()), today, f"{year}-W{week:02d}"
+        if period == PERIOD_CUSTOM:
+            if not start_date or not end_date:
+                raise ValueError("start_date and end_date are required for a custom period")
+            start = start_date if isinstance(start_date, date) else date.fromisoformat(start_date)
+            end = end_date if isinstance(end_date, date) else date.fromisoformat(end_date)
+            if start > end:
+                raise ValueError("start_date must not be after end_date")
+            return start, end, f"{start.isoformat()}/{end.isoformat()}"
+        raise ValueError(f"Unknown period {period}, expected one of: month, week, custom")
+
+    @staticmethod
+    def get_period_stats(restaurant_ids, start_day, end_day):
+        """Units sold, revenue and purchases per district of the restaurants, summed from the daily rollups."""
+        units_sold, revenue = db.session.query(
+            func.coalesce(func.sum(RestaurantDailyStats.units_sold), 0),
+            func.coalesce(func.sum(RestaurantDailyStats.revenue), 0)
+        ).filter(
+            RestaurantDailyStats.restaurant_id.in_(restaurant_ids),
+            RestaurantDailyStats.day.between(start_day, end_day)
+        ).one()
+
+        district_count = func.sum(RestaurantDailyDistrictStats.purchase_count)
+        regions = db.session.query(RestaurantDailyDistrictStats.district, district_count).filter(
+            RestaurantDailyDistrictStats.restaurant_id.in_(restaurant_ids),
+            RestaurantDailyDistrictStats.day.between(start_day, end_day)
+        ).group_by(RestaurantDailyDistrictStats.district).having(district_count > 0).all()
+
+        return int(units_sold), Decimal(revenue), {district: int(count) for district, count in regions}
+
+    @staticmethod
+    def get_recent_comments(restaurant_ids, limit=RECENT_COMMENTS_LIMIT, with_badges=False):
+        """
+        The latest comments of each restaurant, with their users (and badges) loaded.
+
+        One query ranks comments per restaurant with ROW_NUMBER() and keeps the
+        first limit of each, so the cost does not grow with the number of
+        restaurants or comments. Badges, if asked for, take one more query.
+
+        Returns:
+            dict: Comments by restaurant id, newest first
+        """
+        rank = func.row_number().over(
+            partition_by=RestaurantComment.restaurant_id,
+            order_by=(RestaurantComment.timestamp.desc(), RestaurantComment.id.desc())
+        ).label('rank')
+        ranked = select(RestaurantComment.id, rank).where(
+            RestaurantComment.restaurant_id.in_(restaurant_ids)
+        ).subquery()
+
+        options = [joinedload(RestaurantComment.user)]
+        if with_badges:
+            options.append(selectinload(RestaurantComment.badges))
+        comments = RestaurantComment.query.join(ranked, ranked.c.id == RestaurantComment.id) \
+            .filter(ranked.c.rank <= limit) \
+            .options(*options) \
+            .order_by(RestaurantComment.restaurant_id, ranked.c.rank).all()
+
+        by_restaurant = {}
+        for comment in comments:
+            by_restaurant.setdefault(comment.restaurant_id, []).append(comment)
+        return by_restaurant
+
+    @staticmethod
+    def _comment_to_dict(comment, with_badges=False):
+        data = {
+            "user_name": comment.user.name,
+            "rating": float(comment.rating),
+            "comment": comment.comment,
+            "timestamp": comment.timestamp if isinstance(comment.timestamp, str) else comment.timestamp.isoformat()
+        }
+        if with_badges:
+            data["badges"] = [{
+                "name": badge.badge_name,
+                "is_positive": badge.is_positive
+            } for badge in comment.badges]
+        return data
+
+    @staticmethod
+    def rebuild_daily_stats(start_day=None, end_day=None):
+        """
+        Recompute the daily rollups of [start_day, end_day] from the purchases.
+
+        Without start_day the whole purchase history is rebuilt. Returns the
+        number of restaurant-day rows written.
+        """
+        end_day = end_day or datetime.utcnow().date()
+        purchase_day = day_of(Purchase.purchase_date)
+        in_range = [
+            Purchase.restaurant_id.isnot(None),
+            Purchase.purchase_date < datetime.combine(end_day + timedelta(days=1), datetime.min.time())
+        ]
+        stats_range = [RestaurantDailyStats.day <= end_day]
+        district_range = [RestaurantDailyDistrictStats.day <= end_day]
+        if start_day is not None:
+            in_range.append(Purchase.purchase_date >= datetime.combine(start_day, datetime.min.time()))
+            stats_range.append(RestaurantDailyStats.day >= start_day)
+            district_range.append(RestaurantDailyDistrictStats.day >= start_day)
+
+        is_completed = Purchase.status == PurchaseStatus.COMPLETED
+        completed_sum = lambda value: func.sum(case((is_completed, value), else_=0))
+
+        try:
+            db.session.execute(delete(RestaurantDailyStats).where(*stats_range))
+            db.session.execute(delete(RestaurantDailyDistrictStats).where(*district_range))
+
+            written = db.session.execute(insert(RestaurantDailyStats).from_select(
+                ['restaurant_id', 'day', 'completed_purchases', 'rejected_purchases', 'units_sold', 'revenue'],
+                select(Purchase.restaurant_id, purchase_day,
+                       completed_sum(1),
+                       func.sum(case((Purchase.status == PurchaseStatus.REJECTED, 1), else_=0)),
+                       completed_sum(Purchase.quantity),
+                       completed_sum(Purchase.total_price))
+                .where(*in_range, Purchase.status.in_(ROLLUP_STATUSES))
+                .group_by(Purchase.restaurant_id, purchase_day)
+            )).rowcount
+            db.session.execute(insert(RestaurantDailyDistrictStats).from_select(
+                ['restaurant_id', 'day', 'district', 'purchase_count'],
+                select(Purchase.restaurant_id, purchase_day, Purchase.delivery_district, func.count(Purchase.id))
+                .where(*in_range, is_completed, Purchase.delivery_district.isnot(None))
+                .group_by(Purchase.restaurant_id, purchase_day, Purchase.delivery_district)
+            ))
+            db.session.commit()
+            return written
+
+        except Exception:
+            db.session.rollback()
+            raise
+
+    @staticmethod
+    def reconcile_daily_stats(days=2):
+        """Scheduled job: re-count the rollups of the last few days."""
+        start_day = datetime.utcnow().date() - timedelta(days=days - 1)
+        return {"rows": RestaurantAnalyticsService.rebuild_daily_stats(start_day)}
+
+    @staticmethod
+    def backfill_daily_stats():
+        """Once job: fill the rollups from the whole purchase history, e.g. purchases from before they existed."""
+        return {"rows": RestaurantAnalyticsService.rebuild_daily_stats()}
+
+    @staticmethod
+    def _timeseries_columns(restaurant_ids, granularity, start_day, end_day):
+        """
+        Column-only rows for a time series: (times, completed, rejected, units, revenue) of the
+        purchases and (times, rating sums, rating counts) of the comments.
+
+        Day and coarser series read per-day sums of the rollups and comments,
+        aggregated across restaurants in SQL. Hourly series read the raw
+        purchase and comment columns of the range.
+        """
+        start = datetime.combine(start_day, datetime.min.time())
+        end = datetime.combine(end_day + timedelta(days=1), datetime.min.time())
+
+        if granularity == 'hour':
+            purchases = db.session.query(
+                Purchase.purchase_date, Purchase.status, Purchase.quantity, Purchase.total_price
+            ).filter(
+                Purchase.restaurant_id.in_(restaurant_ids),
+                Purchase.status.in_(ROLLUP_STATUSES),
+                Purchase.purchase_date >= start,
+                Purchase.purchase_date < end
+            ).all()
+            completed = np.array([status == PurchaseStatus.COMPLETED for _, status, _, _ in purchases], dtype=float)
+            purchase_columns = (
+                [purchase_date for purchase_date, _, _, _ in purchases],
+                completed,
+                1 - completed,
+                completed * np.array([quantity or 0 for _, _, quantity, _ in purchases], dtype=float),
+                completed * np.array([float(price or 0) for _, _, _, price in purchases], dtype=float),
+            )
+
+            comments = db.session.query(RestaurantComment.timestamp, RestaurantComment.rating).filter(
+                RestaurantComment.restaurant_id.in_(restaurant_ids),
+                RestaurantComment.timestamp >= start,
+                RestaurantComment.timestamp < end
+            ).all()
+            comment_columns = (
+                [timestamp for timestamp, _ in comments],
+                np.array([float(rating) for _, rating in comments], dtype=float),
+                np.ones(len(comments)),
+            )
+            return purchase_columns, comment_columns
+
+        days = db.session.query(
+            RestaurantDailyStats.day,
+            func.sum(RestaurantDailyStats.completed_purchases),
+            func.sum(RestaurantDailyStats.rejected_purchases),
+            func.sum(RestaurantDailyStats.units_sold),
+            func.sum(RestaurantDailyStats.revenue)
+        ).filter(
+            RestaurantDailyStats.restaurant_id.in_(restaurant_ids),
+            RestaurantDailyStats.day.between(start_day, end_day)
+        ).group_by(RestaurantDailyStats.day).all()
+        purchase_columns = (
+            np.array([day for day, *_ in days], dtype='datetime64[D]'),
+            *(np.array([float(row[column] or 0) for row in days], dtype=float) for column in range(1, 5))
+        )
+
+        comment_day = day_of(RestaurantComment.timestamp)
+        comment_days = db.session.query(
+            comment_day, func.sum(RestaurantComment.rating), func.count(RestaurantComment.id)
+        ).filter(
+            RestaurantComment.restaurant_id.in_(restaurant_ids),
+            RestaurantComment.timestamp >= start,
+            RestaurantComment.timestamp < end
+        ).group_by(comment_day).all()
+        comment_columns = (
+            np.array([day for day, _, _ in comment_days], dtype='datetime64[D]'),
+            np.array([float(rating_sum) for _, rating_sum, _ in comment_days], dtype=float),
+            np.array([count for _, _, count in comment_days], dtype=float),
+        )
+        return purchase_columns, comment_columns
+
+    @staticmethod
+    def get_timeseries(owner_id, granularity='day', start_date=None, end_date=None, restaurant_id=None):
+        """
+        Revenue, units sold, orders, rejection rate and average rating per hour,
+        day, week or month bucket, for one restaurant or all of an owner's.
+
+        Buckets are in UTC and the range is widened to whole buckets; every
+        bucket of it is returned, empty ones with zeros.
+        """
+        try:
+            if granularity not in GRANULARITIES:
+                raise ValueError(f"Unknown granularity {granularity}, expected one of: {', '.join(GRANULARITIES)}")
+            start_day, end_day, _ = RestaurantAnalyticsService.resolve_period(None, start_date, end_date)
+            bucket_starts = _bucket_starts(granularity, start_day, end_day)
+        except ValueError as e:
+            return {
+                "success": False,
+                "message": str(e)
+            }, 400
+
+        start_day = bucket_starts[0].date()
+        if granularity == 'month':
+            end_day = (datetime(end_day.year + end_day.month // 12, end_day.month % 12 + 1, 1) - timedelta(days=1)).date()
+        elif granularity == 'week':
+            end_day = end_day + timedelta(days=6 - end_day.weekday())
+
+        query = db.session.query(Restaurant.id).filter(Restaurant.owner_id == owner_id)
+        if restaurant_id is not None:
+            query = query.filter(Restaurant.id == restaurant_id)
+        restaurant_ids = [row[0] for row in query.all()]
+        if not restaurant_ids:
+            return {
+                "success": False,
+                "message": f"Restaurant with ID {restaurant_id} not found for this owner" if restaurant_id is not None
+                else "No restaurants found for this owner"
+            }, 404
+
+        purchase_columns, comment_columns = RestaurantAnalyticsService._timeseries_columns(
+            restaurant_ids, granularity, start_day, end_day)
+        completed, rejected, units, revenue = _bucket_sums(bucket_starts, *purchase_columns)
+        rating_sums, rating_counts = _bucket_sums(bucket_starts, *comment_columns)
+
+        decided = completed + rejected
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rejection_rates = np.where(decided > 0, rejected / decided, 0.0)
+            average_ratings = np.where(rating_counts > 0, rating_sums / rating_counts, np.nan)
+
+        buckets = [{
+            "start": bucket_start.isoformat(),
+            "revenue": f"{revenue[i]:.2f}",
+            "units_sold": int(units[i]),
+            "orders": int(completed[i]),
+            "rejected_orders": int(rejected[i]),
+            "rejection_rate": round(float(rejection_rates[i]), 4),
+            "average_rating": None if np.isnan(average_ratings[i]) else round(float(average_ratings[i]), 2),
+            "rating_count": int(rating_counts[i])
+        } for i, bucket_start in enumerate(bucket_starts)]
+
+        return {
+            "success": True,
+            "data": {
+                "granularity": granularity,
+                "start_date": start_day.isoformat(),
+                "end_date": end_day.isoformat(),
+                "restaurant_ids": restaurant_ids,
+                "buckets": buckets
+            }
+        }, 200
+
+    @staticmethod
+    def get_owner_analytics(owner_id, period=None, start_date=None, end_date=None):
+        try:
+            start_day, end_day, period_label = RestaurantAnalyticsService.resolve_period(period, start_date, end_date)
+        except ValueError as e:
+            return {
+                "success": False,
+                "message": str(e)
+            }, 400
 
         restaurants = Restaurant.query.filter_by(owner_id=owner_id).all()
         restaurant_ids = [r.id for r in restaurants]
@@ -18,36 +427,19 @@ class RestaurantAnalyticsService:
                 "message": "No restaurants found for this owner"
             }, 404
 
-        monthly_purchases = Purchase.query.filter(
-            Purchase.restaurant_id.in_(restaurant_ids),
-            Purchase.status == PurchaseStatus.COMPLETED,
-            Purchase.purchase_date >= start_date
-        ).all()
-
-        monthly_products = sum(p.quantity for p in monthly_purchases)
-        monthly_revenue = sum(Decimal(p.total_price) for p in monthly_purchases)
+        monthly_products, monthly_revenue, regions = RestaurantAnalyticsService.get_period_stats(
+            restaurant_ids, start_day, end_day)
 
-        regions = {}
-        for purchase in monthly_purchases:
-            if purchase.delivery_district:
-                district = purchase.delivery_district
-                regions[district] = regions.get(district, 0) + 1
+        recent_comments = RestaurantAnalyticsService.get_recent_comments(restaurant_ids)
 
         restaurant_stats = {}
         for restaurant in restaurants:
-            comments = RestaurantComment.query.filter_by(restaurant_id=restaurant.id) \
-                .order_by(RestaurantComment.timestamp.desc()).all()
-
             restaurant_stats[restaurant.restaurantName] = {
                 "id": restaurant.id,
                 "average_rating": float(restaurant.rating) if restaurant.rating else 0,
                 "total_ratings": restaurant.ratingCount,
-                "recent_comments": [{
-                    "user_name": comment.user.name,
-                    "rating": float(comment.rating),
-                    "comment": comment.comment,
-                    "timestamp": comment.timestamp if isinstance(comment.timestamp, str) else comment.timestamp.isoformat()
-                } for comment in comments[:5]]
+                "recent_comments": [RestaurantAnalyticsService._comment_to_dict(comment)
+                                    for comment in recent_comments.get(restaurant.id, [])]
             }
 
         return {
@@ -56,7 +448,9 @@ class RestaurantAnalyticsService:
                 "monthly_stats": {
                     "total_products_sold": monthly_products,
                     "total_revenue": str(monthly_revenue),
-                    "period": f"{today.year}-{today.month:02d}"
+                    "period": period_label,
+                    "start_date": start_day.isoformat(),
+                    "end_date": end_day.isoformat()
                 },
                 "regional_distribution": regions,
                 "restaurant_ratings": restaurant_stats
@@ -64,9 +458,14 @@ class RestaurantAnalyticsService:
         }, 200
 
     @staticmethod
-    def get_restaurant_analytics(restaurant_id):
-        today = datetime.utcnow()
-        start_date = datetime(today.year, today.month, 1)
+    def get_restaurant_analytics(restaurant_id, period=None, start_date=None, end_date=None):
+        try:
+            start_day, end_day, period_label = RestaurantAnalyticsService.resolve_period(period, start_date, end_date)
+        except ValueError as e:
+            return {
+                "success": False,
+                "message": str(e)
+            }, 400
 
         restaurant = Restaurant.query.get(restaurant_id)
         if not restaurant:
@@ -75,39 +474,18 @@ class RestaurantAnalyticsService:
                 "message": f"Restaurant with ID {restaurant_id} not found"
             }, 404
 
-        monthly_purchases = Purchase.query.filter(
-            Purchase.restaurant_id == restaurant_id,
-            Purchase.status == PurchaseStatus.COMPLETED,
-            Purchase.purchase_date >= start_date
-        ).all()
-
-        monthly_products = sum(p.quantity for p in monthly_purchases)
-        monthly_revenue = sum(Decimal(p.total_price) for p in monthly_purchases)
-
-        regions = {}
-        for purchase in monthly_purchases:
-            if purchase.delivery_district:
-                district = purchase.delivery_district
-                regions[district] = regions.get(district, 0) + 1
+        monthly_products, monthly_revenue, regions = RestaurantAnalyticsService.get_period_stats(
+            [restaurant_id], start_day, end_day)
 
-        comments = RestaurantComment.query.filter_by(restaurant_id=restaurant_id) \
-            .order_by(RestaurantComment.timestamp.desc()).all()
+        comments = RestaurantAnalyticsService.get_recent_comments([restaurant_id], with_badges=True)
 
         restaurant_stats = {
             "id": restaurant.id,
             "name": restaurant.restaurantName,
             "average_rating": float(restaurant.rating) if restaurant.rating else 0,
             "total_ratings": restaurant.ratingCount,
-            "recent_comments": [{
-                "user_name": comment.user.name,
-                "rating": float(comment.rating),
-                "comment": comment.comment,
-                "timestamp": comment.timestamp if isinstance(comment.timestamp, str) else comment.timestamp.isoformat(),
-                "badges": [{
-                    "name": badge.badge_name,
-                    "is_positive": badge.is_positive
-                } for badge in comment.badges]
-            } for comment in comments[:5]]
+            "recent_comments": [RestaurantAnalyticsService._comment_to_dict(comment, with_badges=True)
+                                for comment in comments.get(restaurant_id, [])]
         }
 
         return {
@@ -116,7 +494,9 @@ class RestaurantAnalyticsService:
                 "monthly_stats": {
                     "total_products_sold": monthly_products,
                     "total_revenue": str(monthly_revenue),
-                    "period": f"{today.year}-{today.month:02d}"
+                    "period": period_label,
+                    "start_date": start_day.isoformat(),
+                    "end_date": end_day.isoformat()
                 },
                 "regional_distribution": regions,
                 "restaurant_stats": restaurant_stats
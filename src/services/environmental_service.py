@@ -1,7 +1,59 @@
 from datetime import datetime, timedelta, UTC
 from decimal import Decimal
-from src.models import db, Purchase, PurchaseStatus, EnvironmentalContribution
-from sqlalchemy import func
+import numpy as np
+from src.models import db, Purchase, PurchaseStatus, EnvironmentalContribution, UserEnvironmentalTotal, \
+    UserEnvironmentalDaily
+from src.services.leaderboards import Leaderboard, queue_increment
+from src.utils.rollups import increment_rollup, increment_rollups
+from src.utils.sql_time import day_of
+from sqlalchemy import delete, event, func, insert, inspect, select
+
+MAX_LEADERBOARD_PAGE_SIZE = 100
+MONTHLY_WINDOW_DAYS = 30
+# 0.5 kg food × 2.5 kg CO2/kg food per unit sold
+CO2_AVOIDED_PER_UNIT = Decimal('1.25')
+
+# Total CO2 avoided per user in the shared leaderboard store, seeded from user_environmental_totals
+co2_leaderboard = Leaderboard(
+    'co2_avoided',
+    lambda: db.session.query(UserEnvironmentalTotal.user_id, UserEnvironmentalTotal.total_co2_avoided).all()
+)
+
+
+def _utcnow():
+    """The current time, the one clock of this module so tests can move it."""
+    return datetime.now(UTC)
+
+
+def _apply_contribution_to_totals(connection, contribution, sign):
+    """Count a contribution into (sign 1) or out of (sign -1) the user's total, daily bucket and leaderboard."""
+    # created_at may still be unset here
+    created_at = inspect(contribution).dict.get('created_at')
+    if not isinstance(created_at, datetime):
+        created_at = _utcnow()
+    amount = sign * Decimal(str(contribution.co2_avoided or 0))
+
+    increment_rollup(connection, UserEnvironmentalTotal.__table__, dict(user_id=contribution.user_id),
+                     dict(total_co2_avoided=amount))
+    increment_rollup(connection, UserEnvironmentalDaily.__table__,
+                     dict(user_id=contribution.user_id, day=created_at.date()),
+                     dict(co2_avoided=amount))
+    queue_increment(contribution, co2_leaderboard, contribution.user_id, float(amount))
+
+
+# Totals change in the same transaction as the contribution they count
+@event.listens_for(EnvironmentalContribution, 'after_insert')
+def _totals_inserted_contribution(mapper, connection, target):
+    _apply_contribution_to_totals(connection, target, 1)
+
+
+@event.listens_for(EnvironmentalContribution, 'after_delete')
+def _totals_deleted_contribution(mapper, connection, target):
+    _apply_contribution_to_totals(connection, target, -1)
+
+
+def _monthly_window_start():
+    return _utcnow().date() - timedelta(days=MONTHLY_WINDOW_DAYS - 1)
 
 
 class EnvironmentalService:
@@ -17,7 +69,7 @@ class EnvironmentalService:
             return Decimal('0.00')
 
         # Base calculation: 0.5 kg food × 2.5 kg CO2/kg food × quantity
-        base_co2_avoided = Decimal('1.25') * purchase.quantity
+        base_co2_avoided = CO2_AVOIDED_PER_UNIT * purchase.quantity
 
         return base_co2_avoided
 
@@ -25,6 +77,8 @@ class EnvironmentalService:
     def record_contribution_for_purchase(purchase_id):
         """
         Record the environmental contribution for a completed purchase
+
+        The user's running total and daily bucket are updated in the same commit.
         """
         # Check if contribution already recorded
         existing = EnvironmentalContribution.query.filter_by(purchase_id=purchase_id).first()
@@ -48,85 +102,151 @@ class EnvironmentalService:
         return True
 
     @staticmethod
-    def get_user_contributions(user_id):
-        """
-        Get user's environmental contributions (total and last month)
+    def record_contributions_for_purchases(purchase_ids):
         """
-        # Calculate total contributions
-        total_query = db.session.query(
-            func.sum(EnvironmentalContribution.co2_avoided)
-        ).filter(
-            EnvironmentalContribution.user_id == user_id
-        )
-
-        total_co2_avoided = total_query.scalar() or Decimal('0.00')
+        Batch variant of record_contribution_for_purchase for the completed
+        purchases among purchase_ids that have no contribution yet: one query,
+        one bulk insert and one commit. Contributions are dated at their
+        purchase, and the per-user totals and leaderboard are updated with
+        one increment per user and day.
 
-        # Calculate last month's contributions
-        one_month_ago = datetime.now(UTC) - timedelta(days=30)
+        Returns the number of contributions recorded.
+        """
+        if not purchase_ids:
+            return 0
 
-        monthly_query = db.session.query(
-            func.sum(EnvironmentalContribution.co2_avoided)
+        rows = db.session.query(
+            Purchase.id, Purchase.user_id, Purchase.quantity, Purchase.purchase_date
+        ).outerjoin(
+            EnvironmentalContribution, EnvironmentalContribution.purchase_id == Purchase.id
         ).filter(
-            EnvironmentalContribution.user_id == user_id,
-            EnvironmentalContribution.created_at >= one_month_ago
-        )
+            Purchase.id.in_(purchase_ids),
+            Purchase.status == PurchaseStatus.COMPLETED,
+            Purchase.user_id.isnot(None),
+            EnvironmentalContribution.id.is_(None)
+        ).all()
+        if not rows:
+            return 0
+
+        quantities = np.array([quantity or 0 for _, _, quantity, _ in rows], dtype=float)
+        co2_avoided = np.round(quantities * float(CO2_AVOIDED_PER_UNIT), 2)
+
+        now = _utcnow()
+        mappings, totals, days = [], {}, {}
+        for (purchase_id, user_id, _, purchase_date), amount in zip(rows, co2_avoided):
+            amount, created_at = Decimal(f"{amount:.2f}"), purchase_date or now
+            mappings.append(dict(user_id=user_id, purchase_id=purchase_id, co2_avoided=amount, created_at=created_at))
+            totals[(user_id,)] = totals.get((user_id,), Decimal('0.00')) + amount
+            days[(user_id, created_at.date())] = days.get((user_id, created_at.date()), Decimal('0.00')) + amount
+
+        try:
+            # Bulk inserts skip the mapper events, so the totals are incremented here
+            db.session.bulk_insert_mappings(EnvironmentalContribution, mappings)
+            connection = db.session.connection()
+            increment_rollups(connection, UserEnvironmentalTotal.__table__, ['user_id'], 'total_co2_avoided', totals)
+            increment_rollups(connection, UserEnvironmentalDaily.__table__, ['user_id', 'day'], 'co2_avoided', days)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        for (user_id,), amount in totals.items():
+            co2_leaderboard.record(user_id, amount)
+        return len(mappings)
 
-        monthly_co2_avoided = monthly_query.scalar() or Decimal('0.00')
+    @staticmethod
+    def get_user_contributions(user_id):
+        """
+        Get user's environmental contributions (total and last month)
+        """
+        # One row: the running total and the sum of the daily buckets of the last 30 days
+        monthly = select(func.sum(UserEnvironmentalDaily.co2_avoided)).where(
+            UserEnvironmentalDaily.user_id == user_id,
+            UserEnvironmentalDaily.day >= _monthly_window_start()
+        ).scalar_subquery()
+        total_co2_avoided, monthly_co2_avoided = db.session.execute(
+            select(
+                select(UserEnvironmentalTotal.total_co2_avoided)
+                .where(UserEnvironmentalTotal.user_id == user_id).scalar_subquery(),
+                monthly
+            )
+        ).one()
 
         return {
             "success": True,
             "data": {
-                "total_co2_avoided": float(total_co2_avoided),
-                "monthly_co2_avoided": float(monthly_co2_avoided),
+                "total_co2_avoided": float(total_co2_avoided or Decimal('0.00')),
+                "monthly_co2_avoided": float(monthly_co2_avoided or Decimal('0.00')),
+                "rank": co2_leaderboard.rank(user_id),
                 "unit": "kg CO2 equivalent"
             }
         }
 
     @staticmethod
-    def get_all_users_contributions():
+    def get_all_users_contributions(limit=None, offset=0):
         """
         Get all users' environmental contributions for leaderboard or analytics
-        """
-        total_query = db.session.query(
-            EnvironmentalContribution.user_id,
-            func.sum(EnvironmentalContribution.co2_avoided).label('total_co2_avoided')
-        ).group_by(
-            EnvironmentalContribution.user_id
-        ).order_by(
-            func.sum(EnvironmentalContribution.co2_avoided).desc()
-        )
-
-        one_month_ago = datetime.now(UTC) - timedelta(days=30)
-
-        monthly_query = db.session.query(
-            EnvironmentalContribution.user_id,
-            func.sum(EnvironmentalContribution.co2_avoided).label('monthly_co2_avoided')
-        ).filter(
-            EnvironmentalContribution.created_at >= one_month_ago
-        ).group_by(
-            EnvironmentalContribution.user_id
-        ).order_by(
-            func.sum(EnvironmentalContribution.co2_avoided).desc()
-        )
 
-        total_results = {row.user_id: float(row.total_co2_avoided) for row in total_query.all()}
-        monthly_results = {row.user_id: float(row.monthly_co2_avoided) for row in monthly_query.all()}
-
-        all_user_ids = set(total_results.keys()).union(set(monthly_results.keys()))
-
-        results = []
-        for user_id in all_user_ids:
-            results.append({
-                "user_id": user_id,
-                "total_co2_avoided": total_results.get(user_id, 0.0),
-                "monthly_co2_avoided": monthly_results.get(user_id, 0.0)
-            })
-
-        # Sort by total CO2 avoided
-        results.sort(key=lambda x: x["total_co2_avoided"], reverse=True)
+        Totals and ranks come from the leaderboard store, highest total first;
+        limit and offset select a page of it. Monthly totals sum the daily
+        buckets of the users on the page only.
+        """
+        if limit is not None:
+            limit = min(limit, MAX_LEADERBOARD_PAGE_SIZE)
+        entries = co2_leaderboard.page(offset, limit)
+
+        monthly_results = {}
+        if entries:
+            monthly_query = db.session.query(
+                UserEnvironmentalDaily.user_id,
+                func.sum(UserEnvironmentalDaily.co2_avoided).label('monthly_co2_avoided')
+            ).filter(
+                UserEnvironmentalDaily.user_id.in_([user_id for user_id, _, _ in entries]),
+                UserEnvironmentalDaily.day >= _monthly_window_start()
+            ).group_by(
+                UserEnvironmentalDaily.user_id
+            )
+            monthly_results = {row.user_id: float(row.monthly_co2_avoided) for row in monthly_query.all()}
+
+        results = [{
+            "rank": rank,
+            "user_id": user_id,
+            "total_co2_avoided": round(total, 2),
+            "monthly_co2_avoided": monthly_results.get(user_id, 0.0)
+        } for user_id, total, rank in entries]
 
         return {
             "success": True,
             "data": results,
             "unit": "kg CO2 equivalent"
-        }
\ No newline at end of file
+        }
+
+    @staticmethod
+    def rebuild_contribution_totals():
+        """
+        Recompute the per-user totals and daily buckets from all contributions,
+        then re-seed the leaderboard from them.
+
+        Scheduled to back-fill the totals and to repair any drift.
+        """
+        created_day = day_of(EnvironmentalContribution.created_at)
+        try:
+            db.session.execute(delete(UserEnvironmentalTotal))
+            db.session.execute(delete(UserEnvironmentalDaily))
+            written = db.session.execute(insert(UserEnvironmentalTotal).from_select(
+                ['user_id', 'total_co2_avoided'],
+                select(EnvironmentalContribution.user_id, func.sum(EnvironmentalContribution.co2_avoided))
+                .group_by(EnvironmentalContribution.user_id)
+            )).rowcount
+            db.session.execute(insert(UserEnvironmentalDaily).from_select(
+                ['user_id', 'day', 'co2_avoided'],
+                select(EnvironmentalContribution.user_id, created_day, func.sum(EnvironmentalContribution.co2_avoided))
+                .group_by(EnvironmentalContribution.user_id, created_day)
+            ))
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        co2_leaderboard.reload()
+        return {"users": written}
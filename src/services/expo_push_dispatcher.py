@@ -0,0 +1,226 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+EXPO_PUSH_URL = "https://exp.host/--/api/v2/push/send"
+EXPO_RECEIPTS_URL = "https://exp.host/--/api/v2/push/getReceipts"
+
+# Limits documented by Expo for a single request
+EXPO_PUSH_BATCH_SIZE = 100
+EXPO_RECEIPT_BATCH_SIZE = 1000
+
+# Expo keeps receipts for about a day, older tickets will never resolve
+RECEIPT_EXPIRY_SECONDS = 24 * 60 * 60
+
+# Errors after which a token will never be delivered to again
+DEAD_TOKEN_ERRORS = {"DeviceNotRegistered"}
+
+
+class ExpoPushDispatcher:
+    """
+    Sends Expo push messages over a pooled HTTP session.
+
+    Messages are split into batches of at most 100, batches answered with 429
+    or 5xx (or failing at the network level) are retried with exponential
+    backoff, and the ticket of every accepted message is remembered so its
+    receipt can be polled later. Tokens reported as unregistered, either on
+    the ticket or on the receipt, are returned to the caller for deactivation.
+
+    Pending tickets are kept in memory, so every process polls its own
+    receipts (see NotificationQueue.poll_receipts_if_due). Receipts of a
+    worker that restarts before polling are lost; the next send to a dead
+    token reports it again.
+    """
+
+    def __init__(self,
+                 push_url: str = EXPO_PUSH_URL,
+                 receipts_url: str = EXPO_RECEIPTS_URL,
+                 batch_size: int = EXPO_PUSH_BATCH_SIZE,
+                 receipt_batch_size: int = EXPO_RECEIPT_BATCH_SIZE,
+                 max_retries: int = 3,
+                 backoff_seconds: float = 0.5,
+                 timeout: float = 10,
+                 pool_size: int = 10,
+                 max_pending_receipts: int = 100000,
+                 sleep: Callable[[float], None] = time.sleep):
+        self.push_url = push_url
+        self.receipts_url = receipts_url
+        self.batch_size = batch_size
+        self.receipt_batch_size = receipt_batch_size
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.timeout = timeout
+        self.max_pending_receipts = max_pending_receipts
+        self._sleep = sleep
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({
+            "Accept": "application/json",
+            "Accept-encoding": "gzip, deflate",
+            "Content-Type": "application/json",
+        })
+
+        # ticket id -> (token, time the ticket was issued)
+        self._pending: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def pending_receipt_count(self) -> int:
+        return len(self._pending)
+
+    def _post(self, url: str, payload: Any) -> Optional[Dict[str, Any]]:
+        """
+        POST a JSON payload, retrying throttled, failed and unreachable requests.
+
+        Returns:
+            Optional[Dict[str, Any]]: The decoded response body, or None if the
+            request did not succeed within max_retries retries
+        """
+        for attempt in range(self.max_retries + 1):
+            retry_after = None
+            try:
+                response = self.session.post(url, json=payload, timeout=self.timeout)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                logger.warning(f"Expo request to {url} failed (attempt {attempt + 1}): {str(e)}")
+            else:
+                if response.status_code == 200:
+                    return response.json()
+                if response.status_code != 429 and response.status_code < 500:
+                    logger.error(f"Expo request failed with status {response.status_code}: {response.text}")
+                    return None
+                logger.warning(f"Expo returned status {response.status_code} (attempt {attempt + 1})")
+                retry_after = response.headers.get("Retry-After") if response.headers else None
+
+            if attempt < self.max_retries:
+                self._sleep(self._backoff(attempt, retry_after))
+
+        logger.error(f"Giving up on Expo request to {url} after {self.max_retries + 1} attempts")
+        return None
+
+    def _backoff(self, attempt: int, retry_after: Optional[str]) -> float:
+        if retry_after:
+            try:
+                return max(float(retry_after), 0.0)
+            except ValueError:
+                pass
+        return self.backoff_seconds * (2 ** attempt)
+
+    def send(self, messages: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Send push messages, each a dict in the Expo message format with a "to" token.
+
+        Returns:
+            Dict[str, Any]: "sent" and "failed" message counts, "failed_batches",
+            and "dead_tokens" for tokens Expo rejected as unregistered
+        """
+        result = {"sent": 0, "failed": 0, "failed_batches": 0, "dead_tokens": []}
+
+        for start in range(0, len(messages), self.batch_size):
+            batch = messages[start:start + self.batch_size]
+            body = self._post(self.push_url, batch)
+
+            if body is None or body.get("errors"):
+                if body is not None:
+                    logger.error(f"Expo API returned errors: {body['errors']}")
+                result["failed"] += len(batch)
+                result["failed_batches"] += 1
+                continue
+
+            tickets = body.get("data")
+            if not isinstance(tickets, list):
+                # Nothing to track, but the batch itself was accepted
+                result["sent"] += len(batch)
+                continue
+
+            now = time.monotonic()
+            with self._lock:
+                for message, ticket in zip(batch, tickets):
+                    if ticket.get("status") == "ok":
+                        result["sent"] += 1
+                        if ticket.get("id"):
+                            self._pending[ticket["id"]] = (message["to"], now)
+                        continue
+
+                    result["failed"] += 1
+                    error = (ticket.get("details") or {}).get("error")
+                    if error in DEAD_TOKEN_ERRORS:
+                        result["dead_tokens"].append(message["to"])
+                    else:
+                        logger.warning(f"Expo rejected message to {message['to']}: {ticket.get('message')}")
+
+                while len(self._pending) > self.max_pending_receipts:
+                    self._pending.popitem(last=False)
+
+        return result
+
+    def check_receipts(self, min_age_seconds: float = 0) -> List[str]:
+        """
+        Poll the receipts of tickets issued at least min_age_seconds ago.
+
+        Tickets whose receipt is not available yet stay pending until they
+        expire.
+
+        Returns:
+            List[str]: Tokens whose receipt reported them as unregistered
+        """
+        now = time.monotonic()
+        with self._lock:
+            due = [ticket_id for ticket_id, (_, issued_at) in self._pending.items()
+                   if now - issued_at >= min_age_seconds]
+
+        dead_tokens = []
+        for start in range(0, len(due), self.receipt_batch_size):
+            ticket_ids = due[start:start + self.receipt_batch_size]
+            body = self._post(self.receipts_url, {"ids": ticket_ids})
+            if body is None:
+                continue
+
+            receipts = body.get("data") or {}
+            with self._lock:
+                for ticket_id in ticket_ids:
+                    receipt = receipts.get(ticket_id)
+                    if receipt is None:
+                        entry = self._pending.get(ticket_id)
+                        if entry and now - entry[1] > RECEIPT_EXPIRY_SECONDS:
+                            del self._pending[ticket_id]
+                        continue
+
+                    token, _ = self._pending.pop(ticket_id, (None, None))
+                    if receipt.get("status") == "ok" or token is None:
+                        continue
+
+                    error = (receipt.get("details") or {}).get("error")
+                    if error in DEAD_TOKEN_ERRORS:
+                        dead_tokens.append(token)
+                    else:
+                        logger.warning(f"Expo receipt {ticket_id} reported an error: {receipt.get('message')}")
+
+        return dead_tokens
+
+
+_dispatcher: Optional[ExpoPushDispatcher] = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_push_dispatcher() -> ExpoPushDispatcher:
+    """Return the process-wide dispatcher, so all sends share one connection pool."""
+    global _dispatcher
+    if _dispatcher is None:
+        with _dispatcher_lock:
+            if _dispatcher is None:
+                _dispatcher = ExpoPushDispatcher(
+                    push_url=os.getenv("EXPO_PUSH_URL", EXPO_PUSH_URL),
+                    receipts_url=os.getenv("EXPO_RECEIPTS_URL", EXPO_RECEIPTS_URL),
+                )
+    return _dispatcher
@@ -1,11 +1,58 @@
+import numpy as np
 from flask import jsonify
-from src.models import db, DiscountEarned, User, Purchase, Listing
-from sqlalchemy import func
-from datetime import datetime
+from src.models import db, DiscountEarned, User, Purchase, Listing, UserDiscountTotal, UserDiscountDaily
+from sqlalchemy import and_, case, delete, event, func, insert, inspect, or_, select
+from datetime import datetime, timedelta
+from decimal import Decimal
+from src.services.leaderboards import Leaderboard, queue_increment
+from src.utils.rollups import increment_rollup, increment_rollups
+from src.utils.sql_time import day_of
+
+MONTHLY_WINDOW_DAYS = 30
+MAX_RANKINGS_PAGE_SIZE = 100
+DEFAULT_NEIGHBOURHOOD_RADIUS = 5
+MAX_NEIGHBOURHOOD_RADIUS = 25
+
+# All-time discount totals in the shared leaderboard store, seeded from user_discount_totals
+discount_leaderboard = Leaderboard(
+    'discounts',
+    lambda: db.session.query(UserDiscountTotal.user_id, UserDiscountTotal.total_discount).all()
+)
+
+
+def _apply_discount_to_leaderboard(connection, discount_earned, sign):
+    """Count a discount into (sign 1) or out of (sign -1) the leaderboard totals and daily buckets."""
+    # earned_at may still be the func.now() default here, which has no value until reloaded
+    earned_at = inspect(discount_earned).dict.get('earned_at')
+    if not isinstance(earned_at, datetime):
+        earned_at = datetime.now()
+    amount = sign * Decimal(str(discount_earned.discount or 0))
+
+    increment_rollup(connection, UserDiscountTotal.__table__, dict(user_id=discount_earned.user_id),
+                     dict(total_discount=amount))
+    increment_rollup(connection, UserDiscountDaily.__table__,
+                     dict(user_id=discount_earned.user_id, day=earned_at.date()),
+                     dict(discount=amount))
+    queue_increment(discount_earned, discount_leaderboard, discount_earned.user_id, float(amount))
+
+
+# The leaderboard changes in the same transaction as the discount it counts
+@event.listens_for(DiscountEarned, 'after_insert')
+def _leaderboard_inserted_discount(mapper, connection, target):
+    _apply_discount_to_leaderboard(connection, target, 1)
+
+
+@event.listens_for(DiscountEarned, 'after_delete')
+def _leaderboard_deleted_discount(mapper, connection, target):
+    _apply_discount_to_leaderboard(connection, target, -1)
+
 
 def add_discount_point(purchase_id):
     """
     Adds a discount point record for a given purchase.
+
+    The user's leaderboard total and daily bucket are updated in the same commit,
+    the shared leaderboard store once it succeeds.
     """
     purchase = Purchase.query.filter_by(id=purchase_id).first()
     if not purchase:
@@ -22,6 +69,7 @@ def add_discount_point(purchase_id):
 
     new_discount_point = DiscountEarned(
         user_id=user_id,
+        purchase_id=purchase.id,
         discount=discount,
         earned_at=datetime.now()
     )
@@ -29,33 +77,184 @@ def add_discount_point(purchase_id):
     db.session.add(new_discount_point)
     db.session.commit()
 
-def get_user_rankings():
+def add_discount_points(purchase_ids):
     """
-    Retrieves a JSON response with user rankings based on the total discount earned.
+    Batch variant of add_discount_point for the purchases among purchase_ids
+    that have no discount point yet: one query, one bulk insert and one
+    commit. Points are dated at their purchase, and the leaderboard totals
+    are updated with one increment per user and day.
+
+    Returns the number of discount points added.
     """
-    results = db.session.query(
-                DiscountEarned.user_id.label('user_id'),
-                User.name.label('user_name'),
-                func.sum(DiscountEarned.discount).label('total_discount')
-            ) \
-            .join(User, User.id == DiscountEarned.user_id) \
-            .group_by(DiscountEarned.user_id, User.name) \
-            .order_by(func.sum(DiscountEarned.discount).desc()) \
-            .all()
-
-    user_rankings = []
-    rank = 1
-    for user_id, user_name, total_discount in results:
+    if not purchase_ids:
+        return 0
+
+    rows = db.session.query(
+        Purchase.id, Purchase.user_id, Purchase.quantity, Purchase.total_price, Purchase.purchase_date,
+        Listing.original_price
+    ).join(
+        Listing, Listing.id == Purchase.listing_id
+    ).outerjoin(
+        DiscountEarned, DiscountEarned.purchase_id == Purchase.id
+    ).filter(
+        Purchase.id.in_(purchase_ids),
+        Purchase.user_id.isnot(None),
+        DiscountEarned.id.is_(None)
+    ).all()
+    if not rows:
+        return 0
+
+    quantities = np.array([row.quantity or 0 for row in rows], dtype=float)
+    original_prices = np.array([float(row.original_price or 0) for row in rows], dtype=float)
+    total_prices = np.array([float(row.total_price or 0) for row in rows], dtype=float)
+    discounts = np.round(quantities * original_prices - total_prices, 2)
+
+    now = datetime.now()
+    mappings, totals, days = [], {}, {}
+    for row, amount in zip(rows, discounts):
+        amount, earned_at = Decimal(f"{amount:.2f}"), row.purchase_date or now
+        mappings.append(dict(user_id=row.user_id, purchase_id=row.id, discount=amount, earned_at=earned_at))
+        totals[(row.user_id,)] = totals.get((row.user_id,), Decimal('0.00')) + amount
+        days[(row.user_id, earned_at.date())] = days.get((row.user_id, earned_at.date()), Decimal('0.00')) + amount
+
+    try:
+        # Bulk inserts skip the mapper events, so the leaderboard totals are incremented here
+        db.session.bulk_insert_mappings(DiscountEarned, mappings)
+        connection = db.session.connection()
+        increment_rollups(connection, UserDiscountTotal.__table__, ['user_id'], 'total_discount', totals)
+        increment_rollups(connection, UserDiscountDaily.__table__, ['user_id', 'day'], 'discount', days)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    for (user_id,), amount in totals.items():
+        discount_leaderboard.record(user_id, amount)
+    return len(mappings)
+
+
+def rebuild_discount_leaderboard():
+    """
+    Recompute the leaderboard totals and daily buckets from all DiscountEarned rows.
+
+    Scheduled to back-fill the leaderboard and to repair any drift, including
+    the copy in the leaderboard store. Returns the number of users on the
+    leaderboard.
+    """
+    earned_day = day_of(DiscountEarned.earned_at)
+    try:
+        db.session.execute(delete(UserDiscountTotal))
+        db.session.execute(delete(UserDiscountDaily))
+        written = db.session.execute(insert(UserDiscountTotal).from_select(
+            ['user_id', 'total_discount'],
+            select(DiscountEarned.user_id, func.sum(DiscountEarned.discount)).group_by(DiscountEarned.user_id)
+        )).rowcount
+        db.session.execute(insert(UserDiscountDaily).from_select(
+            ['user_id', 'day', 'discount'],
+            select(DiscountEarned.user_id, earned_day, func.sum(DiscountEarned.discount))
+            .group_by(DiscountEarned.user_id, earned_day)
+        ))
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    discount_leaderboard.reload()
+    return {"users": written}
+
+
+def _monthly_leaderboard():
+    """The (user_id, total_discount) selectable of the last 30 daily buckets summed."""
+    first_day = datetime.now().date() - timedelta(days=MONTHLY_WINDOW_DAYS - 1)
+    return select(
+        UserDiscountDaily.user_id.label('user_id'),
+        func.sum(UserDiscountDaily.discount).label('total_discount')
+    ).where(UserDiscountDaily.day >= first_day).group_by(UserDiscountDaily.user_id).subquery()
+
+
+def _total_of(leaderboard, user_id):
+    total = db.session.execute(
+        select(leaderboard.c.total_discount).where(leaderboard.c.user_id == user_id)
+    ).scalar()
+    return Decimal(str(total or 0))
+
+
+def _rank_of(leaderboard, total_discount):
+    """Users with a higher total plus one, so equal totals share a rank."""
+    ahead = db.session.execute(
+        select(func.count()).select_from(leaderboard).where(leaderboard.c.total_discount > total_discount)
+    ).scalar()
+    return ahead + 1
+
+
+def _ranked_rows(leaderboard, rows):
+    """Ranking entries of (user_id, user_name, total_discount) rows, a contiguous slice in leaderboard order."""
+    if not rows:
+        return []
+
+    # One count places the slice: the first entry's rank, and its position for the entries after it
+    first_user, _, first_total = rows[0]
+    total, user = leaderboard.c.total_discount, leaderboard.c.user_id
+    higher, ahead = db.session.execute(select(
+        func.coalesce(func.sum(case((total > first_total, 1), else_=0)), 0),
+        func.coalesce(func.sum(case((or_(total > first_total, and_(total == first_total, user < first_user)), 1),
+                                    else_=0)), 0)
+    ).select_from(leaderboard)).one()
+
+    rankings = []
+    for position, (user_id, user_name, total_discount) in enumerate(rows):
         total_discount = float(total_discount or 0.0)
-        user_rankings.append({
+        if not rankings:
+            rank = higher + 1
+        elif total_discount == rankings[-1]['total_discount']:
+            rank = rankings[-1]['rank']
+        else:
+            rank = ahead + position + 1
+        rankings.append({
             'rank': rank,
             'user_id': user_id,
             'user_name': user_name,
             'total_discount': total_discount
         })
-        rank += 1
+    return rankings
+
+
+def _select_ranked(leaderboard):
+    return select(leaderboard.c.user_id, User.name, leaderboard.c.total_discount) \
+        .join(User, User.id == leaderboard.c.user_id)
+
+
+def _rankings_page(limit, offset):
+    leaderboard = _monthly_leaderboard()
+    query = _select_ranked(leaderboard) \
+        .order_by(leaderboard.c.total_discount.desc(), leaderboard.c.user_id) \
+        .offset(offset or 0)
+    if limit is not None:
+        query = query.limit(min(limit, MAX_RANKINGS_PAGE_SIZE))
+    return _ranked_rows(leaderboard, db.session.execute(query).all())
+
+
+def _store_rankings(entries):
+    """Ranking dicts of leaderboard store entries, with the user names read in one query."""
+    names = dict(db.session.query(User.id, User.name).filter(User.id.in_([user_id for user_id, _, _ in entries])))
+    return [{
+        'rank': rank,
+        'user_id': user_id,
+        'user_name': names.get(user_id),
+        'total_discount': round(score, 2)
+    } for user_id, score, rank in entries]
+
+
+def get_user_rankings(limit=None, offset=0):
+    """
+    Retrieves a JSON response with user rankings based on the total discount earned.
+
+    Reads the leaderboard store; limit and offset select a page of it.
+    """
+    if limit is not None:
+        limit = min(limit, MAX_RANKINGS_PAGE_SIZE)
+    return _store_rankings(discount_leaderboard.page(offset, limit)), 200
 
-    return user_rankings, 200
 
 def get_single_user_rank(user_id):
     """
@@ -66,187 +265,88 @@ def get_single_user_rank(user_id):
     if not user:
         return {'error': 'User not found'}, 404
 
-    # Calculate the user's total discount earned
-    user_discount = db.session.query(
-        func.sum(DiscountEarned.discount).label('total_discount')
-    ).filter(DiscountEarned.user_id == user_id).scalar()
-
-    user_discount = float(user_discount or 0.0)
-
-    # Count the number of users with a higher total discount
-    higher_ranked_count = db.session.query(func.count()) \
-        .select_from(
-            db.session.query(
-                DiscountEarned.user_id,
-                func.sum(DiscountEarned.discount).label('total_disc')
-            ).group_by(DiscountEarned.user_id)
-             .having(func.sum(DiscountEarned.discount) > user_discount)
-             .subquery()
-        ).scalar()
-
-    rank = higher_ranked_count + 1
-
     return {
         'user_id': user_id,
         'user_name': user.name,
-        'rank': rank,
-        'total_discount': user_discount
+        'rank': discount_leaderboard.rank(user_id),
+        'total_discount': round(discount_leaderboard.score(user_id), 2)
     }, 200
 
+
 def get_single_user_monthly_rank(user_id):
     """
     Retrieves the ranking information for a single user based on the total discount
     earned in the last 30 days.
     """
-    from datetime import datetime, timedelta
-
     user = User.query.filter_by(id=user_id).first()
     if not user:
         return jsonify({'error': 'User not found'}), 404
 
-    thirty_days_ago = datetime.now() - timedelta(days=30)
-
-    # User's discount in the last 30 days
-    user_discount = db.session.query(
-        func.sum(DiscountEarned.discount).label('total_discount')
-    ).filter(
-        DiscountEarned.user_id == user_id,
-        DiscountEarned.earned_at >= thirty_days_ago
-    ).scalar()
-
-    user_discount = float(user_discount or 0.0)
-
-    # Count how many users have higher total discount in last 30 days
-    higher_ranked_count = db.session.query(func.count()) \
-        .select_from(
-            db.session.query(
-                DiscountEarned.user_id,
-                func.sum(DiscountEarned.discount).label('total_disc')
-            )
-            .filter(DiscountEarned.earned_at >= thirty_days_ago)
-            .group_by(DiscountEarned.user_id)
-            .having(func.sum(DiscountEarned.discount) > user_discount)
-            .subquery()
-        ).scalar()
-
-    rank = higher_ranked_count + 1
+    leaderboard = _monthly_leaderboard()
+    user_discount = _total_of(leaderboard, user_id)
 
     return jsonify({
         'user_id': user_id,
         'user_name': user.name,
-        'rank': rank,
-        'total_discount': user_discount
-    }),200
+        'rank': _rank_of(leaderboard, user_discount),
+        'total_discount': float(user_discount)
+    }), 200
 
-def get_monthly_user_rankings():
+
+def get_monthly_user_rankings(limit=None, offset=0):
     """
     Retrieves a JSON response with user rankings based on the total discount earned
     in the last 30 days.
     """
-    from datetime import datetime, timedelta
-
-    thirty_days_ago = datetime.now() - timedelta(days=30)
-
-    results = db.session.query(
-                DiscountEarned.user_id.label('user_id'),
-                User.name.label('user_name'),
-                func.sum(DiscountEarned.discount).label('total_discount')
-            ) \
-            .join(User, User.id == DiscountEarned.user_id) \
-            .filter(DiscountEarned.earned_at >= thirty_days_ago) \
-            .group_by(DiscountEarned.user_id) \
-            .order_by(func.sum(DiscountEarned.discount).desc()) \
-            .all()
+    return jsonify(_rankings_page(limit, offset))
 
-    user_rankings = []
-    rank = 1
-    for user_id, user_name, total_discount in results:
-        total_discount = float(total_discount or 0.0)
-        user_rankings.append({
-            'rank': rank,
-            'user_id': user_id,
-            'user_name': user_name,
-            'total_discount': total_discount
-        })
-        rank += 1
 
-    return jsonify(user_rankings)
-
-def get_single_user_monthly_rank(user_id):
-    """
-    Retrieves the ranking information for a single user based on the total discount
-    earned in the last 30 days.
+def get_user_rank_neighbourhood(user_id, radius=DEFAULT_NEIGHBOURHOOD_RADIUS, monthly=False):
     """
-    from datetime import datetime, timedelta
+    Retrieves the user's ranking entry with up to radius entries above and below it.
 
+    All-time entries are a range of the leaderboard store around the user.
+    Monthly ones are keyset queries on both sides of the user, so neither
+    costs more the further down the user ranks.
+    """
     user = User.query.filter_by(id=user_id).first()
     if not user:
-        return jsonify({'error': 'User not found'}), 404
-
-    thirty_days_ago = datetime.now() - timedelta(days=30)
-
-    # User's discount in the last 30 days
-    user_discount = db.session.query(
-        func.sum(DiscountEarned.discount).label('total_discount')
-    ).filter(
-        DiscountEarned.user_id == user_id,
-        DiscountEarned.earned_at >= thirty_days_ago
-    ).scalar()
-
-    user_discount = float(user_discount or 0.0)
-
-    # Count how many users have higher total discount in last 30 days
-    higher_ranked_count = db.session.query(func.count()) \
-        .select_from(
-            db.session.query(
-                DiscountEarned.user_id,
-                func.sum(DiscountEarned.discount).label('total_disc')
-            )
-            .filter(DiscountEarned.earned_at >= thirty_days_ago)
-            .group_by(DiscountEarned.user_id)
-            .having(func.sum(DiscountEarned.discount) > user_discount)
-            .subquery()
-        ).scalar()
-
-    rank = higher_ranked_count + 1
-
-    return jsonify({
-        'user_id': user_id,
-        'user_name': user.name,
-        'rank': rank,
-        'total_discount': user_discount
-    }),200
-
-def get_monthly_user_rankings():
-    """
-    Retrieves a JSON response with user rankings based on the total discount earned
-    in the last 30 days.
-    """
-    from datetime import datetime, timedelta
-
-    thirty_days_ago = datetime.now() - timedelta(days=30)
-
-    results = db.session.query(
-                DiscountEarned.user_id.label('user_id'),
-                User.name.label('user_name'),
-                func.sum(DiscountEarned.discount).label('total_discount')
-            ) \
-            .join(User, User.id == DiscountEarned.user_id) \
-            .filter(DiscountEarned.earned_at >= thirty_days_ago) \
-            .group_by(DiscountEarned.user_id) \
-            .order_by(func.sum(DiscountEarned.discount).desc()) \
-            .all()
+        return {'error': 'User not found'}, 404
+    if radius < 0 or radius > MAX_NEIGHBOURHOOD_RADIUS:
+        return {'error': f'radius must be between 0 and {MAX_NEIGHBOURHOOD_RADIUS}'}, 400
 
-    user_rankings = []
-    rank = 1
-    for user_id, user_name, total_discount in results:
-        total_discount = float(total_discount or 0.0)
-        user_rankings.append({
-            'rank': rank,
+    if not monthly:
+        entries, index = discount_leaderboard.around(user_id, radius)
+        rankings = _store_rankings(entries)
+        return {
             'user_id': user_id,
-            'user_name': user_name,
-            'total_discount': total_discount
-        })
-        rank += 1
-
-    return jsonify(user_rankings)
+            'rank': rankings[index]['rank'],
+            'total_discount': rankings[index]['total_discount'],
+            'rankings': rankings
+        }, 200
+
+    leaderboard = _monthly_leaderboard()
+    user_discount = _total_of(leaderboard, user_id)
+    total, other_user = leaderboard.c.total_discount, leaderboard.c.user_id
+
+    # Leaderboard order is total descending, then user id
+    above = db.session.execute(
+        _select_ranked(leaderboard)
+        .where(or_(total > user_discount, and_(total == user_discount, other_user < user_id)))
+        .order_by(total.asc(), other_user.desc())
+        .limit(radius)
+    ).all()
+    below = db.session.execute(
+        _select_ranked(leaderboard)
+        .where(or_(total < user_discount, and_(total == user_discount, other_user > user_id)))
+        .order_by(total.desc(), other_user)
+        .limit(radius)
+    ).all()
+
+    rankings = _ranked_rows(leaderboard, list(reversed(above)) + [(user_id, user.name, user_discount)] + below)
+    return {
+        'user_id': user_id,
+        'rank': rankings[len(above)]['rank'],
+        'total_discount': float(user_discount),
+        'rankings': rankings
+    }, 200
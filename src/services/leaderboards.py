@@ -0,0 +1,147 @@
+import os
+from typing import Callable, Iterable, List, Optional, Tuple
+
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+from src.utils.leaderboard_store import InMemoryLeaderboardStore, LeaderboardStore, RedisLeaderboardStore
+
+LEADERBOARD_STORE_KEY = 'leaderboard_store'
+# Leaderboards are Redis sorted sets shared by all workers when this is set, per process otherwise
+LEADERBOARD_REDIS_URL_ENV = 'LEADERBOARD_REDIS_URL'
+# Per-process boards miss the increments of other workers, so they are re-seeded this often
+IN_MEMORY_LEADERBOARD_MAX_AGE_SECONDS = 60
+_PENDING_INCREMENTS_KEY = 'pending_leaderboard_increments'
+
+
+def get_leaderboard_store() -> LeaderboardStore:
+    """Return the leaderboard store of the current app, creating it on first use."""
+    store = current_app.extensions.get(LEADERBOARD_STORE_KEY)
+    if store is None:
+        url = os.environ.get(LEADERBOARD_REDIS_URL_ENV)
+        if url:
+            # Only deployments that configure Redis need the client installed
+            import redis
+            store = RedisLeaderboardStore(redis.Redis.from_url(url))
+        else:
+            store = InMemoryLeaderboardStore(max_age_seconds=IN_MEMORY_LEADERBOARD_MAX_AGE_SECONDS)
+        store = current_app.extensions.setdefault(LEADERBOARD_STORE_KEY, store)
+    return store
+
+# Ranking entry: (user id, score, rank)
+RankingEntry = Tuple[int, float, int]
+
+
+class Leaderboard:
+    """
+    A user ranking kept in the leaderboard store.
+
+    Events write to it as they are committed, see queue_increment. The first
+    read of a board the store does not hold yet, after a deploy or a Redis
+    restart, seeds it from the database with load_scores; reload() re-seeds
+    it to repair any drift. Ranks are competition ranks: users with equal
+    scores share a rank.
+
+    Scores are stored as whole multiples of 10 ** -decimals, so sums of
+    amounts like 0.10 stay exact and equal totals really tie.
+    """
+
+    def __init__(self, name: str, load_scores: Callable[[], Iterable[Tuple[int, float]]], decimals: int = 2):
+        self.name = name
+        self.load_scores = load_scores
+        self.scale = 10 ** decimals
+
+    def _stored(self, amount) -> float:
+        return float(round(float(amount or 0) * self.scale))
+
+    @property
+    def store(self) -> LeaderboardStore:
+        return get_leaderboard_store()
+
+    def reload(self) -> dict:
+        """Seed the board from the database. Needs an app context."""
+        scores = {str(user_id): self._stored(score) for user_id, score in self.load_scores()}
+        self.store.replace(self.name, scores)
+        return {"members": len(scores)}
+
+    def _loaded_store(self) -> LeaderboardStore:
+        store = self.store
+        if not store.exists(self.name):
+            self.reload()
+        return store
+
+    def record(self, user_id: int, amount: float) -> None:
+        """Add amount to the user's score, unless the board is not loaded yet and will be seeded with it."""
+        store = self.store
+        if store.exists(self.name):
+            store.increment(self.name, str(user_id), self._stored(amount))
+
+    def score(self, user_id: int) -> float:
+        return (self._loaded_store().score(self.name, str(user_id)) or 0.0) / self.scale
+
+    def rank(self, user_id: int) -> int:
+        store = self._loaded_store()
+        return store.count_above(self.name, store.score(self.name, str(user_id)) or 0.0) + 1
+
+    def _ranked(self, store: LeaderboardStore, start: int, entries: List[Tuple[str, float]]) -> List[RankingEntry]:
+        """Rank a slice of the board starting at position start; one count places its first entry."""
+        ranked: List[RankingEntry] = []
+        for position, (member, score) in enumerate(entries, start=start):
+            if not ranked:
+                rank = store.count_above(self.name, score) + 1
+            elif score / self.scale == ranked[-1][1]:
+                rank = ranked[-1][2]
+            else:
+                rank = position + 1
+            ranked.append((int(member), score / self.scale, rank))
+        return ranked
+
+    def page(self, offset: int = 0, limit: Optional[int] = None) -> List[RankingEntry]:
+        """Entries from position offset, highest score first, all of them without a limit."""
+        store = self._loaded_store()
+        offset = max(offset or 0, 0)
+        stop = store.size(self.name) - 1 if limit is None else offset + limit - 1
+        return self._ranked(store, offset, store.range(self.name, offset, stop))
+
+    def around(self, user_id: int, radius: int) -> Tuple[List[RankingEntry], int]:
+        """
+        Up to radius entries above and below the user, and the user's index in them.
+
+        A user not on the board is placed, with score 0, ahead of the entries
+        scoring 0 or less.
+        """
+        store = self._loaded_store()
+        position = store.position(self.name, str(user_id))
+        if position is not None:
+            start = max(position - radius, 0)
+            entries = self._ranked(store, start, store.range(self.name, start, position + radius))
+            return entries, position - start
+
+        position = store.count_above(self.name, 0.0)
+        start = max(position - radius, 0)
+        above = self._ranked(store, start, store.range(self.name, start, position - 1))
+        below = self._ranked(store, position, store.range(self.name, position, position + radius - 1))
+        return above + [(user_id, 0.0, position + 1)] + below, len(above)
+
+
+def queue_increment(target, leaderboard: Leaderboard, user_id: int, amount: float) -> None:
+    """From a mapper event: add amount to the user's score once the target's session commits."""
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault(_PENDING_INCREMENTS_KEY, []).append((leaderboard, user_id, amount))
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_leaderboard_increments(session):
+    increments = session.info.pop(_PENDING_INCREMENTS_KEY, None)
+    if not increments or not has_app_context():
+        return
+
+    for leaderboard, user_id, amount in increments:
+        leaderboard.record(user_id, amount)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_leaderboard_increments(session):
+    session.info.pop(_PENDING_INCREMENTS_KEY, None)
@@ -104,9 +104,9 @@ def get_listings_service(restaurant_id, page, per_page, url_for_func):
             "pick_up_price": float(listing.pick_up_price) if listing.pick_up_price else None,
             "delivery_price": float(listing.delivery_price) if listing.delivery_price else None,
             "count": listing.count,
-            "consume_within": listing.consume_within,
-            "consume_within_type": listing.consume_within_type,
-            "fresh_score": round(listing.fresh_score, 2),
+            "consume_within": listing.current_consume_within,
+            "consume_within_type": listing.current_consume_within_type,
+            "fresh_score": round(listing.current_fresh_score, 2),
             "update_count": listing.update_count,
             "expires_at": listing.expires_at.strftime("%Y-%m-%d %H:%M:%S"),
             "available_for_delivery": listing.available_for_delivery,
@@ -172,9 +172,9 @@ def search_service(search_type, query_text, restaurant_id):
                 "image_url": image_url,
                 "original_price": float(listing.original_price),
                 "count": listing.count,
-                "fresh_score": round(listing.fresh_score, 2),
-                "consume_within": listing.consume_within,
-                "consume_within_type": listing.consume_within_type,
+                "fresh_score": round(listing.current_fresh_score, 2),
+                "consume_within": listing.current_consume_within,
+                "consume_within_type": listing.current_consume_within_type,
             })
 
         return {"success": True, "type": "listing", "results": data}, 200
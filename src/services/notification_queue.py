@@ -0,0 +1,294 @@
+import json
+import logging
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta, UTC
+from typing import Any, Dict, List, Optional
+
+from flask import current_app, has_app_context
+from sqlalchemy import and_, func, or_, update
+
+from src.models import db, NotificationOutbox
+
+logger = logging.getLogger(__name__)
+
+# Number of recent deliveries the latency metrics are computed over
+LATENCY_SAMPLE_SIZE = 1000
+# How often each process polls the Expo receipts of the tickets it was issued
+RECEIPT_POLL_INTERVAL_SECONDS = 15 * 60
+
+
+def _as_utc(value: Optional[datetime]) -> Optional[datetime]:
+    """Datetimes come back naive from most drivers, they are always stored in UTC."""
+    if value is not None and value.tzinfo is None:
+        return value.replace(tzinfo=UTC)
+    return value
+
+
+def _deliver(channel: str, user_id: int, payload: Dict[str, Any]) -> bool:
+    # Imported here, the notification services enqueue through this module
+    if channel == NotificationOutbox.CHANNEL_EXPO:
+        from src.services.notification_service import NotificationService
+        return NotificationService.deliver_notification_to_user(user_id, **payload)
+    if channel == NotificationOutbox.CHANNEL_WEB:
+        from src.services.web_push_notification_service import WebPushNotificationService
+        return WebPushNotificationService.deliver_notification_to_user_web(user_id, **payload)
+    raise ValueError(f"Unknown notification channel: {channel}")
+
+
+class NotificationQueue:
+    """
+    Durable notification queue backed by the notification_outbox table.
+
+    Request handlers insert a row and return; worker threads claim due rows
+    with a conditional UPDATE, deliver them and mark them sent. A row that was
+    claimed but never finished (e.g. the process died mid-delivery) is claimed
+    again once its lease expires, so every notification is delivered at least
+    once, possibly more than once.
+
+    The workers also poll the Expo receipts of this process's sends, as the
+    tickets are only kept in the memory of the process that was issued them.
+    """
+
+    def __init__(self,
+                 workers: int = 2,
+                 batch_size: int = 20,
+                 poll_interval_seconds: float = 2.0,
+                 max_attempts: int = 5,
+                 retry_backoff_seconds: float = 30,
+                 lease_seconds: float = 300,
+                 receipt_poll_interval_seconds: float = RECEIPT_POLL_INTERVAL_SECONDS):
+        self.workers = workers
+        self.batch_size = batch_size
+        self.poll_interval_seconds = poll_interval_seconds
+        self.max_attempts = max_attempts
+        self.retry_backoff_seconds = retry_backoff_seconds
+        self.lease_seconds = lease_seconds
+        self.receipt_poll_interval_seconds = receipt_poll_interval_seconds
+
+        self._threads: List[threading.Thread] = []
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=LATENCY_SAMPLE_SIZE)
+        self._delivered = 0
+        self._retried = 0
+        self._failed = 0
+        self._next_receipt_poll = 0.0
+
+    @staticmethod
+    def is_async() -> bool:
+        """Without an app context, or with BACKGROUND_TASKS_ASYNC off, deliver inline."""
+        if not has_app_context():
+            return False
+        return current_app.config.get('BACKGROUND_TASKS_ASYNC', not current_app.testing)
+
+    def enqueue(self, channel: str, user_id: int, payload: Dict[str, Any]) -> bool:
+        """
+        Store a notification in the outbox and wake up a worker.
+
+        Args:
+            channel (str): NotificationOutbox.CHANNEL_EXPO or CHANNEL_WEB
+            user_id (int): The ID of the recipient
+            payload (Dict[str, Any]): Keyword arguments of the channel's deliver function
+
+        Returns:
+            bool: Whether the notification was stored
+        """
+        try:
+            db.session.add(NotificationOutbox(
+                channel=channel,
+                user_id=user_id,
+                payload=json.dumps(payload, default=str),
+            ))
+            db.session.commit()
+            self._wake.set()
+            return True
+
+        except Exception as e:
+            logger.error(f"Error queueing {channel} notification for user {user_id}: {str(e)}")
+            db.session.rollback()
+            return False
+
+    def _claimable(self, now: datetime):
+        stale = now - timedelta(seconds=self.lease_seconds)
+        return or_(
+            and_(NotificationOutbox.status == NotificationOutbox.STATUS_PENDING,
+                 NotificationOutbox.available_at <= now),
+            and_(NotificationOutbox.status == NotificationOutbox.STATUS_PROCESSING,
+                 NotificationOutbox.locked_at < stale),
+        )
+
+    def _claim(self) -> List[int]:
+        now = datetime.now(UTC)
+        candidate_ids = [row.id for row in db.session.query(NotificationOutbox.id).filter(
+            self._claimable(now)
+        ).order_by(NotificationOutbox.available_at).limit(self.batch_size)]
+
+        claimed = []
+        for outbox_id in candidate_ids:
+            # Only one worker, in any process, can win the conditional update
+            result = db.session.execute(
+                update(NotificationOutbox)
+                .where(NotificationOutbox.id == outbox_id, self._claimable(now))
+                .values(status=NotificationOutbox.STATUS_PROCESSING,
+                        locked_at=now,
+                        attempts=NotificationOutbox.attempts + 1)
+                .execution_options(synchronize_session=False)
+            )
+            if result.rowcount == 1:
+                claimed.append(outbox_id)
+        db.session.commit()
+        return claimed
+
+    def process_batch(self) -> int:
+        """
+        Claim and deliver one batch of due notifications.
+
+        Returns:
+            int: Number of notifications processed
+        """
+        claimed = self._claim()
+
+        for outbox_id in claimed:
+            entry = db.session.get(NotificationOutbox, outbox_id)
+            try:
+                delivered = _deliver(entry.channel, entry.user_id, entry.payload_data)
+                error = None if delivered else "Delivery failed"
+            except Exception as e:
+                delivered = False
+                error = str(e)
+
+            now = datetime.now(UTC)
+            entry.locked_at = None
+            if delivered:
+                entry.status = NotificationOutbox.STATUS_SENT
+                entry.sent_at = now
+                entry.last_error = None
+            elif entry.attempts >= self.max_attempts:
+                entry.status = NotificationOutbox.STATUS_FAILED
+                entry.last_error = error
+                logger.error(f"Giving up on notification {entry.id} after {entry.attempts} attempts: {error}")
+            else:
+                entry.status = NotificationOutbox.STATUS_PENDING
+                entry.available_at = now + timedelta(
+                    seconds=self.retry_backoff_seconds * (2 ** (entry.attempts - 1)))
+                entry.last_error = error
+
+            # Commit per entry, so a crash never loses a delivery that was already recorded
+            db.session.commit()
+
+            with self._lock:
+                if delivered:
+                    self._delivered += 1
+                    self._latencies.append((now - _as_utc(entry.created_at)).total_seconds())
+                elif entry.status == NotificationOutbox.STATUS_FAILED:
+                    self._failed += 1
+                else:
+                    self._retried += 1
+
+        return len(claimed)
+
+    def poll_receipts_if_due(self) -> int:
+        """
+        Poll the push receipts of this process, at most once per receipt poll interval.
+
+        Returns:
+            int: Number of tokens deactivated, 0 if no poll was due
+        """
+        now = time.monotonic()
+        with self._lock:
+            if now < self._next_receipt_poll:
+                return 0
+            self._next_receipt_poll = now + self.receipt_poll_interval_seconds
+
+        from src.services.notification_service import NotificationService
+        return NotificationService.process_push_receipts()
+
+    def _run(self, app) -> None:
+        while not self._stop.is_set():
+            processed = 0
+            try:
+                with app.app_context():
+                    processed = self.process_batch()
+                    self.poll_receipts_if_due()
+            except Exception as e:
+                logger.error(f"Notification worker error: {str(e)}")
+
+            if not processed:
+                self._wake.wait(self.poll_interval_seconds)
+                self._wake.clear()
+
+    def start(self, app) -> None:
+        """Start the worker threads for the given app, unless they are running already."""
+        with self._lock:
+            if any(thread.is_alive() for thread in self._threads):
+                return
+            self._stop.clear()
+            self._threads = [
+                threading.Thread(target=self._run, args=(app,), name=f"notification-worker-{i}", daemon=True)
+                for i in range(self.workers)
+            ]
+        for thread in self._threads:
+            thread.start()
+        logger.info(f"Started {self.workers} notification workers")
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stop.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def purge_sent(self, older_than_days: int = 7) -> int:
+        """Delete sent notifications older than the given number of days."""
+        threshold = datetime.now(UTC) - timedelta(days=older_than_days)
+        deleted = NotificationOutbox.query.filter(
+            NotificationOutbox.status == NotificationOutbox.STATUS_SENT,
+            NotificationOutbox.sent_at < threshold
+        ).delete(synchronize_session=False)
+        db.session.commit()
+        return deleted
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """
+        Queue depth from the outbox table plus delivery counters and
+        enqueue-to-delivery latency of this process's workers.
+        """
+        counts = dict(db.session.query(
+            NotificationOutbox.status, func.count(NotificationOutbox.id)
+        ).group_by(NotificationOutbox.status).all())
+
+        oldest_pending = _as_utc(db.session.query(func.min(NotificationOutbox.created_at)).filter(
+            NotificationOutbox.status == NotificationOutbox.STATUS_PENDING
+        ).scalar())
+
+        with self._lock:
+            latencies = sorted(self._latencies)
+            delivered, retried, failed = self._delivered, self._retried, self._failed
+            workers_alive = sum(1 for thread in self._threads if thread.is_alive())
+
+        def percentile(p):
+            return round(latencies[min(int(len(latencies) * p), len(latencies) - 1)], 3) if latencies else None
+
+        return {
+            "depth": counts.get(NotificationOutbox.STATUS_PENDING, 0) + counts.get(NotificationOutbox.STATUS_PROCESSING, 0),
+            "by_status": counts,
+            "oldest_pending_age_seconds": (
+                round((datetime.now(UTC) - oldest_pending).total_seconds(), 3) if oldest_pending else None
+            ),
+            "workers_alive": workers_alive,
+            "delivered": delivered,
+            "retried": retried,
+            "failed": failed,
+            "latency_seconds": {
+                "samples": len(latencies),
+                "avg": round(sum(latencies) / len(latencies), 3) if latencies else None,
+                "p50": percentile(0.5),
+                "p95": percentile(0.95),
+                "max": round(latencies[-1], 3) if latencies else None,
+            },
+        }
+
+
+notification_queue = NotificationQueue()
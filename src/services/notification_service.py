@@ -1,8 +1,10 @@
 import logging
-import requests
 from datetime import datetime, timedelta, UTC
-from typing import List, Dict, Any, Tuple
-from src.models import db, UserDevice
+from typing import List, Dict, Any, Tuple, Iterable
+from sqlalchemy import or_
+from src.models import db, UserDevice, NotificationOutbox
+from src.services.expo_push_dispatcher import EXPO_PUSH_URL, EXPO_PUSH_BATCH_SIZE, get_push_dispatcher
+from src.services.notification_queue import NotificationQueue, notification_queue
 
 logger = logging.getLogger(__name__)
 
@@ -10,13 +12,18 @@ logger = logging.getLogger(__name__)
 class NotificationService:
     """Service class for handling push notifications and device token management."""
 
-    EXPO_PUSH_API = "https://exp.host/--/api/v2/push/send"
+    EXPO_PUSH_API = EXPO_PUSH_URL
+    EXPO_BATCH_SIZE = EXPO_PUSH_BATCH_SIZE
+    # Delay before polling receipts, as recommended by Expo
+    RECEIPT_CHECK_DELAY_SECONDS = 15 * 60
+    # Stay well below the 2100 bind parameter limit of SQL Server
+    USER_ID_QUERY_CHUNK_SIZE = 1000
 
     @staticmethod
     def clean_token(token: str) -> str:
         """Remove Expo wrapper from token for storage."""
-        if token.startswith('ExponentPushToken['):
-            return token[17:-1]  # Remove 'ExponentPushToken[' and ']'
+        if token.startswith('ExponentPushToken[') and token.endswith(']'):
+            return token[len('ExponentPushToken['):-1]  # Remove 'ExponentPushToken[' and ']'
         return token
 
     @staticmethod
@@ -121,38 +128,47 @@ class NotificationService:
 
             logger.info(f"Sending push notification to {len(tokens)} devices")
 
-            response = requests.post(
-                NotificationService.EXPO_PUSH_API,
-                json=notifications,
-                headers={
-                    "Accept": "application/json",
-                    "Accept-encoding": "gzip, deflate",
-                    "Content-Type": "application/json",
-                },
-                timeout=10  # Add timeout to prevent hanging
-            )
+            result = get_push_dispatcher().send(notifications)
 
-            if response.status_code == 200:
-                response_data = response.json()
-                # Log any errors from Expo
-                if 'errors' in response_data:
-                    logger.error(f"Expo API returned errors: {response_data['errors']}")
-                logger.info("Push notifications sent successfully")
-                return True
-            else:
-                logger.error(f"Push notification failed with status {response.status_code}: {response.text}")
+            # Tokens Expo reports as unregistered will never receive anything again
+            for token in result["dead_tokens"]:
+                NotificationService.deactivate_token(token)
+
+            if result["failed_batches"]:
+                logger.error(f"{result['failed_batches']} push notification batches failed")
                 return False
 
-        except requests.exceptions.Timeout:
-            logger.error("Timeout while sending push notification")
-            return False
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Network error while sending push notification: {str(e)}")
-            return False
+            logger.info(f"Push notifications sent successfully ({result['sent']} accepted)")
+            return True
+
         except Exception as e:
             logger.error(f"Error sending push notification: {str(e)}")
             return False
 
+    @staticmethod
+    def process_push_receipts(min_age_seconds: float = RECEIPT_CHECK_DELAY_SECONDS) -> int:
+        """
+        Poll the receipts of earlier sends and deactivate tokens of devices
+        that are no longer registered.
+
+        Args:
+            min_age_seconds (float): Only check tickets at least this old, Expo
+                recommends waiting about 15 minutes
+
+        Returns:
+            int: Number of tokens deactivated
+        """
+        try:
+            dead_tokens = get_push_dispatcher().check_receipts(min_age_seconds)
+            deactivated = sum(1 for token in dead_tokens if NotificationService.deactivate_token(token))
+            if dead_tokens:
+                logger.info(f"Deactivated {deactivated} tokens from push receipts")
+            return deactivated
+
+        except Exception as e:
+            logger.error(f"Error processing push receipts: {str(e)}")
+            return 0
+
     @staticmethod
     def send_notification_to_user(
             user_id: int,
@@ -161,7 +177,11 @@ class NotificationService:
             data: Dict[str, Any] = None
     ) -> bool:
         """
-        Send a push notification to all active devices of a user.
+        Queue a push notification to all active devices of a user.
+
+        The notification is stored in the outbox and delivered by the
+        notification workers, or delivered right away when background tasks
+        run inline (see NotificationQueue.is_async).
 
         Args:
             user_id (int): The ID of the user
@@ -173,17 +193,49 @@ class NotificationService:
             bool: Success status
         """
         try:
-            # Get active devices for the user
-            devices = UserDevice.query.filter_by(
-                user_id=user_id,
-                is_active=True
-            ).all()
+            if not NotificationQueue.is_async():
+                return NotificationService.deliver_notification_to_user(user_id, title, body, data)
 
-            if not devices:
+            if not NotificationService.get_active_tokens_by_user([user_id]):
+                logger.warning(f"No active devices found for user {user_id}")
+                return False
+
+            return notification_queue.enqueue(
+                NotificationOutbox.CHANNEL_EXPO,
+                user_id,
+                {"title": title, "body": body, "data": data}
+            )
+
+        except Exception as e:
+            logger.error(f"Error queueing notification for user {user_id}: {str(e)}")
+            return False
+
+    @staticmethod
+    def deliver_notification_to_user(
+            user_id: int,
+            title: str,
+            body: str,
+            data: Dict[str, Any] = None
+    ) -> bool:
+        """
+        Send a push notification to all active devices of a user right away.
+
+        Args:
+            user_id (int): The ID of the user
+            title (str): Notification title
+            body (str): Notification body
+            data (Dict[str, Any], optional): Additional data to send
+
+        Returns:
+            bool: Success status
+        """
+        try:
+            tokens = NotificationService.get_active_tokens_by_user([user_id]).get(user_id)
+
+            if not tokens:
                 logger.warning(f"No active devices found for user {user_id}")
                 return False
 
-            tokens = [device.push_token for device in devices]
             logger.info(f"Sending notification to user {user_id} ({len(tokens)} devices)")
             return NotificationService.send_push_notification(tokens, title, body, data)
 
@@ -191,6 +243,79 @@ class NotificationService:
             logger.error(f"Error sending notification to user {user_id}: {str(e)}")
             return False
 
+    @staticmethod
+    def get_active_tokens_by_user(user_ids: Iterable[int]) -> Dict[int, List[str]]:
+        """
+        Load the active mobile push tokens of many users.
+
+        Args:
+            user_ids (Iterable[int]): The IDs of the users
+
+        Returns:
+            Dict[int, List[str]]: Push tokens keyed by user ID, users without
+            active devices are left out
+        """
+        user_ids = list(user_ids)
+        tokens_by_user: Dict[int, List[str]] = {}
+        for start in range(0, len(user_ids), NotificationService.USER_ID_QUERY_CHUNK_SIZE):
+            chunk = user_ids[start:start + NotificationService.USER_ID_QUERY_CHUNK_SIZE]
+            rows = db.session.query(UserDevice.user_id, UserDevice.push_token).filter(
+                UserDevice.user_id.in_(chunk),
+                UserDevice.is_active == True,
+                # Web devices only hold a placeholder push_token, they are reached via web push
+                or_(UserDevice.device_type.is_(None), UserDevice.device_type != "web")
+            ).all()
+            for user_id, push_token in rows:
+                tokens_by_user.setdefault(user_id, []).append(push_token)
+        return tokens_by_user
+
+    @staticmethod
+    def send_notification_to_users(
+            user_ids: Iterable[int],
+            title: str,
+            body: str,
+            data: Dict[str, Any] = None
+    ) -> int:
+        """
+        Send the same push notification to all active devices of many users,
+        loading their tokens in one pass and sending in Expo-sized batches.
+
+        Args:
+            user_ids (Iterable[int]): The IDs of the users
+            title (str): Notification title
+            body (str): Notification body
+            data (Dict[str, Any], optional): Additional data to send
+
+        Returns:
+            int: Number of users whose devices were all sent to successfully
+        """
+        try:
+            tokens_by_user = NotificationService.get_active_tokens_by_user(user_ids)
+            if not tokens_by_user:
+                logger.warning("No active devices found for the given users")
+                return 0
+
+            recipients = [
+                (user_id, token)
+                for user_id, tokens in tokens_by_user.items()
+                for token in tokens
+            ]
+
+            failed_users = set()
+            for start in range(0, len(recipients), NotificationService.EXPO_BATCH_SIZE):
+                batch = recipients[start:start + NotificationService.EXPO_BATCH_SIZE]
+                if not NotificationService.send_push_notification([token for _, token in batch], title, body, data):
+                    failed_users.update(user_id for user_id, _ in batch)
+
+            notified_count = len(tokens_by_user) - len(failed_users)
+            logger.info(f"Sent notification to {notified_count}/{len(tokens_by_user)} users "
+                        f"({len(recipients)} devices)")
+            return notified_count
+
+        except Exception as e:
+            logger.error(f"Error sending notification to users: {str(e)}")
+            return 0
+
     @staticmethod
     def deactivate_token(token: str) -> bool:
         """
@@ -0,0 +1,194 @@
+import logging
+import threading
+import time
+from datetime import datetime, UTC
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import and_, delete, func, insert
+
+from src.models import db, Purchase, PurchaseStatus, Restaurant, RestaurantPopularity
+from src.utils.background import run_in_background
+from src.utils.geo import geohash
+
+logger = logging.getLogger(__name__)
+
+SCOPE_GLOBAL = 'global'
+SCOPE_CATEGORY = 'category'
+SCOPE_CELL = 'cell'
+
+# Ranking key: (scope, scope key)
+RankingKey = Tuple[str, str]
+
+
+class PopularityIndex:
+    """
+    "Most purchased" restaurant rankings for cold-start recommendations.
+
+    Keeps one ranking overall, one per restaurant category and one per
+    geohash cell at each of cell_precisions, each list_size long. Restaurants
+    nobody bought from yet rank last, so every area that has restaurants gets
+    a list.
+
+    refresh() recomputes the rankings with a single aggregate query and
+    persists them to restaurant_popularity; it runs as a scheduled job on one
+    process. Every process serves lookups from memory and reloads the
+    persisted rankings in the background once they are older than
+    reload_interval_seconds.
+    """
+
+    def __init__(self,
+                 list_size: int = 10,
+                 cell_precisions: Sequence[int] = (5, 4),
+                 reload_interval_seconds: float = 300):
+        self.list_size = list_size
+        self.cell_precisions = tuple(cell_precisions)
+        self.reload_interval_seconds = reload_interval_seconds
+
+        self._rankings: Optional[Dict[RankingKey, List[int]]] = None
+        self.generated_at: Optional[datetime] = None
+        self._loaded_at = 0.0
+        self._reloading = False
+        self._lock = threading.Lock()
+
+    def compute(self) -> Dict[RankingKey, List[Tuple[int, int]]]:
+        """Rank restaurants by completed purchases. Returns (restaurant id, purchase count) lists by ranking."""
+        purchase_count = func.count(Purchase.id)
+        rows = db.session.query(
+            Restaurant.id, Restaurant.category, Restaurant.latitude, Restaurant.longitude, purchase_count
+        ).outerjoin(
+            Purchase, and_(Purchase.restaurant_id == Restaurant.id, Purchase.status == PurchaseStatus.COMPLETED)
+        ).group_by(
+            Restaurant.id, Restaurant.category, Restaurant.latitude, Restaurant.longitude
+        ).order_by(purchase_count.desc(), Restaurant.id).all()
+
+        rankings: Dict[RankingKey, List[Tuple[int, int]]] = {}
+        for restaurant_id, category, latitude, longitude, count in rows:
+            keys = [(SCOPE_GLOBAL, '')]
+            if category:
+                keys.append((SCOPE_CATEGORY, category))
+            if latitude is not None and longitude is not None:
+                cell = geohash(latitude, longitude, max(self.cell_precisions))
+                keys.extend((SCOPE_CELL, cell[:precision]) for precision in self.cell_precisions)
+
+            # Rows come most purchased first, so each ranking fills up in order
+            for key in keys:
+                ranking = rankings.setdefault(key, [])
+                if len(ranking) < self.list_size:
+                    ranking.append((restaurant_id, count))
+        return rankings
+
+    def refresh(self) -> Dict[str, int]:
+        """Recompute the rankings, persist them and serve them from this process. Needs an app context."""
+        started = time.monotonic()
+        rankings = self.compute()
+        generated_at = datetime.now(UTC)
+
+        try:
+            db.session.execute(delete(RestaurantPopularity))
+            rows = [
+                dict(scope=scope, scope_key=key, rank=rank, restaurant_id=restaurant_id,
+                     purchase_count=count, generated_at=generated_at)
+                for (scope, key), ranking in rankings.items()
+                for rank, (restaurant_id, count) in enumerate(ranking)
+            ]
+            if rows:
+                db.session.execute(insert(RestaurantPopularity), rows)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        self._swap(rankings, generated_at)
+        logger.info(f"Refreshed {len(rankings)} popularity rankings in {time.monotonic() - started:.2f}s")
+        return {"rankings": len(rankings), "entries": sum(len(ranking) for ranking in rankings.values())}
+
+    def load(self) -> None:
+        """Serve the persisted rankings, or freshly computed ones before the first refresh ever ran."""
+        try:
+            entries = db.session.query(
+                RestaurantPopularity.scope, RestaurantPopularity.scope_key,
+                RestaurantPopularity.restaurant_id, RestaurantPopularity.purchase_count,
+                RestaurantPopularity.generated_at
+            ).order_by(RestaurantPopularity.rank).all()
+
+            if entries:
+                rankings: Dict[RankingKey, List[Tuple[int, int]]] = {}
+                for scope, key, restaurant_id, count, _ in entries:
+                    rankings.setdefault((scope, key), []).append((restaurant_id, count))
+                generated_at = max(entry[4] for entry in entries)
+            else:
+                rankings, generated_at = self.compute(), datetime.now(UTC)
+            self._swap(rankings, generated_at)
+
+        except Exception as e:
+            logger.error(f"Error loading popularity rankings: {str(e)}")
+            with self._lock:
+                self._reloading = False
+
+    def _swap(self, rankings: Dict[RankingKey, List[Tuple[int, int]]], generated_at: datetime) -> None:
+        with self._lock:
+            self._rankings = {key: [restaurant_id for restaurant_id, _ in ranking]
+                              for key, ranking in rankings.items()}
+            self.generated_at = generated_at
+            self._loaded_at = time.monotonic()
+            self._reloading = False
+
+    def _get_rankings(self) -> Dict[RankingKey, List[int]]:
+        if self._rankings is None:
+            self.load()
+
+        reload_due = False
+        with self._lock:
+            rankings = self._rankings or {}
+            stale = time.monotonic() - self._loaded_at > self.reload_interval_seconds
+            if stale and not self._reloading:
+                self._reloading = reload_due = True
+
+        if reload_due:
+            run_in_background(self.load)
+        return rankings
+
+    def lookup(self,
+               latitude: Optional[float] = None,
+               longitude: Optional[float] = None,
+               categories: Sequence[str] = (),
+               limit: Optional[int] = None) -> List[int]:
+        """
+        Most purchased restaurants, the most local ranking first.
+
+        Takes the rankings of the cells around the point from the smallest up,
+        then the rankings of the given categories in order, and tops the list
+        up from the overall ranking.
+
+        Returns:
+            List[int]: Up to limit (default list_size) restaurant ids
+        """
+        limit = limit or self.list_size
+        rankings = self._get_rankings()
+
+        keys: List[RankingKey] = []
+        if latitude is not None and longitude is not None:
+            cell = geohash(latitude, longitude, max(self.cell_precisions))
+            keys.extend((SCOPE_CELL, cell[:precision]) for precision in sorted(self.cell_precisions, reverse=True))
+        keys.extend((SCOPE_CATEGORY, category) for category in categories)
+        keys.append((SCOPE_GLOBAL, ''))
+
+        restaurant_ids = []
+        for key in keys:
+            for restaurant_id in rankings.get(key, []):
+                if restaurant_id not in restaurant_ids:
+                    restaurant_ids.append(restaurant_id)
+            if len(restaurant_ids) >= limit:
+                break
+        return restaurant_ids[:limit]
+
+    def reset(self) -> None:
+        """Forget the loaded rankings, the next lookup loads them again."""
+        with self._lock:
+            self._rankings = None
+            self.generated_at = None
+            self._loaded_at = 0.0
+            self._reloading = False
+
+
+popularity_index = PopularityIndex()
@@ -12,6 +12,7 @@ from src.services.notification_service import NotificationService
 from src.services.achievement_service import AchievementService
 from src.services.business_notification_service import BusinessNotificationService
 from src.services.discount_service import apply_discount
+from src.services.recommendation_model_registry import record_completed_purchase
 
 
 def create_purchase_order_service(user_id, data=None):
@@ -450,10 +451,14 @@ def add_completion_image_service(purchase_id, owner_id, file_obj, url_for_func):
             db.session.commit()
             print("[DEBUG] Completion image added and purchase updated successfully.")
 
+            try:
+                record_completed_purchase(purchase)
+            except Exception as rec_error:
+                print(f"[DEBUG] Failed to update recommendation models: {str(rec_error)}")
+
             # Check and award achievements
             try:
-                newly_earned_achievements = AchievementService.check_and_award_achievements(purchase.user_id,
-                                                                                            purchase.id)
+                newly_earned_achievements = AchievementService.check_and_award_achievements(purchase.user_id)
 
                 # If achievements were earned, prepare notification data
                 if newly_earned_achievements:
@@ -0,0 +1,404 @@
+import logging
+import threading
+import time
+from datetime import datetime, UTC
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+from scipy import sparse
+from sklearn.preprocessing import normalize
+from sqlalchemy import func
+
+from src.models import db, Purchase, PurchaseStatus
+from src.utils.background import run_in_background
+
+logger = logging.getLogger(__name__)
+
+# (item id, user id, value) entries of an item-user matrix
+Entry = Tuple[int, int, float]
+
+
+class ItemSimilarityModel:
+    """
+    Immutable sparse item-user matrix with its rows L2-normalized for cosine similarity.
+
+    Memory is proportional to the number of (item, user) pairs, not to
+    items x users. Updates never modify a model in place; with_updates
+    returns a new one, so readers holding a reference keep a consistent
+    snapshot.
+    """
+
+    def __init__(self, item_ids: List[int], user_ids: List[int], matrix: sparse.csr_matrix, binary: bool = False):
+        self.item_ids = item_ids
+        self.user_ids = user_ids
+        self.item_index = {item_id: i for i, item_id in enumerate(item_ids)}
+        self.user_index = {user_id: i for i, user_id in enumerate(user_ids)}
+        self.matrix = matrix
+        self.binary = binary
+        self.built_at = time.monotonic()
+        # Cosine similarity of two rows is the dot product of their normalized forms
+        self.normalized = normalize(matrix, norm='l2', axis=1, copy=True) if matrix.shape[0] else matrix
+
+    @classmethod
+    def from_entries(cls, entries: Iterable[Entry], binary: bool = False) -> 'ItemSimilarityModel':
+        """Build a model straight from (item id, user id, value) tuples, duplicates are summed."""
+        entries = list(entries)
+        item_ids = list(dict.fromkeys(item_id for item_id, _, _ in entries))
+        user_ids = list(dict.fromkeys(user_id for _, user_id, _ in entries))
+        item_index = {item_id: i for i, item_id in enumerate(item_ids)}
+        user_index = {user_id: i for i, user_id in enumerate(user_ids)}
+
+        matrix = sparse.csr_matrix(
+            (
+                np.fromiter((value for _, _, value in entries), dtype=np.float64, count=len(entries)),
+                (
+                    np.fromiter((item_index[item_id] for item_id, _, _ in entries), dtype=np.int64, count=len(entries)),
+                    np.fromiter((user_index[user_id] for _, user_id, _ in entries), dtype=np.int64, count=len(entries)),
+                ),
+            ),
+            shape=(len(item_ids), len(user_ids))
+        )
+        matrix.sum_duplicates()
+        if binary:
+            matrix.data = np.minimum(matrix.data, 1.0)
+        return cls(item_ids, user_ids, matrix, binary)
+
+    def with_updates(self, entries: Iterable[Entry]) -> 'ItemSimilarityModel':
+        """Return a new model with the entries added to the matrix, growing it for new items and users."""
+        item_ids, user_ids = list(self.item_ids), list(self.user_ids)
+        item_index, user_index = dict(self.item_index), dict(self.user_index)
+        rows, cols, values = [], [], []
+
+        for item_id, user_id, value in entries:
+            if item_id not in item_index:
+                item_index[item_id] = len(item_ids)
+                item_ids.append(item_id)
+            if user_id not in user_index:
+                user_index[user_id] = len(user_ids)
+                user_ids.append(user_id)
+            rows.append(item_index[item_id])
+            cols.append(user_index[user_id])
+            values.append(value)
+
+        shape = (len(item_ids), len(user_ids))
+        matrix = self.matrix.copy()
+        matrix.resize(shape)
+        matrix = (matrix + sparse.csr_matrix((values, (rows, cols)), shape=shape, dtype=np.float64)).tocsr()
+        if self.binary:
+            matrix.data = np.minimum(matrix.data, 1.0)
+        return ItemSimilarityModel(item_ids, user_ids, matrix, self.binary)
+
+    def __contains__(self, item_id: int) -> bool:
+        return item_id in self.item_index
+
+    def __len__(self) -> int:
+        return len(self.item_ids)
+
+    @property
+    def nbytes(self) -> int:
+        """Memory held by the raw and normalized sparse matrices."""
+        return sum(m.data.nbytes + m.indices.nbytes + m.indptr.nbytes for m in (self.matrix, self.normalized))
+
+    def neighbors(self, item_id: int, n_neighbors: int) -> List[Tuple[int, float]]:
+        """
+        Most similar items to item_id, the item itself excluded.
+
+        Only items sharing at least one user with item_id get a score, the rest
+        are never touched.
+
+        Returns:
+            List[Tuple[int, float]]: (item id, cosine similarity), most similar first
+        """
+        return self.neighbors_many([item_id], n_neighbors).get(item_id, [])
+
+    def neighbors_many(self, item_ids: Iterable[int], n_neighbors: int) -> Dict[int, List[Tuple[int, float]]]:
+        """
+        neighbors() of several items at once, scored with a single sparse product.
+
+        Returns:
+            Dict[int, List[Tuple[int, float]]]: Neighbors by item id, unknown items left out
+        """
+        idxs = list(dict.fromkeys(self.item_index[item_id] for item_id in item_ids if item_id in self.item_index))
+        if not idxs or n_neighbors <= 0:
+            return {}
+
+        # One column of similarities per requested item
+        scores = (self.normalized @ self.normalized[idxs].T).tocsc()
+        result = {}
+        for col, idx in enumerate(idxs):
+            lo, hi = scores.indptr[col], scores.indptr[col + 1]
+            rows, similarities = scores.indices[lo:hi], scores.data[lo:hi]
+            candidates = rows != idx
+            rows, similarities = rows[candidates], similarities[candidates]
+
+            if len(rows) > n_neighbors:
+                top = np.argpartition(-similarities, n_neighbors - 1)[:n_neighbors]
+                rows, similarities = rows[top], similarities[top]
+            order = np.lexsort((rows, -similarities))
+            result[self.item_ids[idx]] = [(self.item_ids[rows[i]], float(similarities[i])) for i in order]
+        return result
+
+
+class TopKSimilarityTable:
+    """
+    The top_k most similar items of every item of a model, precomputed.
+
+    Stored as two (items x top_k) arrays of neighbor rows and scores, so a
+    lookup is an O(K) slice. Rows are computed chunk_size items at a time from
+    the sparse item-item product, which bounds memory while building.
+    """
+
+    def __init__(self, model: ItemSimilarityModel, top_k: int = 20, chunk_size: int = 1024):
+        n_items = len(model)
+        self.top_k = top_k
+        self.item_ids = model.item_ids
+        self.item_index = model.item_index
+        self.neighbor_rows = np.full((n_items, top_k), -1, dtype=np.int32)
+        self.scores = np.zeros((n_items, top_k), dtype=np.float32)
+
+        normalized_t = model.normalized.T.tocsr()
+        for start in range(0, n_items, chunk_size):
+            block = (model.normalized[start:start + chunk_size] @ normalized_t).tocsr()
+            for offset in range(block.shape[0]):
+                row = start + offset
+                lo, hi = block.indptr[offset], block.indptr[offset + 1]
+                cols, similarities = block.indices[lo:hi], block.data[lo:hi]
+                keep = cols != row
+                cols, similarities = cols[keep], similarities[keep]
+
+                if len(cols) > top_k:
+                    top = np.argpartition(-similarities, top_k - 1)[:top_k]
+                    cols, similarities = cols[top], similarities[top]
+                order = np.lexsort((cols, -similarities))
+                self.neighbor_rows[row, :len(order)] = cols[order]
+                self.scores[row, :len(order)] = similarities[order]
+
+        self.generated_at = datetime.now(UTC)
+
+    def __contains__(self, item_id: int) -> bool:
+        return item_id in self.item_index
+
+    def neighbors(self, item_id: int, n_neighbors: int) -> Optional[List[Tuple[int, float]]]:
+        """Precomputed neighbors of item_id, or None if the table cannot answer."""
+        idx = self.item_index.get(item_id)
+        if idx is None or n_neighbors > self.top_k:
+            return None
+        return [
+            (self.item_ids[neighbor], float(score))
+            for neighbor, score in zip(self.neighbor_rows[idx, :n_neighbors], self.scores[idx, :n_neighbors])
+            if neighbor >= 0
+        ]
+
+
+class RecommendationModelRegistry:
+    """
+    Process-wide holder of one ItemSimilarityModel.
+
+    The model is built from the database on first use. Completed purchases
+    reported through record() are applied as sparse updates on the next
+    lookup, and a full rebuild from the database runs in the background once
+    the model is older than rebuild_interval_seconds or dirty_threshold
+    updates were applied since the last build. Every change swaps in a new
+    model, so lookups never wait for training.
+
+    Every build also precomputes a TopKSimilarityTable. neighbors() serves
+    from it, and falls back to scoring against the live model for items the
+    table does not cover, e.g. items first bought after the last build, and
+    for items whose purchases changed since the table was built.
+
+    Other processes pick up purchases recorded here at their next rebuild.
+    """
+
+    def __init__(self,
+                 name: str,
+                 load_entries: Callable[[], Iterable[Entry]],
+                 binary: bool = False,
+                 rebuild_interval_seconds: float = 3600,
+                 dirty_threshold: int = 500,
+                 top_k: int = 20):
+        self.name = name
+        self.load_entries = load_entries
+        self.binary = binary
+        self.rebuild_interval_seconds = rebuild_interval_seconds
+        self.dirty_threshold = dirty_threshold
+        self.top_k = top_k
+
+        self._model: Optional[ItemSimilarityModel] = None
+        self._table: Optional[TopKSimilarityTable] = None
+        # Items updated since the table was built, whose table rows are out of date
+        self._changed_items: Set[int] = set()
+        self._pending: List[Tuple[int, Entry]] = []
+        self._sequence = 0
+        # Sequence number of the last queued update the current model includes
+        self._applied_through = 0
+        # While a build runs, the sequence number its database snapshot covers
+        self._building_through: Optional[int] = None
+        self._dirty = 0
+        self._rebuilding = False
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+
+    def record(self, item_id: int, user_id: int, value: float = 1.0) -> None:
+        """Queue an update, applied to the model on the next lookup."""
+        with self._lock:
+            self._sequence += 1
+            self._pending.append((self._sequence, (item_id, user_id, value)))
+
+    def rebuild(self) -> Optional[ItemSimilarityModel]:
+        """Build the model from the database and swap it in. Needs an app context."""
+        with self._build_lock:
+            return self._build()
+
+    def _build(self) -> Optional[ItemSimilarityModel]:
+        # Called with _build_lock held
+        with self._lock:
+            built_through = self._building_through = self._sequence
+        started = time.monotonic()
+        try:
+            model = ItemSimilarityModel.from_entries(self.load_entries(), self.binary)
+            table = TopKSimilarityTable(model, self.top_k)
+        except Exception as e:
+            logger.error(f"Error building {self.name} recommendation model: {str(e)}")
+            with self._lock:
+                self._building_through = None
+                self._rebuilding = False
+            return None
+
+        with self._lock:
+            # Purchases recorded while the query ran are re-applied on top by the next lookup
+            self._pending = [(seq, entry) for seq, entry in self._pending if seq > built_through]
+            self._applied_through = built_through
+            self._building_through = None
+            self._model = model
+            self._table = table
+            self._changed_items = set()
+            self._dirty = 0
+            self._rebuilding = False
+
+        logger.info(f"Built {self.name} recommendation model with {len(model)} items "
+                    f"in {time.monotonic() - started:.2f}s")
+        return model
+
+    def get_model(self) -> Optional[ItemSimilarityModel]:
+        """Return the current model, building it on first use and applying queued updates."""
+        model = self._model
+        if model is None:
+            with self._build_lock:
+                # Concurrent first lookups wait for one build instead of each running their own
+                model = self._model if self._model is not None else self._build()
+            if model is None:
+                return None
+
+        rebuild_due = False
+        with self._lock:
+            updates = [(seq, entry) for seq, entry in self._pending if seq > self._applied_through]
+            if updates:
+                model = self._model.with_updates(entry for _, entry in updates)
+                self._dirty += len(updates)
+                self._applied_through = updates[-1][0]
+                self._changed_items.update(item_id for _, (item_id, _, _) in updates)
+                self._model = model
+            else:
+                model = self._model
+            # A running build loaded the database before the updates after its snapshot,
+            # so those are kept to be applied again on top of the model it swaps in
+            if self._building_through is None:
+                self._pending = []
+            else:
+                self._pending = [(seq, entry) for seq, entry in self._pending if seq > self._building_through]
+
+            stale = time.monotonic() - model.built_at > self.rebuild_interval_seconds
+            if (stale or self._dirty >= self.dirty_threshold) and not self._rebuilding:
+                self._rebuilding = rebuild_due = True
+
+        if rebuild_due:
+            run_in_background(self.rebuild)
+        return model
+
+    @property
+    def table_generated_at(self) -> Optional[datetime]:
+        """When the precomputed neighbor table was last built, None before the first build."""
+        table = self._table
+        return table.generated_at if table else None
+
+    def _table_neighbors(self, item_id: int, n_neighbors: int) -> Optional[List[Tuple[int, float]]]:
+        """Precomputed neighbors of item_id, or None if the table does not cover it or is out of date for it."""
+        with self._lock:
+            table = self._table
+            changed = item_id in self._changed_items
+        if table is None or changed:
+            return None
+        return table.neighbors(item_id, n_neighbors)
+
+    def neighbors(self, item_id: int, n_neighbors: int) -> List[Tuple[int, float]]:
+        """Most similar items to item_id, from the precomputed table when it is current for the item."""
+        model = self.get_model()
+        if model is None:
+            return []
+
+        precomputed = self._table_neighbors(item_id, n_neighbors)
+        if precomputed is not None:
+            return precomputed
+        return model.neighbors(item_id, n_neighbors)
+
+    def neighbors_many(self, item_ids: Iterable[int], n_neighbors: int) -> Dict[int, List[Tuple[int, float]]]:
+        """neighbors() of several items, those the table does not cover scored together in one pass."""
+        model = self.get_model()
+        if model is None:
+            return {}
+
+        result, uncovered = {}, []
+        for item_id in dict.fromkeys(item_ids):
+            precomputed = self._table_neighbors(item_id, n_neighbors)
+            if precomputed is not None:
+                result[item_id] = precomputed
+            else:
+                uncovered.append(item_id)
+        if uncovered:
+            result.update(model.neighbors_many(uncovered, n_neighbors))
+        return result
+
+    def reset(self) -> None:
+        """Drop the model and queued updates, the next lookup rebuilds from the database."""
+        with self._lock:
+            self._model = None
+            self._table = None
+            self._changed_items = set()
+            self._pending = []
+            self._applied_through = self._sequence
+            self._dirty = 0
+            self._rebuilding = False
+
+
+def _load_listing_entries() -> List[Entry]:
+    rows = db.session.query(Purchase.listing_id, Purchase.user_id, func.sum(Purchase.quantity)).filter(
+        Purchase.status == PurchaseStatus.COMPLETED,
+        Purchase.listing_id.isnot(None),
+        Purchase.user_id.isnot(None)
+    ).group_by(Purchase.listing_id, Purchase.user_id).all()
+    return [(listing_id, user_id, float(quantity)) for listing_id, user_id, quantity in rows]
+
+
+def _load_restaurant_entries() -> List[Entry]:
+    # Purchases keep their restaurant_id after the listing itself is deleted
+    rows = db.session.query(Purchase.restaurant_id, Purchase.user_id).filter(
+        Purchase.status == PurchaseStatus.COMPLETED,
+        Purchase.restaurant_id.isnot(None),
+        Purchase.user_id.isnot(None)
+    ).distinct().all()
+    return [(restaurant_id, user_id, 1.0) for restaurant_id, user_id in rows]
+
+
+# Listings by the quantities users bought of them
+listing_recommendation_models = RecommendationModelRegistry('listing', _load_listing_entries)
+# Restaurants by which users bought from them at all
+restaurant_recommendation_models = RecommendationModelRegistry('restaurant', _load_restaurant_entries, binary=True)
+
+
+def record_completed_purchase(purchase) -> None:
+    """Feed a purchase that just became COMPLETED into both recommendation models."""
+    if purchase.user_id is None or purchase.listing_id is None:
+        return
+    listing_recommendation_models.record(purchase.listing_id, purchase.user_id, float(purchase.quantity or 1))
+    if purchase.restaurant_id is not None:
+        restaurant_recommendation_models.record(purchase.restaurant_id, purchase.user_id)
@@ -1,9 +1,17 @@
-from datetime import datetime
-from sqlalchemy import func, and_
-from src.models import db, Purchase, Listing, Restaurant, PurchaseStatus
-from sklearn.neighbors import NearestNeighbors
-import numpy as np
-import pandas as pd
+from datetime import datetime, UTC
+
+from sqlalchemy import and_, func, select, union_all
+
+from src.models import db, Purchase, Listing, Restaurant, PurchaseStatus, CustomerAddress, UserFavorites
+from src.services.popularity_index import popularity_index
+from src.services.recommendation_model_registry import listing_recommendation_models, \
+    restaurant_recommendation_models
+from src.services.restaurant_service import restaurant_to_dict
+
+# Most listings one batch request may ask recommendations for
+MAX_BATCH_LISTING_IDS = 50
+# Preferred categories whose rankings top up the fallback recommendations
+FALLBACK_CATEGORY_LIMIT = 3
 
 
 class RecommendationSystemService:
@@ -19,48 +27,14 @@ class RecommendationSystemService:
             return True
 
         try:
-            # Get all completed purchases
-            purchases = Purchase.query.filter_by(status='COMPLETED').all()
-            if not purchases:
-                return False
-
-            # Create purchase data
-            purchase_data = []
-            for purchase in purchases:
-                purchase_data.append({
-                    'user_id': purchase.user_id,
-                    'listing_id': purchase.listing_id,
-                    'quantity': purchase.quantity
-                })
-
-            # Convert to DataFrame
-            df = pd.DataFrame(purchase_data)
-
-            if df.empty:
-                return False
-
-            # Create user-item matrix
-            user_listing_matrix = pd.pivot_table(
-                data=df,
-                index='listing_id',
-                columns='user_id',
-                values='quantity',
-                fill_value=0
-            )
-
-            self.purchase_matrix = user_listing_matrix.values
-            self.listing_ids = user_listing_matrix.index.tolist()
-
-            if len(self.listing_ids) == 0:
+            # Shared, incrementally updated model; only built here on first use
+            model = listing_recommendation_models.get_model()
+            if model is None or len(model) == 0:
                 return False
 
-            # Create KNN model
-            self.model = NearestNeighbors(
-                n_neighbors=min(self.k_neighbors, len(self.listing_ids)),
-                metric='cosine',
-                algorithm='brute'
-            )
-            self.model.fit(self.purchase_matrix)
+            self.model = model
+            self.purchase_matrix = model.matrix
+            self.listing_ids = model.item_ids
             self.is_initialized = True
             return True
 
@@ -86,43 +60,85 @@ class RecommendationSystemService:
                     "message": "Listing not found"
                 }, 404
 
-            # Find listing index
-            try:
-                listing_idx = service.listing_ids.index(listing_id)
-            except ValueError:
+            if listing_id not in service.model:
                 return {
                     "success": False,
                     "message": "Listing not found in training data"
                 }, 404
 
-            # Get recommendations using KNN
-            distances, indices = service.model.kneighbors(
-                [service.purchase_matrix[listing_idx]],
-                n_neighbors=min(service.k_neighbors, len(service.listing_ids))
-            )
+            # Served from the precomputed top-K table, sorted by similarity, the listing itself excluded
+            neighbors = listing_recommendation_models.neighbors(listing_id, service.k_neighbors - 1)
+            listing_ids = [rec_id for rec_id, _ in neighbors]
+            generated_at = listing_recommendation_models.table_generated_at
+
+            return {
+                "success": True,
+                "data": listing_ids,
+                "generated_at": generated_at.isoformat() if generated_at else None
+            }, 200
+
+        except Exception as e:
+            print(f"Error getting recommendations: {e}")
+            return {
+                "success": False,
+                "message": "Error getting recommendations"
+            }, 500
 
-            # Convert distances to similarity scores
-            similarities = 1 - distances.flatten()
 
-            listing_recommendations = []
-            for idx, similarity in zip(indices.flatten(), similarities):
-                rec_id = service.listing_ids[idx]
-                if rec_id != listing_id:  # Skip the input listing
-                    listing_recommendations.append((rec_id, float(similarity)))
+    @staticmethod
+    def get_batch_recommendations(listing_ids, limit=None):
+        """
+        Recommendations for many listings at once, with the recommended listings
+        and their restaurants included, so a feed renders from one response.
+
+        Uses one batched model lookup and one IN query for all the cards.
+        """
+        if not listing_ids:
+            return {
+                "success": False,
+                "message": "listing_ids is required"
+            }, 400
+        if len(listing_ids) > MAX_BATCH_LISTING_IDS:
+            return {
+                "success": False,
+                "message": f"At most {MAX_BATCH_LISTING_IDS} listing_ids can be requested at once"
+            }, 400
+
+        service = RecommendationSystemService()
+        if not service.initialize_model():
+            return {
+                "success": False,
+                "message": "Could not initialize recommendation model"
+            }, 404
 
-            # Sort by similarity score
-            listing_recommendations.sort(key=lambda x: x[1], reverse=True)
+        try:
+            neighbors = listing_recommendation_models.neighbors_many(listing_ids, limit or service.k_neighbors - 1)
+            recommended_ids = {rec_id for candidates in neighbors.values() for rec_id, _ in candidates}
 
-            # Extract just the listing IDs
-            listing_ids = [rec_id for rec_id, _ in listing_recommendations]
+            rows = db.session.query(Listing, Restaurant).join(
+                Restaurant, Listing.restaurant_id == Restaurant.id
+            ).filter(Listing.id.in_(recommended_ids)).all() if recommended_ids else []
+            listings = {listing.id: listing for listing, _ in rows}
+            restaurants = {restaurant.id: restaurant for _, restaurant in rows}
+            generated_at = listing_recommendation_models.table_generated_at
 
             return {
                 "success": True,
-                "data": listing_ids
+                "recommendations": [
+                    {
+                        "listing_id": listing_id,
+                        # Listings may have been deleted since the model was built
+                        "data": [rec_id for rec_id, _ in neighbors.get(listing_id, []) if rec_id in listings]
+                    }
+                    for listing_id in listing_ids
+                ],
+                "listings": [listing.to_dict() for listing in listings.values()],
+                "restaurants": [restaurant_to_dict(restaurant) for restaurant in restaurants.values()],
+                "generated_at": generated_at.isoformat() if generated_at else None
             }, 200
 
         except Exception as e:
-            print(f"Error getting recommendations: {e}")
+            print(f"Error getting batch recommendations: {e}")
             return {
                 "success": False,
                 "message": "Error getting recommendations"
@@ -142,68 +158,17 @@ class RestaurantRecommendationSystemService:
             return True
 
         try:
-            # Get all completed purchases
-            purchases = Purchase.query.filter_by(status='COMPLETED').all()
-
-            print(f"Found {len(purchases)} completed purchases for recommendation model")
-
-            if not purchases:
-                print("No completed purchases found. Cannot initialize recommendation model.")
-                return False
-
-            # Create restaurant purchase data
-            data = []
-            for purchase in purchases:
-                if purchase.listing and purchase.listing.restaurant_id:
-                    data.append({
-                        'user_id': purchase.user_id,
-                        'restaurant_id': purchase.listing.restaurant_id
-                    })
-
-            df = pd.DataFrame(data)
-            if df.empty:
-                print("Empty dataframe after filtering. Cannot initialize recommendation model.")
-                return False
+            # Shared, incrementally updated model; only built here on first use
+            model = restaurant_recommendation_models.get_model()
 
-            print(f"Created dataframe with {len(df)} purchase records for recommendation model")
-
-            # Check if we have enough unique restaurants and users
-            unique_users = df['user_id'].nunique()
-            unique_restaurants = df['restaurant_id'].nunique()
-
-            print(f"Recommendation data: {unique_users} unique users, {unique_restaurants} unique restaurants")
-
-            if unique_users < 2 or unique_restaurants < 3:
-                print("Not enough unique users or restaurants for meaningful recommendations")
-                # We'll still try to proceed, but with lower expectations
-
-            user_restaurant_matrix = df.pivot_table(
-                index='restaurant_id',
-                columns='user_id',
-                aggfunc=lambda x: 1,
-                fill_value=0
-            )
-
-            self.restaurant_matrix = user_restaurant_matrix.values
-            self.restaurant_ids = user_restaurant_matrix.index.tolist()
-
-            print(f"Created user-restaurant matrix with {len(self.restaurant_ids)} restaurants")
-
-            if len(self.restaurant_ids) < 2:
+            if model is None or len(model) < 2:
                 print("Not enough restaurant data for recommendations")
                 return False
 
-            # Reduce neighbors for small datasets
-            actual_k = min(self.k_neighbors, max(1, len(self.restaurant_ids) - 1))
-
-            self.model = NearestNeighbors(
-                n_neighbors=actual_k,
-                metric='cosine',
-                algorithm='brute'
-            )
-            self.model.fit(self.restaurant_matrix)
+            self.model = model
+            self.restaurant_matrix = model.matrix
+            self.restaurant_ids = model.item_ids
             self.is_initialized = True
-            print(f"Successfully initialized recommendation model with {actual_k} neighbors")
             return True
 
         except Exception as e:
@@ -214,114 +179,127 @@ class RestaurantRecommendationSystemService:
     def get_recommendations_by_user(user_id):
         service = RestaurantRecommendationSystemService()
 
-        print(f"Getting recommendations for user ID: {user_id}")
-
         if not service.initialize_model():
             print(f"Failed to initialize recommendation model for user {user_id}")
             # Instead of returning error, provide fallback recommendations
-            return RestaurantRecommendationSystemService.get_fallback_recommendations()
+            return RestaurantRecommendationSystemService.get_fallback_recommendations(user_id)
 
         try:
-            purchases = Purchase.query.filter(
+            # Distinct restaurants the user bought from, straight from purchases without loading listings
+            restaurant_ids = [row[0] for row in db.session.query(Purchase.restaurant_id).filter(
                 Purchase.user_id == user_id,
-                Purchase.status == PurchaseStatus.COMPLETED
-            ).all()
-
-            print(f"Found {len(purchases)} completed purchases for user {user_id}")
-
-            if not purchases:
-                print(f"No purchase history found for user {user_id}, using fallback")
-                return RestaurantRecommendationSystemService.get_fallback_recommendations()
-
-            restaurant_ids = set()
-            for purchase in purchases:
-                if purchase.listing and purchase.listing.restaurant_id:
-                    restaurant_ids.add(purchase.listing.restaurant_id)
-
-            print(f"User {user_id} has purchased from {len(restaurant_ids)} restaurants")
+                Purchase.status == PurchaseStatus.COMPLETED,
+                Purchase.restaurant_id.isnot(None)
+            ).distinct()]
 
             if not restaurant_ids:
-                print(f"No restaurants found in user {user_id}'s purchase history, using fallback")
-                return RestaurantRecommendationSystemService.get_fallback_recommendations()
-
-            all_recommendations = []
-            for restaurant_id in restaurant_ids:
-                try:
-                    idx = service.restaurant_ids.index(restaurant_id)
-                except ValueError:
-                    print(f"Restaurant ID {restaurant_id} not found in model data")
-                    continue
-
-                # Get at most k_neighbors or max available
-                actual_neighbors = min(service.k_neighbors + 1, len(service.restaurant_ids))
-
-                try:
-                    distances, indices = service.model.kneighbors(
-                        [service.restaurant_matrix[idx]],
-                        n_neighbors=actual_neighbors
-                    )
-
-                    similarities = 1 - distances.flatten()
-
-                    for i, sim in zip(indices.flatten(), similarities):
-                        rec_id = service.restaurant_ids[i]
-                        if rec_id == restaurant_id:
-                            continue
-
-                        rec_rest = Restaurant.query.get(rec_id)
-                        base_rest = Restaurant.query.get(restaurant_id)
-
-                        if rec_rest and base_rest:
-                            # Relaxed category matching to get more recommendations
-                            if not any(r[0] == rec_id for r in all_recommendations):
-                                all_recommendations.append((rec_id, float(sim)))
-                except Exception as e:
-                    print(f"Error getting neighbors for restaurant {restaurant_id}: {e}")
+                print(f"No purchase history found for user {user_id}, using fallback")
+                return RestaurantRecommendationSystemService.get_fallback_recommendations(user_id)
+
+            # Neighbors of all the user's restaurants in one batch, keeping each candidate's best similarity
+            best = {}
+            neighbors = restaurant_recommendation_models.neighbors_many(restaurant_ids, service.k_neighbors)
+            for restaurant_id, candidates in neighbors.items():
+                for rec_id, similarity in candidates:
+                    if rec_id != restaurant_id and similarity > best.get(rec_id, -1.0):
+                        best[rec_id] = similarity
+
+            # Restaurants may have been deleted since the model was built
+            existing = {row[0] for row in db.session.query(Restaurant.id).filter(Restaurant.id.in_(list(best)))} \
+                if best else set()
+            all_recommendations = sorted(
+                ((rec_id, similarity) for rec_id, similarity in best.items() if rec_id in existing),
+                key=lambda x: x[1],
+                reverse=True
+            )
 
             if not all_recommendations:
                 print("No recommendations found with collaborative filtering, using fallback")
-                return RestaurantRecommendationSystemService.get_fallback_recommendations()
-
-            all_recommendations.sort(key=lambda x: x[1], reverse=True)
-            top_recommendations = all_recommendations[:10]
+                return RestaurantRecommendationSystemService.get_fallback_recommendations(user_id)
 
             # Extract just restaurant IDs
-            restaurant_ids_list = [rec_id for rec_id, _ in top_recommendations]
-
-            print(f"Found {len(restaurant_ids_list)} recommendations for user {user_id}")
-
-            if not restaurant_ids_list:
-                print("Empty recommendations list, using fallback")
-                return RestaurantRecommendationSystemService.get_fallback_recommendations()
+            restaurant_ids_list = [rec_id for rec_id, _ in all_recommendations[:10]]
+            generated_at = restaurant_recommendation_models.table_generated_at
 
             return {
                 "success": True,
-                "data": restaurant_ids_list
+                "data": restaurant_ids_list,
+                "generated_at": generated_at.isoformat() if generated_at else None
             }, 200
 
         except Exception as e:
             print(f"Error getting recommendations: {e}")
             # Use fallback recommendations instead of error
-            return RestaurantRecommendationSystemService.get_fallback_recommendations()
+            return RestaurantRecommendationSystemService.get_fallback_recommendations(user_id)
 
     @staticmethod
-    def get_fallback_recommendations():
+    def get_batch_recommendations_by_user(user_id):
+        """
+        Restaurant recommendations for a user together with the restaurants and
+        their available listings, fetched with one IN query.
+        """
+        response, status = RestaurantRecommendationSystemService.get_recommendations_by_user(user_id)
+        if status != 200:
+            return response, status
+
+        try:
+            restaurant_ids = response["data"]
+            rows = db.session.query(Restaurant, Listing).outerjoin(
+                Listing, and_(Listing.restaurant_id == Restaurant.id, Listing.count > 0,
+                              Listing.expires_at > datetime.now(UTC))
+            ).filter(Restaurant.id.in_(restaurant_ids)).order_by(Listing.id).all() if restaurant_ids else []
+
+            restaurants = {restaurant.id: restaurant for restaurant, _ in rows}
+            listings = [listing for _, listing in rows if listing is not None]
+
+            return {
+                **response,
+                "data": [restaurant_id for restaurant_id in restaurant_ids if restaurant_id in restaurants],
+                "restaurants": [restaurant_to_dict(restaurants[restaurant_id])
+                                for restaurant_id in restaurant_ids if restaurant_id in restaurants],
+                "listings": [listing.to_dict() for listing in listings]
+            }, 200
+
+        except Exception as e:
+            print(f"Error getting batch recommendations: {e}")
+            return {
+                "success": False,
+                "message": "Error getting recommendations"
+            }, 500
+
+    @staticmethod
+    def get_preferred_categories(user_id, limit=FALLBACK_CATEGORY_LIMIT):
+        """Categories of the restaurants a user bought from or favorited, the most frequent first"""
+        restaurants = union_all(
+            select(Purchase.restaurant_id.label('restaurant_id')).where(
+                Purchase.user_id == user_id,
+                Purchase.status == PurchaseStatus.COMPLETED
+            ),
+            select(UserFavorites.restaurant_id).where(UserFavorites.user_id == user_id)
+        ).subquery()
+
+        return [row[0] for row in db.session.query(Restaurant.category).join(
+            restaurants, restaurants.c.restaurant_id == Restaurant.id
+        ).filter(Restaurant.category.isnot(None)).group_by(Restaurant.category).order_by(
+            func.count().desc(), Restaurant.category
+        ).limit(limit)]
+
+    @staticmethod
+    def get_fallback_recommendations(user_id=None):
         """Provide fallback recommendations when personalized ones cannot be generated"""
         try:
-            # Get top-rated restaurants or most popular ones
-            popular_restaurants = db.session.query(Restaurant.id, func.count(Purchase.id).label('purchase_count')) \
-                .join(Listing, Restaurant.id == Listing.restaurant_id) \
-                .join(Purchase, Listing.id == Purchase.listing_id) \
-                .filter(Purchase.status == PurchaseStatus.COMPLETED) \
-                .group_by(Restaurant.id) \
-                .order_by(func.count(Purchase.id).desc()) \
-                .limit(10).all()
-
-            restaurant_ids = [r[0] for r in popular_restaurants]
-
-            # If we still don't have recommendations, just get any 10 restaurants
-            if not restaurant_ids:
-                restaurant_ids = [r.id for r in Restaurant.query.limit(10).all()]
+            # Most purchased restaurants around the user's primary address and in the user's
+            # preferred categories, topped up from the overall ranking
+            address = None
+            categories = []
+            if user_id is not None:
+                address = db.session.query(CustomerAddress.latitude, CustomerAddress.longitude).filter(
+                    CustomerAddress.user_id == user_id,
+                    CustomerAddress.is_primary.is_(True)
+                ).first()
+                categories = RestaurantRecommendationSystemService.get_preferred_categories(user_id)
+
+            restaurant_ids = popularity_index.lookup(*(address or (None, None)), categories=categories)
 
             print(f"Using fallback recommendations: {restaurant_ids}")
 
@@ -333,4 +311,3 @@ class RestaurantRecommendationSystemService:
             print(f"Error getting fallback recommendations: {e}")
             # Last resort: empty but successful response
             return {"success": True, "data": []}, 200
-
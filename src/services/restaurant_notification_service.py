@@ -1,12 +1,50 @@
 from src.services.notification_service import NotificationService
-from src.models import User, CustomerAddress, Restaurant
-import math
+from src.models import CustomerAddress, Restaurant
 from src.models import db
+from src.utils.geo import haversine, distances_within
+from typing import List
 import logging
 
 logger = logging.getLogger(__name__)
 
 
+def find_nearby_user_ids(lat: float, lon: float, max_distance_km: float) -> List[int]:
+    """
+    Find the users whose primary address lies within max_distance_km of a point.
+
+    Only the addresses inside the bounding box of the search circle are loaded,
+    and only the columns needed for the exact distance check.
+
+    Args:
+        lat (float): Latitude of the point
+        lon (float): Longitude of the point
+        max_distance_km (float): Search radius in kilometers
+
+    Returns:
+        List[int]: IDs of the nearby users
+    """
+    rows = db.session.query(
+        CustomerAddress.user_id,
+        CustomerAddress.latitude,
+        CustomerAddress.longitude
+    ).filter(
+        CustomerAddress.is_primary == True,
+        CustomerAddress.bounding_box_filter(lat, lon, max_distance_km)
+    ).all()
+
+    if not rows:
+        return []
+
+    _, is_nearby = distances_within(
+        lat, lon,
+        [row.latitude for row in rows],
+        [row.longitude for row in rows],
+        radius_km=max_distance_km
+    )
+
+    return list(dict.fromkeys(row.user_id for row, nearby in zip(rows, is_nearby) if nearby))
+
+
 def notify_users_about_new_restaurant(restaurant_id: int, max_distance_km: float = 5.0):
     """
     Notify users about a new restaurant based on their primary address proximity.
@@ -25,51 +63,27 @@ def notify_users_about_new_restaurant(restaurant_id: int, max_distance_km: float
             logger.error(f"Restaurant with ID {restaurant_id} not found")
             return 0
 
-        restaurant_lat = restaurant.latitude
-        restaurant_lng = restaurant.longitude
         restaurant_name = restaurant.restaurantName
 
         logger.info(f"Finding users near new restaurant: {restaurant_name} (ID: {restaurant_id})")
 
-        # Find users with primary addresses
-        primary_addresses = db.session.query(CustomerAddress, User).join(
-            User,
-            CustomerAddress.user_id == User.id
-        ).filter(
-            CustomerAddress.is_primary == True
-        ).all()
-
-        logger.info(f"Found {len(primary_addresses)} users with primary addresses")
-
-        notified_count = 0
-
-        # Check each user's distance from the restaurant
-        for address, user in primary_addresses:
-            # Calculate distance between restaurant and user address
-            distance = calculate_distance(
-                restaurant_lat, restaurant_lng,
-                address.latitude, address.longitude
-            )
-
-            # If user is nearby, send notification
-            if distance <= max_distance_km:
-                # Send notification to user
-                success = NotificationService.send_notification_to_user(
-                    user_id=user.id,
-                    title="New Restaurant Opened Nearby!",
-                    body=f"{restaurant_name} has just opened near your location. Check it out!",
-                    data={
-                        "type": "new_restaurant",
-                        "restaurant_id": restaurant.id,
-                        "screen": "RestaurantDetailScreen"
-                    }
-                )
-
-                if success:
-                    notified_count += 1
-                    logger.info(f"Notified user {user.id} about new restaurant {restaurant_id}")
-                else:
-                    logger.warning(f"Failed to notify user {user.id} about new restaurant {restaurant_id}")
+        user_ids = find_nearby_user_ids(restaurant.latitude, restaurant.longitude, max_distance_km)
+
+        logger.info(f"Found {len(user_ids)} users near restaurant {restaurant_id}")
+
+        if not user_ids:
+            return 0
+
+        notified_count = NotificationService.send_notification_to_users(
+            user_ids,
+            title="New Restaurant Opened Nearby!",
+            body=f"{restaurant_name} has just opened near your location. Check it out!",
+            data={
+                "type": "new_restaurant",
+                "restaurant_id": restaurant.id,
+                "screen": "RestaurantDetailScreen"
+            }
+        )
 
         logger.info(f"Notified {notified_count} users about new restaurant {restaurant_name}")
         return notified_count
@@ -90,21 +104,4 @@ def calculate_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> fl
     Returns:
         float: Distance in kilometers
     """
-    # Convert decimal degrees to radians
-    lat1_rad = math.radians(lat1)
-    lon1_rad = math.radians(lon1)
-    lat2_rad = math.radians(lat2)
-    lon2_rad = math.radians(lon2)
-
-    # Haversine formula
-    dlon = lon2_rad - lon1_rad
-    dlat = lat2_rad - lat1_rad
-    a = math.sin(dlat / 2) ** 2 + math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(dlon / 2) ** 2
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-
-    # Earth radius in kilometers
-    radius = 6371
-
-    # Calculate distance
-    distance = radius * c
-    return distance
\ No newline at end of file
+    return haversine(lat1, lon1, lat2, lon2)
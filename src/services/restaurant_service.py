@@ -1,7 +1,8 @@
 # services/restaurant_service.py
-from math import radians, cos, sin, asin, sqrt
 from src.models import db, Restaurant
+from src.utils.background import run_in_background
 from src.utils.cloud_storage import upload_file, delete_file, allowed_file
+from src.utils.geo import distances_within
 
 
 def restaurant_to_dict(restaurant):
@@ -125,55 +126,13 @@ def create_restaurant_service(owner_id, form, files, url_for_func):
     db.session.add(new_restaurant)
     db.session.commit()
 
-    # New notification code
+    # Notify nearby users off the request thread
     try:
-        # Find users with primary addresses
-        from src.models import CustomerAddress, User
-        from src.services.notification_service import NotificationService
-        import logging
-
-        # Find users with primary addresses
-        primary_addresses = db.session.query(CustomerAddress, User).join(
-            User,
-            CustomerAddress.user_id == User.id
-        ).filter(
-            CustomerAddress.is_primary == True
-        ).all()
-
-        for address, user in primary_addresses:
-            # Use your existing haversine calculation or just calculate distance directly
-            # This uses the one from your get_restaurants_proximity_service function
-            user_lat = float(address.latitude)
-            user_lon = float(address.longitude)
-            rest_lat = float(latitude)
-            rest_lon = float(longitude)
-
-            # Convert degrees to radians
-            from math import radians, cos, sin, asin, sqrt
-            user_lat, user_lon, rest_lat, rest_lon = map(radians, [user_lat, user_lon, rest_lat, rest_lon])
-            d_lat = rest_lat - user_lat
-            d_lon = rest_lon - user_lon
-            a = sin(d_lat / 2) ** 2 + cos(user_lat) * cos(rest_lat) * sin(d_lon / 2) ** 2
-            c = 2 * asin(sqrt(a))
-            earth_radius = 6371  # km
-            distance = c * earth_radius
-
-            # Only notify users within 5km
-            if distance <= 5.0:
-                NotificationService.send_notification_to_user(
-                    user_id=user.id,
-                    title="New Restaurant Opened Nearby!",
-                    body=f"{restaurant_name} has just opened near your location. Check it out!",
-                    data={
-                        "type": "new_restaurant",
-                        "restaurant_id": new_restaurant.id,
-                        "screen": "RestaurantDetailScreen"
-                    }
-                )
+        from src.services.restaurant_notification_service import notify_users_about_new_restaurant
+        run_in_background(notify_users_about_new_restaurant, new_restaurant.id)
     except Exception as e:
         # Just log the error but don't disrupt the main flow
         print(f"Error notifying users about new restaurant: {str(e)}")
-    # End of notification code
 
     return {
         "success": True,
@@ -219,33 +178,29 @@ def get_restaurant_service(restaurant_id):
     return restaurant_data, 200
 
 
-def haversine(lon1, lat1, lon2, lat2):
+def nearby_restaurants_to_dicts(restaurants, user_lat, user_lon, radius):
     """
-    Calculate the great circle distance in kilometers between two points
-    on the earth (specified in decimal degrees)
+    Serialize the restaurants that are within radius of the user and whose
+    maxDeliveryDistance covers the user, closest first.
     """
-    # Convert decimal degrees to radians
-    lon1, lat1, lon2, lat2 = map(radians, [lon1, lat1, lon2, lat2])
-
-    # Haversine formula
-    dlon = lon2 - lon1
-    dlat = lat2 - lat1
-    a = sin(dlat / 2) ** 2 + cos(lat1) * cos(lat2) * sin(dlon / 2) ** 2
-    c = 2 * asin(sqrt(a))
-    r = 6371  # Radius of earth in kilometers
-    return c * r
+    distances, in_range = distances_within(
+        user_lat, user_lon,
+        [restaurant.latitude for restaurant in restaurants],
+        [restaurant.longitude for restaurant in restaurants],
+        radius_km=radius,
+        max_distances=[restaurant.maxDeliveryDistance for restaurant in restaurants]
+    )
 
+    nearby = []
+    for restaurant, dist, include in zip(restaurants, distances, in_range):
+        if include:
+            restaurant_dict = restaurant_to_dict(restaurant)
+            restaurant_dict["distance_km"] = round(float(dist), 2)
+            nearby.append(restaurant_dict)
 
+    nearby.sort(key=lambda x: x['distance_km'])
+    return nearby
 
-def haversine(lat1, lon1, lat2, lon2):
-    # Convert degrees to radians
-    lat1, lon1, lat2, lon2 = map(radians, [lat1, lon1, lat2, lon2])
-    d_lat = lat2 - lat1
-    d_lon = lon2 - lon1
-    a = sin(d_lat / 2) ** 2 + cos(lat1) * cos(lat2) * sin(d_lon / 2) ** 2
-    c = 2 * asin(sqrt(a))
-    earth_radius = 6371  # km
-    return c * earth_radius
 
 def get_restaurants_in_proximity(user_lat, user_lon, radius=10, filters=None):
     """
@@ -266,19 +221,15 @@ def get_restaurants_in_proximity(user_lat, user_lon, radius=10, filters=None):
     except ValueError:
         return {"success": False, "message": "Invalid latitude, longitude, or radius format"}, 400
 
-    restaurants = Restaurant.query.all()
-    nearby = []
-    for restaurant in restaurants:
-        dist = haversine(user_lat, user_lon, float(restaurant.latitude), float(restaurant.longitude))
-        if dist <= radius and (restaurant.maxDeliveryDistance is None or dist <= restaurant.maxDeliveryDistance):
-            restaurant_dict = restaurant_to_dict(restaurant)
-            restaurant_dict["distance_km"] = round(dist, 2)
-            nearby.append(restaurant_dict)
+    # The bounding box narrows the scan in SQL, the exact distance check refines the rows it returns
+    restaurants = Restaurant.query.filter(
+        Restaurant.bounding_box_filter(user_lat, user_lon, radius)
+    ).order_by(Restaurant.id).all()
+    nearby = nearby_restaurants_to_dicts(restaurants, user_lat, user_lon, radius)
 
     if not nearby:
         return {"message": "No restaurants found within the specified radius"}, 404
 
-    nearby.sort(key=lambda x: x['distance_km'])
     return {"restaurants": nearby}, 200
 
 
@@ -293,29 +244,15 @@ def get_flash_deals_service(user_lat, user_lon, radius=30):
     except ValueError:
         return {"success": False, "message": "Invalid latitude, longitude, or radius format"}, 400
 
-    def haversine(lat1, lon1, lat2, lon2):
-        # Convert degrees to radians
-        lat1, lon1, lat2, lon2 = map(radians, [lat1, lon1, lat2, lon2])
-        d_lat = lat2 - lat1
-        d_lon = lon2 - lon1
-        a = sin(d_lat / 2) ** 2 + cos(lat1) * cos(lat2) * sin(d_lon / 2) ** 2
-        c = 2 * asin(sqrt(a))
-        earth_radius = 6371  # km
-        return c * earth_radius
-
-    restaurants = Restaurant.query.filter_by(flash_deals_available=True).all()
-    nearby = []
-    for restaurant in restaurants:
-        dist = haversine(user_lat, user_lon, float(restaurant.latitude), float(restaurant.longitude))
-        if dist <= radius and (restaurant.maxDeliveryDistance is None or dist <= restaurant.maxDeliveryDistance):
-            restaurant_dict = restaurant_to_dict(restaurant)
-            restaurant_dict["distance_km"] = round(dist, 2)
-            nearby.append(restaurant_dict)
+    restaurants = Restaurant.query.filter(
+        Restaurant.flash_deals_available == True,
+        Restaurant.bounding_box_filter(user_lat, user_lon, radius)
+    ).order_by(Restaurant.id).all()
+    nearby = nearby_restaurants_to_dicts(restaurants, user_lat, user_lon, radius)
 
     if not nearby:
         return {"message": "No flash deals available within the specified radius"}, 404
 
-    nearby.sort(key=lambda x: x['distance_km'])
     return {"restaurants": nearby}, 200
 
 
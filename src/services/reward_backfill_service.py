@@ -0,0 +1,168 @@
+import logging
+import time
+from decimal import Decimal
+from typing import Callable, Dict, Optional
+
+from src.models import db, DiscountEarned, EnvironmentalContribution, Listing, Purchase, PurchaseStatus
+from src.services.environmental_service import EnvironmentalService
+from src.services.gamification_services import add_discount_points
+
+logger = logging.getLogger(__name__)
+
+BACKFILL_CHUNK_SIZE = 2000
+# Stay well below the 2100 bind parameter limit of SQL Server
+LINK_USER_CHUNK_SIZE = 1000
+# Discount points are awarded when the restaurant accepts a purchase
+DISCOUNT_POINT_STATUSES = (PurchaseStatus.ACCEPTED, PurchaseStatus.COMPLETED)
+
+# progress(kind, processed, total, elapsed seconds) after every chunk
+ProgressCallback = Callable[[str, int, int, float], None]
+
+
+def _missing_contributions():
+    """Completed purchases without an environmental contribution."""
+    return db.session.query(Purchase.id).outerjoin(
+        EnvironmentalContribution, EnvironmentalContribution.purchase_id == Purchase.id
+    ).filter(
+        Purchase.status == PurchaseStatus.COMPLETED,
+        Purchase.user_id.isnot(None),
+        EnvironmentalContribution.id.is_(None)
+    )
+
+
+def _missing_discount_points():
+    """Accepted or completed purchases without a discount point."""
+    return db.session.query(Purchase.id).join(
+        Listing, Listing.id == Purchase.listing_id
+    ).outerjoin(
+        DiscountEarned, DiscountEarned.purchase_id == Purchase.id
+    ).filter(
+        Purchase.status.in_(DISCOUNT_POINT_STATUSES),
+        Purchase.user_id.isnot(None),
+        DiscountEarned.id.is_(None)
+    )
+
+
+def _purchase_discount(quantity, original_price, total_price) -> Decimal:
+    """The discount add_discount_point records for a purchase."""
+    discount = Decimal(quantity or 0) * Decimal(str(original_price or 0)) - Decimal(str(total_price or 0))
+    return discount.quantize(Decimal('0.01'))
+
+
+def link_legacy_discount_points() -> int:
+    """
+    Link the discount points recorded before points referenced their purchase.
+
+    Each unlinked point is matched, per user and oldest first, to an
+    accepted or completed purchase without a point that was made before the point was
+    earned, preferring one with the same discount. Points matching no
+    purchase, e.g. of a deleted one, stay unlinked. Linked points are never
+    unlinked again, so after the first run this is a single query.
+
+    Returns:
+        int: Number of points linked
+    """
+    user_ids = [row[0] for row in db.session.query(DiscountEarned.user_id).filter(
+        DiscountEarned.purchase_id.is_(None)
+    ).distinct().order_by(DiscountEarned.user_id)]
+
+    linked = 0
+    for start in range(0, len(user_ids), LINK_USER_CHUNK_SIZE):
+        chunk = user_ids[start:start + LINK_USER_CHUNK_SIZE]
+        points = db.session.query(
+            DiscountEarned.id, DiscountEarned.user_id, DiscountEarned.discount, DiscountEarned.earned_at
+        ).filter(
+            DiscountEarned.purchase_id.is_(None),
+            DiscountEarned.user_id.in_(chunk)
+        ).order_by(DiscountEarned.earned_at, DiscountEarned.id).all()
+        purchases = db.session.query(
+            Purchase.id, Purchase.user_id, Purchase.purchase_date, Purchase.quantity, Purchase.total_price,
+            Listing.original_price
+        ).join(
+            Listing, Listing.id == Purchase.listing_id
+        ).outerjoin(
+            DiscountEarned, DiscountEarned.purchase_id == Purchase.id
+        ).filter(
+            Purchase.status.in_(DISCOUNT_POINT_STATUSES),
+            Purchase.user_id.in_(chunk),
+            DiscountEarned.id.is_(None)
+        ).order_by(Purchase.purchase_date, Purchase.id).all()
+
+        # user id -> [(purchase id, purchase date, discount)], oldest first
+        unmatched = {}
+        for row in purchases:
+            unmatched.setdefault(row.user_id, []).append(
+                (row.id, row.purchase_date, _purchase_discount(row.quantity, row.original_price, row.total_price)))
+
+        mappings = []
+        for point_id, user_id, discount, earned_at in points:
+            candidates = [entry for entry in unmatched.get(user_id, []) if entry[1] <= earned_at]
+            if not candidates:
+                continue
+            match = next((entry for entry in candidates if entry[2] == discount), candidates[0])
+            unmatched[user_id].remove(match)
+            mappings.append(dict(id=point_id, purchase_id=match[0]))
+
+        try:
+            db.session.bulk_update_mappings(DiscountEarned, mappings)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        linked += len(mappings)
+
+    if linked:
+        logger.info(f"Linked {linked} legacy discount points to their purchases")
+    return linked
+
+
+def _backfill(kind: str, missing, record: Callable, chunk_size: int,
+              progress: Optional[ProgressCallback]) -> Dict[str, float]:
+    started = time.monotonic()
+    total = missing.count()
+    processed, recorded, last_id = 0, 0, 0
+
+    # Keyset pages by purchase id, so purchases the batch skips are not read again
+    while True:
+        purchase_ids = [row[0] for row in missing.filter(Purchase.id > last_id)
+                        .order_by(Purchase.id).limit(chunk_size).all()]
+        if not purchase_ids:
+            break
+
+        recorded += record(purchase_ids)
+        processed += len(purchase_ids)
+        last_id = purchase_ids[-1]
+
+        elapsed = time.monotonic() - started
+        logger.info(f"Backfilled {kind}: {processed}/{total} purchases, "
+                    f"{processed / elapsed if elapsed else 0:.0f} purchases/s")
+        if progress is not None:
+            progress(kind, processed, total, elapsed)
+
+    elapsed = time.monotonic() - started
+    return {
+        "missing": total,
+        "recorded": recorded,
+        "seconds": round(elapsed, 2),
+        "per_second": round(processed / elapsed, 1) if elapsed else 0.0
+    }
+
+
+def backfill_rewards(chunk_size: int = BACKFILL_CHUNK_SIZE, progress: Optional[ProgressCallback] = None) -> dict:
+    """
+    Record the environmental contributions missing for completed purchases
+    and the discount points missing for accepted or completed ones, after a
+    history import or failed purchase hooks.
+
+    Missing purchases are found with anti-joins and handled chunk_size at a
+    time by the batch variants of the hooks, one commit per chunk, so an
+    interrupted run resumes where it stopped. Discount points from before
+    points were linked to purchases are linked first, so their purchases
+    are not counted as missing. Needs an app context.
+    """
+    contributions = _backfill("contributions", _missing_contributions(),
+                              EnvironmentalService.record_contributions_for_purchases, chunk_size, progress)
+    linked = link_legacy_discount_points()
+    discount_points = _backfill("discount_points", _missing_discount_points(), add_discount_points, chunk_size,
+                                progress)
+    return {"contributions": contributions, "discount_points": {**discount_points, "linked": linked}}
@@ -0,0 +1,152 @@
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+import requests
+from py_vapid import Vapid
+from pywebpush import WebPusher
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+VAPID_SUBJECT = "mailto:contact@freshdeal.com"
+
+# pywebpush signs claims valid for 12 hours; re-sign an hour before they expire
+VAPID_CLAIMS_TTL_SECONDS = 12 * 60 * 60
+VAPID_REFRESH_MARGIN_SECONDS = 60 * 60
+
+# Push services answer these when a subscription will never be delivered to again
+GONE_STATUS_CODES = {404, 410}
+
+
+class WebPushDispatcher:
+    """
+    Sends web push messages to many subscriptions concurrently.
+
+    The VAPID private key is parsed once, and the signed Authorization header
+    is cached per audience (the push service origin) for the validity window
+    of its claims, so a send only encrypts the payload and posts it over a
+    pooled session. Subscriptions answered with 404/410 are reported back as
+    gone so the caller can deactivate them.
+    """
+
+    def __init__(self,
+                 vapid_private_key: Optional[str] = None,
+                 vapid_subject: str = VAPID_SUBJECT,
+                 max_workers: int = 8,
+                 timeout: float = 10,
+                 ttl: int = 0):
+        self.vapid_private_key = vapid_private_key
+        self.vapid_subject = vapid_subject
+        self.timeout = timeout
+        self.ttl = ttl
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max_workers)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='web-push')
+        self._vapid: Optional[Vapid] = None
+        # audience -> (headers, expiry timestamp of the signed claims)
+        self._signed: Dict[str, Tuple[Dict[str, str], int]] = {}
+        self._lock = threading.Lock()
+
+    def _get_vapid(self) -> Vapid:
+        if self._vapid is None:
+            if not self.vapid_private_key:
+                raise ValueError("VAPID_PRIVATE_KEY is not configured")
+            self._vapid = Vapid.from_string(private_key=self.vapid_private_key)
+        return self._vapid
+
+    def vapid_headers(self, endpoint: str) -> Dict[str, str]:
+        """Return the VAPID headers for the endpoint's origin, signing them only when needed."""
+        url = urlparse(endpoint)
+        audience = f"{url.scheme}://{url.netloc}"
+        now = int(time.time())
+
+        with self._lock:
+            cached = self._signed.get(audience)
+            if cached and cached[1] - VAPID_REFRESH_MARGIN_SECONDS > now:
+                return cached[0]
+
+            expires_at = now + VAPID_CLAIMS_TTL_SECONDS
+            headers = self._get_vapid().sign({
+                "sub": self.vapid_subject,
+                "aud": audience,
+                "exp": expires_at,
+            })
+            self._signed[audience] = (headers, expires_at)
+            return headers
+
+    def send_one(self, subscription_info: Dict[str, Any], data: str) -> Tuple[bool, bool]:
+        """
+        Send one message.
+
+        Returns:
+            Tuple[bool, bool]: Whether it was accepted, and whether the subscription is gone
+        """
+        try:
+            response = WebPusher(subscription_info, requests_session=self.session).send(
+                data,
+                dict(self.vapid_headers(subscription_info.get("endpoint", ""))),
+                ttl=self.ttl,
+                timeout=self.timeout,
+            )
+        except Exception as e:
+            logger.error(f"Error sending web push notification: {str(e)}")
+            return False, False
+
+        if response.status_code <= 202:
+            return True, False
+
+        gone = response.status_code in GONE_STATUS_CODES
+        if gone:
+            logger.info("Subscription is no longer valid")
+        else:
+            logger.error(f"Web push failed: {response.status_code} {response.reason} {response.text}")
+        return False, gone
+
+    def send(self, subscriptions: List[Tuple[Any, Dict[str, Any]]], payload: Dict[str, Any]) -> Tuple[int, List[Any]]:
+        """
+        Send the same payload to all subscriptions in parallel.
+
+        Args:
+            subscriptions (List[Tuple[Any, Dict[str, Any]]]): (key, subscription_info) pairs,
+                the key identifies the subscription in the result, e.g. a device id
+            payload (Dict[str, Any]): Message payload, serialized once for all sends
+
+        Returns:
+            Tuple[int, List[Any]]: Number of accepted messages and keys of gone subscriptions
+        """
+        if not subscriptions:
+            return 0, []
+
+        data = json.dumps(payload)
+        if len(subscriptions) == 1:
+            results = [self.send_one(subscriptions[0][1], data)]
+        else:
+            results = list(self._executor.map(lambda item: self.send_one(item[1], data), subscriptions))
+
+        sent = sum(1 for accepted, _ in results if accepted)
+        gone = [key for (key, _), (_, is_gone) in zip(subscriptions, results) if is_gone]
+        return sent, gone
+
+
+_dispatcher: Optional[WebPushDispatcher] = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_web_push_dispatcher() -> WebPushDispatcher:
+    """Return the process-wide dispatcher, so all sends share one key, header cache and pool."""
+    global _dispatcher
+    if _dispatcher is None:
+        with _dispatcher_lock:
+            if _dispatcher is None:
+                _dispatcher = WebPushDispatcher(vapid_private_key=os.environ.get('VAPID_PRIVATE_KEY'))
+    return _dispatcher
@@ -1,11 +1,11 @@
 import json
 import logging
 from typing import Dict, Any, List, Optional, Union
-import requests
-from pywebpush import webpush, WebPushException
 from datetime import datetime, UTC
 
-from src.models import db, UserDevice
+from src.models import db, UserDevice, NotificationOutbox
+from src.services.notification_queue import NotificationQueue, notification_queue
+from src.services.web_push_dispatcher import get_web_push_dispatcher
 
 logger = logging.getLogger(__name__)
 
@@ -56,8 +56,7 @@ class WebPushNotificationService:
             return False, str(e)
 
     @staticmethod
-    def send_web_push_notification(
-            subscription_info: Dict[str, Any],
+    def build_payload(
             title: str,
             body: str,
             icon: str = None,
@@ -67,50 +66,71 @@ class WebPushNotificationService:
             actions: List[Dict[str, str]] = None,
             tag: str = None,
             require_interaction: bool = False
-    ) -> bool:
-        try:
-            import os
-            vapid_claims = {
-                "sub": "mailto:contact@freshdeal.com",
+    ) -> Dict[str, Any]:
+        payload_data = {
+            "notification": {
+                "title": title,
+                "body": body,
+                "icon": icon,
+                "badge": badge,
+                "image": image,
+                "data": data or {},
+                "requireInteraction": require_interaction
             }
+        }
 
-            payload_data = {
-                "notification": {
-                    "title": title,
-                    "body": body,
-                    "icon": icon,
-                    "badge": badge,
-                    "image": image,
-                    "data": data or {},
-                    "requireInteraction": require_interaction
-                }
-            }
+        if actions:
+            payload_data["notification"]["actions"] = actions
 
-            if actions:
-                payload_data["notification"]["actions"] = actions
+        if tag:
+            payload_data["notification"]["tag"] = tag
 
-            if tag:
-                payload_data["notification"]["tag"] = tag
+        return payload_data
 
-            webpush(
-                subscription_info=subscription_info,
-                data=json.dumps(payload_data),
-                vapid_private_key=os.environ.get('VAPID_PRIVATE_KEY'),
-                vapid_claims=vapid_claims
+    @staticmethod
+    def send_web_push_notification(
+            subscription_info: Dict[str, Any],
+            title: str,
+            body: str,
+            icon: str = None,
+            badge: str = None,
+            image: str = None,
+            data: Dict[str, Any] = None,
+            actions: List[Dict[str, str]] = None,
+            tag: str = None,
+            require_interaction: bool = False
+    ) -> bool:
+        try:
+            payload_data = WebPushNotificationService.build_payload(
+                title, body, icon, badge, image, data, actions, tag, require_interaction
             )
+            sent, _ = get_web_push_dispatcher().send([(None, subscription_info)], payload_data)
 
-            logger.info("Web push notification sent successfully")
-            return True
+            if sent:
+                logger.info("Web push notification sent successfully")
+            return sent > 0
 
-        except WebPushException as e:
-            logger.error(f"WebPushException: {str(e)}")
-            if e.response and e.response.status_code == 410:
-                logger.info("Subscription is no longer valid")
-            return False
         except Exception as e:
             logger.error(f"Error sending web push notification: {str(e)}")
             return False
 
+    @staticmethod
+    def deactivate_devices(device_ids: List[int]) -> int:
+        """Mark the given devices inactive in one UPDATE, e.g. after their subscriptions expired."""
+        if not device_ids:
+            return 0
+        try:
+            updated = UserDevice.query.filter(UserDevice.id.in_(device_ids)).update(
+                {UserDevice.is_active: False}, synchronize_session=False
+            )
+            db.session.commit()
+            logger.info(f"Deactivated {updated} expired web push subscriptions")
+            return updated
+        except Exception as e:
+            logger.error(f"Error deactivating web push subscriptions: {str(e)}")
+            db.session.rollback()
+            return 0
+
     @staticmethod
     def send_notification_to_user_web(
             user_id: int,
@@ -119,6 +139,42 @@ class WebPushNotificationService:
             data: Dict[str, Any] = None,
             icon: str = None,
             **kwargs
+    ) -> bool:
+        """Queue a web push notification, it is delivered by the notification workers."""
+        try:
+            if not NotificationQueue.is_async():
+                return WebPushNotificationService.deliver_notification_to_user_web(
+                    user_id, title, body, data, icon, **kwargs
+                )
+
+            has_web_device = db.session.query(UserDevice.id).filter_by(
+                user_id=user_id,
+                device_type="web",
+                is_active=True
+            ).first() is not None
+
+            if not has_web_device:
+                logger.warning(f"No active web devices found for user {user_id}")
+                return False
+
+            return notification_queue.enqueue(
+                NotificationOutbox.CHANNEL_WEB,
+                user_id,
+                {"title": title, "body": body, "data": data, "icon": icon, **kwargs}
+            )
+
+        except Exception as e:
+            logger.error(f"Error queueing web notification for user {user_id}: {str(e)}")
+            return False
+
+    @staticmethod
+    def deliver_notification_to_user_web(
+            user_id: int,
+            title: str,
+            body: str,
+            data: Dict[str, Any] = None,
+            icon: str = None,
+            **kwargs
     ) -> bool:
         try:
             web_devices = UserDevice.query.filter_by(
@@ -131,30 +187,18 @@ class WebPushNotificationService:
                 logger.warning(f"No active web devices found for user {user_id}")
                 return False
 
-            success_count = 0
-
+            subscriptions = []
             for device in web_devices:
                 try:
-                    if device.web_push_token:
-                        subscription_info = json.loads(device.web_push_token)
-                    else:
-                        subscription_info = json.loads(device.push_token)
-
-                    success = WebPushNotificationService.send_web_push_notification(
-                        subscription_info=subscription_info,
-                        title=title,
-                        body=body,
-                        icon=icon,
-                        data=data,
-                        **kwargs
-                    )
-
-                    if success:
-                        success_count += 1
-
+                    subscriptions.append((device.id, json.loads(device.web_push_token or device.push_token)))
                 except json.JSONDecodeError:
                     logger.error(f"Invalid subscription info for device {device.id}")
-                    continue
+
+            payload_data = WebPushNotificationService.build_payload(
+                title=title, body=body, icon=icon, data=data, **kwargs
+            )
+            success_count, gone_device_ids = get_web_push_dispatcher().send(subscriptions, payload_data)
+            WebPushNotificationService.deactivate_devices(gone_device_ids)
 
             logger.info(
                 f"Successfully sent web notifications to {success_count}/{len(web_devices)} devices for user {user_id}")
@@ -0,0 +1,35 @@
+import logging
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+from flask import current_app
+
+logger = logging.getLogger(__name__)
+
+_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='background')
+
+
+def run_in_background(func: Callable[..., Any], *args, **kwargs) -> Optional[Future]:
+    """
+    Run func off the request thread inside an app context of the current app.
+
+    Set BACKGROUND_TASKS_ASYNC to False (the default when TESTING is on) to run
+    the task inline instead, which keeps tests deterministic.
+
+    Returns:
+        Optional[Future]: The future of the task, or None if it ran inline
+    """
+    app = current_app._get_current_object()
+
+    if not app.config.get('BACKGROUND_TASKS_ASYNC', not app.testing):
+        func(*args, **kwargs)
+        return None
+
+    def run():
+        with app.app_context():
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                logger.error(f"Background task {getattr(func, '__name__', func)} failed: {str(e)}")
+
+    return _executor.submit(run)
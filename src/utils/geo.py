@@ -0,0 +1,161 @@
+import math
+from typing import List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+from sqlalchemy import and_, or_
+
+EARTH_RADIUS_KM = 6371
+
+# Padding (in degrees) added around every bounding box so that rounding of the
+# DECIMAL(9, 6) coordinate columns can never push a real match outside of it.
+BOUNDING_BOX_PADDING = 1e-5
+
+ArrayLike = Union[float, Sequence[float], np.ndarray]
+
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+
+def haversine(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """
+    Great-circle distance in kilometers between two points given in decimal degrees.
+
+    Use haversine_distances when more than one pair of points is involved.
+    """
+    lat1, lon1, lat2, lon2 = map(math.radians, map(float, (lat1, lon1, lat2, lon2)))
+    d_lat = lat2 - lat1
+    d_lon = lon2 - lon1
+    a = math.sin(d_lat / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin(d_lon / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(min(a, 1.0)))
+
+
+def haversine_distances(origin_lat: ArrayLike, origin_lon: ArrayLike,
+                        lats: ArrayLike, lons: ArrayLike) -> np.ndarray:
+    """
+    Vectorized great-circle distances in kilometers.
+
+    Args:
+        origin_lat: Latitude of one origin, or an array of M origin latitudes
+        origin_lon: Longitude of one origin, or an array of M origin longitudes
+        lats: Array of N point latitudes
+        lons: Array of N point longitudes
+
+    Returns:
+        np.ndarray: Shape (N,) for a single origin, (M, N) for M origins
+    """
+    origin_lat = np.radians(np.asarray(origin_lat, dtype=float))
+    origin_lon = np.radians(np.asarray(origin_lon, dtype=float))
+    lats = np.radians(np.asarray(lats, dtype=float))
+    lons = np.radians(np.asarray(lons, dtype=float))
+
+    if origin_lat.ndim:
+        origin_lat = origin_lat[:, np.newaxis]
+        origin_lon = origin_lon[:, np.newaxis]
+
+    a = (np.sin((lats - origin_lat) / 2) ** 2
+         + np.cos(origin_lat) * np.cos(lats) * np.sin((lons - origin_lon) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def distances_within(origin_lat: ArrayLike, origin_lon: ArrayLike,
+                     lats: ArrayLike, lons: ArrayLike, radius_km: float,
+                     max_distances: Optional[ArrayLike] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Compute distances and the "in range" mask in a single pass.
+
+    A point is in range when it is within radius_km of the origin and, if the
+    point has a max distance of its own (e.g. a restaurant's maxDeliveryDistance),
+    within that too. None / NaN max distances mean "no limit".
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: Distances in kilometers and boolean mask,
+        both shaped like the result of haversine_distances
+    """
+    distances = haversine_distances(origin_lat, origin_lon, lats, lons)
+    mask = distances <= radius_km
+
+    if max_distances is not None:
+        limits = np.array([np.nan if value is None else float(value) for value in max_distances], dtype=float)
+        mask &= np.isnan(limits) | (distances <= limits)
+
+    return distances, mask
+
+
+def bounding_box(lat: float, lon: float, radius_km: float) -> Tuple[float, float, List[Tuple[float, float]]]:
+    """
+    Compute the lat/lon box that fully contains a circle on the earth's surface.
+
+    Args:
+        lat (float): Latitude of the circle centre in decimal degrees
+        lon (float): Longitude of the circle centre in decimal degrees
+        radius_km (float): Circle radius in kilometers
+
+    Returns:
+        Tuple[float, float, List[Tuple[float, float]]]: Minimum latitude, maximum
+        latitude and one or two longitude ranges (two when the box crosses the
+        antimeridian)
+    """
+    angular_radius = max(radius_km, 0.0) / EARTH_RADIUS_KM
+    delta_lat = math.degrees(angular_radius) + BOUNDING_BOX_PADDING
+
+    min_lat = lat - delta_lat
+    max_lat = lat + delta_lat
+
+    # Near the poles (or for huge radii) every longitude is reachable
+    if min_lat <= -90 or max_lat >= 90 or angular_radius >= math.pi / 2:
+        return max(min_lat, -90.0), min(max_lat, 90.0), [(-180.0, 180.0)]
+
+    ratio = math.sin(angular_radius) / math.cos(math.radians(lat))
+    if ratio >= 1:
+        return min_lat, max_lat, [(-180.0, 180.0)]
+
+    delta_lon = math.degrees(math.asin(ratio)) + BOUNDING_BOX_PADDING
+    min_lon = lon - delta_lon
+    max_lon = lon + delta_lon
+
+    if min_lon < -180:
+        return min_lat, max_lat, [(min_lon + 360, 180.0), (-180.0, max_lon)]
+    if max_lon > 180:
+        return min_lat, max_lat, [(min_lon, 180.0), (-180.0, max_lon - 360)]
+    return min_lat, max_lat, [(min_lon, max_lon)]
+
+
+def bounding_box_predicate(lat_column, lon_column, lat: float, lon: float, radius_km: float):
+    """
+    SQLAlchemy predicate matching rows whose coordinates fall in the bounding box
+    of a circle, so that only candidate rows are loaded before exact filtering.
+    """
+    min_lat, max_lat, lon_ranges = bounding_box(lat, lon, radius_km)
+    return and_(
+        lat_column.between(min_lat, max_lat),
+        or_(*[lon_column.between(lo, hi) for lo, hi in lon_ranges])
+    )
+
+
+def geohash(lat: float, lon: float, precision: int = 5) -> str:
+    """
+    Geohash of a point: a cell id whose prefixes are the enclosing, larger cells.
+
+    Precision 4 cells are roughly 39 x 20 km, precision 5 cells 5 x 5 km.
+    """
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    lat, lon = float(lat), float(lon)
+    chars = []
+    bits, value, even = 0, 0, True
+
+    while len(chars) < precision:
+        # Bits alternate between longitude and latitude, longitude first
+        interval, coordinate = (lon_range, lon) if even else (lat_range, lat)
+        middle = (interval[0] + interval[1]) / 2
+        if coordinate >= middle:
+            value = value * 2 + 1
+            interval[0] = middle
+        else:
+            value = value * 2
+            interval[1] = middle
+        even = not even
+
+        bits += 1
+        if bits == 5:
+            chars.append(GEOHASH_ALPHABET[value])
+            bits, value = 0, 0
+    return ''.join(chars)
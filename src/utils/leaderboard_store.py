@@ -0,0 +1,201 @@
+import bisect
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+class LeaderboardStore:
+    """
+    Named sorted sets of member -> score, highest score first.
+
+    Ties are ordered by member, descending as strings, which is how Redis
+    orders ZREVRANGE, so every backend returns the same order. Members are
+    returned as strings.
+    """
+
+    def exists(self, board: str) -> bool:
+        raise NotImplementedError
+
+    def replace(self, board: str, scores: Dict[str, float]) -> None:
+        """Swap the whole board for the given scores in one step."""
+        raise NotImplementedError
+
+    def increment(self, board: str, member: str, amount: float) -> float:
+        """Add amount to the member's score, creating the member at 0. Returns the new score."""
+        raise NotImplementedError
+
+    def score(self, board: str, member: str) -> Optional[float]:
+        raise NotImplementedError
+
+    def position(self, board: str, member: str) -> Optional[int]:
+        """Zero-based position of the member from the top, None if it is not on the board."""
+        raise NotImplementedError
+
+    def count_above(self, board: str, score: float) -> int:
+        """Number of members with a score strictly above the given one."""
+        raise NotImplementedError
+
+    def range(self, board: str, start: int, stop: int) -> List[Tuple[str, float]]:
+        """(member, score) entries at positions start..stop, both included, from the top."""
+        raise NotImplementedError
+
+    def size(self, board: str) -> int:
+        raise NotImplementedError
+
+    def delete(self, board: str) -> None:
+        raise NotImplementedError
+
+
+class InMemoryLeaderboardStore(LeaderboardStore):
+    """
+    Pure-Python store for tests and single-process deployments.
+
+    Each board is a list of (score, member) kept sorted ascending next to a
+    member -> score dict; the top of the board is the end of the list. Reads
+    are bisects, O(log n); a write bisects too but shifts the list, which is
+    a memmove rather than Python work.
+
+    Increments only reach the boards of the process that made them. With
+    max_age_seconds, a board stops existing that long after it was replaced,
+    so the next read re-seeds it with the writes of the other processes.
+    """
+
+    def __init__(self, max_age_seconds: Optional[float] = None, clock: Callable[[], float] = time.monotonic):
+        self.max_age_seconds = max_age_seconds
+        self._clock = clock
+        self._entries: Dict[str, List[Tuple[float, str]]] = {}
+        self._scores: Dict[str, Dict[str, float]] = {}
+        self._replaced_at: Dict[str, float] = {}
+        self._lock = threading.RLock()
+
+    def exists(self, board: str) -> bool:
+        with self._lock:
+            if board not in self._scores:
+                return False
+            if self.max_age_seconds is None:
+                return True
+            replaced_at = self._replaced_at.get(board)
+            return replaced_at is not None and self._clock() - replaced_at < self.max_age_seconds
+
+    def replace(self, board: str, scores: Dict[str, float]) -> None:
+        scores = {str(member): float(score) for member, score in scores.items()}
+        entries = sorted((score, member) for member, score in scores.items())
+        with self._lock:
+            self._scores[board] = scores
+            self._entries[board] = entries
+            self._replaced_at[board] = self._clock()
+
+    def increment(self, board: str, member: str, amount: float) -> float:
+        member = str(member)
+        with self._lock:
+            scores = self._scores.setdefault(board, {})
+            entries = self._entries.setdefault(board, [])
+            previous = scores.get(member)
+            if previous is not None:
+                del entries[bisect.bisect_left(entries, (previous, member))]
+            score = (previous or 0.0) + float(amount)
+            scores[member] = score
+            bisect.insort(entries, (score, member))
+            return score
+
+    def score(self, board: str, member: str) -> Optional[float]:
+        with self._lock:
+            return self._scores.get(board, {}).get(str(member))
+
+    def position(self, board: str, member: str) -> Optional[int]:
+        member = str(member)
+        with self._lock:
+            score = self._scores.get(board, {}).get(member)
+            if score is None:
+                return None
+            entries = self._entries[board]
+            return len(entries) - 1 - bisect.bisect_left(entries, (score, member))
+
+    def count_above(self, board: str, score: float) -> int:
+        with self._lock:
+            entries = self._entries.get(board, [])
+            # Members sort after '' so (score, '\U0010ffff') lies past every entry with this score
+            return len(entries) - bisect.bisect_right(entries, (float(score), '\U0010ffff'))
+
+    def range(self, board: str, start: int, stop: int) -> List[Tuple[str, float]]:
+        with self._lock:
+            entries = self._entries.get(board, [])
+            size = len(entries)
+            start, stop = max(start, 0), min(stop, size - 1)
+            if start > stop:
+                return []
+            return [(member, score) for score, member in reversed(entries[size - 1 - stop:size - start])]
+
+    def size(self, board: str) -> int:
+        with self._lock:
+            return len(self._entries.get(board, []))
+
+    def delete(self, board: str) -> None:
+        with self._lock:
+            self._entries.pop(board, None)
+            self._scores.pop(board, None)
+            self._replaced_at.pop(board, None)
+
+
+class RedisLeaderboardStore(LeaderboardStore):
+    """
+    Store on Redis sorted sets, shared by every worker process.
+
+    Every read is a single O(log n) command. Boards are replaced by building
+    a temporary key and renaming it over the board in one transaction, so
+    readers never see a half-loaded board.
+    """
+
+    def __init__(self, client, prefix: str = 'leaderboard:'):
+        self.client = client
+        self.prefix = prefix
+
+    def _key(self, board: str) -> str:
+        return f"{self.prefix}{board}"
+
+    @staticmethod
+    def _member(member) -> str:
+        return member.decode() if isinstance(member, bytes) else str(member)
+
+    def exists(self, board: str) -> bool:
+        # Redis drops empty sorted sets, so a marker key records that the board was loaded
+        return bool(self.client.exists(f"{self._key(board)}:loaded"))
+
+    def replace(self, board: str, scores: Dict[str, float]) -> None:
+        key = self._key(board)
+        loading = f"{key}:loading:{os.getpid()}"
+        pipeline = self.client.pipeline(transaction=True)
+        if scores:
+            pipeline.delete(loading)
+            pipeline.zadd(loading, {str(member): float(score) for member, score in scores.items()})
+            pipeline.rename(loading, key)
+        else:
+            pipeline.delete(key)
+        pipeline.set(f"{key}:loaded", 1)
+        pipeline.execute()
+
+    def increment(self, board: str, member: str, amount: float) -> float:
+        return float(self.client.zincrby(self._key(board), float(amount), str(member)))
+
+    def score(self, board: str, member: str) -> Optional[float]:
+        score = self.client.zscore(self._key(board), str(member))
+        return None if score is None else float(score)
+
+    def position(self, board: str, member: str) -> Optional[int]:
+        return self.client.zrevrank(self._key(board), str(member))
+
+    def count_above(self, board: str, score: float) -> int:
+        return self.client.zcount(self._key(board), f"({float(score)!r}", '+inf')
+
+    def range(self, board: str, start: int, stop: int) -> List[Tuple[str, float]]:
+        if stop < start or stop < 0:
+            return []
+        entries = self.client.zrevrange(self._key(board), max(start, 0), stop, withscores=True)
+        return [(self._member(member), float(score)) for member, score in entries]
+
+    def size(self, board: str) -> int:
+        return self.client.zcard(self._key(board))
+
+    def delete(self, board: str) -> None:
+        self.client.delete(self._key(board), f"{self._key(board)}:loaded")
@@ -0,0 +1,28 @@
+from sqlalchemy import insert, update
+from sqlalchemy.exc import IntegrityError
+
+
+def increment_rollup(connection, table, keys, deltas):
+    """Add deltas to the rollup row with the given keys, creating it if needed."""
+    where = [table.c[column] == value for column, value in keys.items()]
+    increment = update(table).where(*where).values({column: table.c[column] + delta
+                                                    for column, delta in deltas.items()})
+    if connection.execute(increment).rowcount:
+        return
+
+    try:
+        with connection.begin_nested():
+            connection.execute(insert(table).values(**keys, **deltas))
+    except IntegrityError:
+        # Another transaction created the row first
+        connection.execute(increment)
+
+
+def increment_rollups(connection, table, key_columns, column, amounts):
+    """
+    Add summed amounts to many rollup rows: amounts maps a tuple of
+    key_columns values to the delta of column. Rows are touched in key
+    order, so concurrent batches take their row locks in the same order.
+    """
+    for key in sorted(amounts):
+        increment_rollup(connection, table, dict(zip(key_columns, key)), {column: amounts[key]})
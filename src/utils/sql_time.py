@@ -0,0 +1,65 @@
+from sqlalchemy import Date, Float
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
+
+
+class seconds_between(FunctionElement):
+    """
+    Seconds from start to end, as a float SQL expression.
+
+    Every backend spells date arithmetic differently, so this compiles to
+    DATEDIFF_BIG on SQL Server, TIMESTAMPDIFF on MySQL, EXTRACT(EPOCH ...) on
+    PostgreSQL and julianday() on SQLite.
+    """
+    type = Float()
+    inherit_cache = True
+    name = 'seconds_between'
+
+
+@compiles(seconds_between)
+def _seconds_between_default(element, compiler, **kw):
+    start, end = list(element.clauses)
+    return f"EXTRACT(EPOCH FROM ({compiler.process(end, **kw)} - {compiler.process(start, **kw)}))"
+
+
+@compiles(seconds_between, 'mssql')
+def _seconds_between_mssql(element, compiler, **kw):
+    start, end = list(element.clauses)
+    return f"CAST(DATEDIFF_BIG(second, {compiler.process(start, **kw)}, {compiler.process(end, **kw)}) AS FLOAT)"
+
+
+@compiles(seconds_between, 'mysql')
+def _seconds_between_mysql(element, compiler, **kw):
+    start, end = list(element.clauses)
+    return f"TIMESTAMPDIFF(SECOND, {compiler.process(start, **kw)}, {compiler.process(end, **kw)})"
+
+
+@compiles(seconds_between, 'sqlite')
+def _seconds_between_sqlite(element, compiler, **kw):
+    start, end = list(element.clauses)
+    return f"((julianday({compiler.process(end, **kw)}) - julianday({compiler.process(start, **kw)})) * 86400.0)"
+
+
+class day_of(FunctionElement):
+    """
+    Calendar date of a datetime, as a date SQL expression.
+
+    CAST(... AS DATE) everywhere except SQLite, where it would keep only the
+    year, and MySQL, which spells it DATE().
+    """
+    type = Date()
+    inherit_cache = True
+    name = 'day_of'
+
+
+@compiles(day_of)
+def _day_of_default(element, compiler, **kw):
+    value, = list(element.clauses)
+    return f"CAST({compiler.process(value, **kw)} AS DATE)"
+
+
+@compiles(day_of, 'mysql')
+@compiles(day_of, 'sqlite')
+def _day_of_date_function(element, compiler, **kw):
+    value, = list(element.clauses)
+    return f"DATE({compiler.process(value, **kw)})"
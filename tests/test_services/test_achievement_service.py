@@ -1,9 +1,13 @@
 import unittest
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch
 from datetime import datetime, timedelta, UTC
+from decimal import Decimal
+import sqlalchemy
 from flask import Flask
-from src.models import db, UserAchievement, Achievement, AchievementType, Purchase, PurchaseStatus, RestaurantComment
-from src.services.achievement_service import AchievementService
+from src.models import db, UserAchievement, Achievement, AchievementType, Purchase, PurchaseStatus, \
+    RestaurantComment, Restaurant, User, UserActivityDaily, UserActivityTotal
+from src.services.achievement_service import AchievementService, get_achievement_cache
+from src.utils.lru_cache import LRUCache
 
 
 class TestAchievementService(unittest.TestCase):
@@ -25,38 +29,14 @@ class TestAchievementService(unittest.TestCase):
         # Create tables
         db.create_all()
 
-        # Set up mock achievements for testing
-        self.first_purchase = MagicMock()
-        self.first_purchase.id = 1
-        self.first_purchase.achievement_type = AchievementType.FIRST_PURCHASE
-        self.first_purchase.threshold = 1
-        self.first_purchase.name = "First Purchase"
-        self.first_purchase.description = "Made your first purchase on FreshDeal"
-        self.first_purchase.badge_image_url = "/static/badges/first_purchase.png"
-
-        self.regular_buyer = MagicMock()
-        self.regular_buyer.id = 2
-        self.regular_buyer.achievement_type = AchievementType.PURCHASE_COUNT
-        self.regular_buyer.threshold = 5
-        self.regular_buyer.name = "Regular Buyer"
-        self.regular_buyer.description = "Completed 5 purchases"
-        self.regular_buyer.badge_image_url = "/static/badges/regular_buyer.png"
-
-        self.weekly_champion = MagicMock()
-        self.weekly_champion.id = 3
-        self.weekly_champion.achievement_type = AchievementType.WEEKLY_PURCHASE
-        self.weekly_champion.threshold = 5
-        self.weekly_champion.name = "Weekly Champion"
-        self.weekly_champion.description = "Made 5 purchases in a week"
-        self.weekly_champion.badge_image_url = "/static/badges/weekly_champion.png"
-
-        self.regular_commenter = MagicMock()
-        self.regular_commenter.id = 4
-        self.regular_commenter.achievement_type = AchievementType.REGULAR_COMMENTER
-        self.regular_commenter.threshold = 100
-        self.regular_commenter.name = "Regular Commenter"
-        self.regular_commenter.description = "Made 100 comments in 90 days"
-        self.regular_commenter.badge_image_url = "/static/badges/regular_commenter.png"
+        self.user = User(name="Test User", email="user@test.com", phone_number="+901234567890",
+                         password="hashed", role="customer")
+        db.session.add(self.user)
+        db.session.commit()
+        self.restaurant = Restaurant(owner_id=self.user.id, restaurantName="Restaurant", category="Test",
+                                     longitude=Decimal('28.97'), latitude=Decimal('41.01'))
+        db.session.add(self.restaurant)
+        db.session.commit()
 
     def tearDown(self):
         db.session.remove()
@@ -81,192 +61,186 @@ class TestAchievementService(unittest.TestCase):
             mock_session.add_all.assert_called_once()
             mock_session.commit.assert_called_once()
 
-    def test_check_and_award_achievements(self):
-        with patch.object(AchievementService, '_check_first_purchase') as mock_first_purchase, \
-                patch.object(AchievementService, '_check_purchase_count_achievements') as mock_purchase_count, \
-                patch.object(AchievementService, '_check_weekly_purchase_achievement') as mock_weekly, \
-                patch.object(AchievementService, '_check_comment_achievement') as mock_comment:
-            user_id = 1
-            mock_first_purchase.return_value = ["first_purchase"]
-            mock_purchase_count.return_value = ["purchase_count"]
-            mock_weekly.return_value = ["weekly"]
-            mock_comment.return_value = ["comment"]
-
-            result = AchievementService.check_and_award_achievements(user_id)
-
-            mock_first_purchase.assert_called_once_with(user_id)
-            mock_purchase_count.assert_called_once_with(user_id)
-            mock_weekly.assert_called_once_with(user_id)
-            mock_comment.assert_called_once_with(user_id)
-
-            self.assertEqual(result, ["first_purchase", "purchase_count", "weekly", "comment"])
-
-    def test_check_first_purchase_achievement_already_earned(self):
-        user_id = 1
-
-        with patch('src.services.achievement_service.Achievement.query') as mock_achievement_query, \
-                patch('src.services.achievement_service.UserAchievement.query') as mock_user_achievement_query:
-            mock_filter_by = mock_achievement_query.filter_by.return_value
-            mock_filter_by.first.return_value = self.first_purchase
-
-            mock_ua_filter_by = mock_user_achievement_query.filter_by.return_value
-            mock_ua_filter_by.first.return_value = MagicMock()  # User already has the achievement
-
-            result = AchievementService._check_first_purchase(user_id)
-            self.assertEqual(result, [])  # No new achievements earned
-
-    def test_check_first_purchase_achievement_newly_earned(self):
-        user_id = 1
-
-        with patch('src.services.achievement_service.Achievement.query') as mock_achievement_query, \
-                patch('src.services.achievement_service.UserAchievement.query') as mock_user_achievement_query, \
-                patch('src.services.achievement_service.Purchase.query') as mock_purchase_query, \
-                patch('src.services.achievement_service.db.session') as mock_db_session:
-            mock_filter_by = mock_achievement_query.filter_by.return_value
-            mock_filter_by.first.return_value = self.first_purchase
-
-            mock_ua_filter_by = mock_user_achievement_query.filter_by.return_value
-            mock_ua_filter_by.first.return_value = None  # User doesn't have the achievement yet
-
-            mock_purchase_filter = mock_purchase_query.filter.return_value
-            mock_purchase_filter.count.return_value = 1  # User has 1 completed purchase
-
-            result = AchievementService._check_first_purchase(user_id)
-
-            # Verify achievement was awarded
-            self.assertEqual(len(result), 1)
-            self.assertEqual(result[0], self.first_purchase)
-            mock_db_session.add.assert_called_once()
-            mock_db_session.commit.assert_called_once()
-
-    def test_check_purchase_count_achievements(self):
-        user_id = 1
-
-        with patch('src.services.achievement_service.Achievement.query') as mock_achievement_query, \
-                patch('src.services.achievement_service.UserAchievement.query') as mock_user_achievement_query, \
-                patch('src.services.achievement_service.Purchase.query') as mock_purchase_query, \
-                patch('src.services.achievement_service.db.session') as mock_db_session:
-            mock_filter_by = mock_achievement_query.filter_by.return_value
-            mock_order_by = mock_filter_by.order_by.return_value
-            mock_order_by.all.return_value = [self.regular_buyer]
-
-            mock_purchase_filter = mock_purchase_query.filter.return_value
-            mock_purchase_filter.count.return_value = 10  # User has 10 completed purchases
-
-            mock_ua_filter_by = mock_user_achievement_query.filter_by.return_value
-            mock_ua_filter_by.first.return_value = None  # User doesn't have the achievement yet
-
-            result = AchievementService._check_purchase_count_achievements(user_id)
+    def add_purchase(self, purchase_date, status=PurchaseStatus.COMPLETED):
+        purchase = Purchase(user_id=self.user.id, restaurant_id=self.restaurant.id, quantity=1,
+                            total_price=Decimal('5.00'), status=status, purchase_date=purchase_date)
+        db.session.add(purchase)
+        db.session.commit()
+        return purchase
+
+    def add_comment(self, purchase, timestamp):
+        db.session.add(RestaurantComment(restaurant_id=self.restaurant.id, user_id=self.user.id,
+                                         purchase_id=purchase.id, comment="Good", rating=Decimal('4.5'),
+                                         timestamp=timestamp))
+        db.session.commit()
+
+    def count_statements(self):
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        sqlalchemy.event.listen(db.engine, 'before_cursor_execute', listener)
+        self.addCleanup(sqlalchemy.event.remove, db.engine, 'before_cursor_execute', listener)
+        return statements
+
+    def test_counters_follow_purchases_and_comments(self):
+        now = datetime.now(UTC).replace(tzinfo=None)
+        old = self.add_purchase(now - timedelta(days=30))
+        recent = self.add_purchase(now - timedelta(days=6))
+        pending = self.add_purchase(now, status=PurchaseStatus.PENDING)
+        self.add_comment(recent, now - timedelta(days=100))
+        self.add_comment(pending, now - timedelta(days=89))
+
+        self.assertEqual(AchievementService.get_activity_counters(self.user.id),
+                         {"completed_purchases": 2, "weekly_purchases": 1, "recent_comments": 1})
+
+        pending.status = PurchaseStatus.COMPLETED
+        db.session.commit()
+        db.session.delete(old)
+        db.session.commit()
+
+        counters = AchievementService.get_activity_counters(self.user.id)
+        self.assertEqual((counters["completed_purchases"], counters["weekly_purchases"]), (2, 2))
+
+        AchievementService.rebuild_activity_counters()
+        self.assertEqual(AchievementService.get_activity_counters(self.user.id), counters)
+
+    def test_empty_counters_are_backfilled_by_a_rebuild(self):
+        now = datetime.now(UTC).replace(tzinfo=None)
+        purchase = self.add_purchase(now - timedelta(days=3))
+        self.add_comment(purchase, now - timedelta(days=2))
+        counters = AchievementService.get_activity_counters(self.user.id)
+        # A database from before the counter tables has purchases and comments but no counters
+        db.session.query(UserActivityTotal).delete()
+        db.session.query(UserActivityDaily).delete()
+        db.session.commit()
+
+        self.assertEqual(AchievementService.rebuild_activity_counters(), {"users": 1})
+        self.assertEqual(AchievementService.get_activity_counters(self.user.id), counters)
 
-            # Verify achievement was awarded
-            self.assertEqual(len(result), 1)
-            self.assertEqual(result[0], self.regular_buyer)
-            mock_db_session.add.assert_called_once()
-            mock_db_session.commit.assert_called_once()
-
-    def test_check_weekly_purchase_achievement(self):
-        user_id = 1
-
-        with patch('src.services.achievement_service.Achievement.query') as mock_achievement_query, \
-                patch('src.services.achievement_service.UserAchievement.query') as mock_user_achievement_query, \
-                patch('src.services.achievement_service.Purchase.query') as mock_purchase_query, \
-                patch('src.services.achievement_service.datetime') as mock_datetime, \
-                patch('src.services.achievement_service.db.session') as mock_db_session:
-            mock_datetime.now.return_value = datetime(2025, 5, 15, 11, 6, 47, tzinfo=UTC)
-
-            mock_filter_by = mock_achievement_query.filter_by.return_value
-            mock_filter_by.first.return_value = self.weekly_champion
-
-            mock_ua_filter_by = mock_user_achievement_query.filter_by.return_value
-            mock_ua_filter_by.first.return_value = None  # User doesn't have the achievement yet
-
-            mock_purchase_filter = mock_purchase_query.filter.return_value
-            mock_purchase_filter.count.return_value = 7  # User has 7 purchases in the last week
-
-            result = AchievementService._check_weekly_purchase_achievement(user_id)
-
-            # Verify achievement was awarded
-            self.assertEqual(len(result), 1)
-            self.assertEqual(result[0], self.weekly_champion)
-            mock_db_session.add.assert_called_once()
-            mock_db_session.commit.assert_called_once()
-
-    def test_check_comment_achievement(self):
-        user_id = 1
-
-        with patch('src.services.achievement_service.Achievement.query') as mock_achievement_query, \
-                patch('src.services.achievement_service.UserAchievement.query') as mock_user_achievement_query, \
-                patch('src.services.achievement_service.db.session') as mock_db_session, \
-                patch('src.services.achievement_service.datetime') as mock_datetime:
-            mock_datetime.now.return_value = datetime(2025, 5, 15, 11, 6, 47, tzinfo=UTC)
-
-            mock_filter_by = mock_achievement_query.filter_by.return_value
-            mock_filter_by.first.return_value = self.regular_commenter
-
-            mock_ua_filter_by = mock_user_achievement_query.filter_by.return_value
-            mock_ua_filter_by.first.return_value = None  # User doesn't have the achievement yet
-
-            # Mock the query count directly
-            mock_count = MagicMock(return_value=150)  # User has 150 comments in last 90 days
-            with patch('src.services.achievement_service.db.session.query') as mock_query:
-                mock_query.return_value.filter.return_value.count = mock_count
-
-                result = AchievementService._check_comment_achievement(user_id)
-
-                # Verify achievement was awarded
-                self.assertEqual(len(result), 1)
-                self.assertEqual(result[0], self.regular_commenter)
-                mock_db_session.add.assert_called_once()
-                mock_db_session.commit.assert_called_once()
+    def test_check_and_award_achievements(self):
+        AchievementService.initialize_achievements()
+        now = datetime.now(UTC).replace(tzinfo=None)
+        for days_ago in (20, 6, 4, 2, 1):
+            self.add_purchase(now - timedelta(days=days_ago))
+        user_id = self.user.id
+        AchievementService.get_catalogue()
+        statements = self.count_statements()
+
+        newly_earned = AchievementService.check_and_award_achievements(user_id)
+
+        self.assertEqual([achievement.name for achievement in newly_earned], ["First Purchase", "Regular Buyer"])
+        # Counters, earned badges and the award
+        self.assertEqual(len(statements), 3)
+        self.assertEqual(UserAchievement.query.filter_by(user_id=self.user.id).count(), 2)
+
+        self.add_purchase(now)
+        newly_earned = AchievementService.check_and_award_achievements(self.user.id)
+        self.assertEqual([achievement.name for achievement in newly_earned], ["Weekly Champion"])
+        self.assertEqual(AchievementService.check_and_award_achievements(self.user.id), [])
+
+    def test_catalogue_is_cached_until_achievements_change(self):
+        AchievementService.initialize_achievements()
+        catalogue = AchievementService.get_catalogue()
+        statements = self.count_statements()
+        self.assertEqual(AchievementService.get_catalogue(), catalogue)
+        self.assertEqual(statements, [])
+
+        achievement = db.session.get(Achievement, catalogue[0].id)
+        achievement.is_active = False
+        db.session.commit()
+
+        self.assertEqual(len(AchievementService.get_catalogue()), len(catalogue) - 1)
 
     def test_get_user_achievements(self):
-        user_id = 1
-
-        with patch('src.services.achievement_service.UserAchievement.query') as mock_query:
-            mock_ua1 = MagicMock()
-            mock_ua1.achievement.id = 1
-            mock_ua1.achievement.name = "First Purchase"
-            mock_ua1.achievement.description = "Made your first purchase on FreshDeal"
-            mock_ua1.achievement.badge_image_url = "/static/badges/first_purchase.png"
-            mock_ua1.achievement.achievement_type = AchievementType.FIRST_PURCHASE
-            mock_ua1.earned_at = datetime(2025, 5, 10, tzinfo=UTC)
-
-            mock_filter_by = mock_query.filter_by.return_value
-            mock_filter_by.all.return_value = [mock_ua1]
-
-            result = AchievementService.get_user_achievements(user_id)
-
-            self.assertEqual(len(result), 1)
-            self.assertEqual(result[0]["id"], 1)
-            self.assertEqual(result[0]["name"], "First Purchase")
-            self.assertEqual(result[0]["description"], "Made your first purchase on FreshDeal")
-            self.assertEqual(result[0]["badge_image_url"], "/static/badges/first_purchase.png")
-            self.assertEqual(result[0]["earned_at"], "2025-05-10T00:00:00+00:00")
-            self.assertEqual(result[0]["achievement_type"], AchievementType.FIRST_PURCHASE.value)
+        AchievementService.initialize_achievements()
+        first_purchase = Achievement.query.filter_by(achievement_type=AchievementType.FIRST_PURCHASE).first()
+        db.session.add(UserAchievement(user_id=self.user.id, achievement_id=first_purchase.id,
+                                       earned_at=datetime(2025, 5, 10)))
+        db.session.commit()
+
+        result = AchievementService.get_user_achievements(self.user.id)
+
+        self.assertEqual(len(result), 1)
+        self.assertEqual(result[0]["id"], first_purchase.id)
+        self.assertEqual(result[0]["name"], "First Purchase")
+        self.assertEqual(result[0]["description"], "Made your first purchase on FreshDeal")
+        self.assertEqual(result[0]["badge_image_url"], "/static/badges/first_purchase.png")
+        self.assertEqual(result[0]["earned_at"], "2025-05-10T00:00:00")
+        self.assertEqual(result[0]["achievement_type"], AchievementType.FIRST_PURCHASE.value)
 
     def test_get_available_achievements(self):
-        with patch('src.services.achievement_service.Achievement.query') as mock_query:
-            mock_achievement = MagicMock()
-            mock_achievement.id = 1
-            mock_achievement.name = "First Purchase"
-            mock_achievement.description = "Made your first purchase on FreshDeal"
-            mock_achievement.badge_image_url = "/static/badges/first_purchase.png"
-            mock_achievement.achievement_type = AchievementType.FIRST_PURCHASE
-            mock_achievement.threshold = 1
-
-            mock_filter_by = mock_query.filter_by.return_value
-            mock_filter_by.all.return_value = [mock_achievement]
-
-            result = AchievementService.get_available_achievements()
-
-            self.assertEqual(len(result), 1)
-            self.assertEqual(result[0]["id"], 1)
-            self.assertEqual(result[0]["name"], "First Purchase")
-            self.assertEqual(result[0]["description"], "Made your first purchase on FreshDeal")
-            self.assertEqual(result[0]["badge_image_url"], "/static/badges/first_purchase.png")
-            self.assertEqual(result[0]["achievement_type"], AchievementType.FIRST_PURCHASE.value)
-            self.assertEqual(result[0]["threshold"], 1)
-
+        AchievementService.initialize_achievements()
+        Achievement.query.filter_by(name="FreshDeal Legend").first().is_active = False
+        db.session.commit()
+
+        result = AchievementService.get_available_achievements()
+
+        self.assertEqual(len(result), 6)
+        self.assertEqual(result[0]["name"], "First Purchase")
+        self.assertEqual(result[0]["description"], "Made your first purchase on FreshDeal")
+        self.assertEqual(result[0]["badge_image_url"], "/static/badges/first_purchase.png")
+        self.assertEqual(result[0]["achievement_type"], AchievementType.FIRST_PURCHASE.value)
+        self.assertEqual(result[0]["threshold"], 1)
+        self.assertNotIn("FreshDeal Legend", [achievement["name"] for achievement in result])
+
+    def test_earned_achievements_are_served_from_the_cache(self):
+        AchievementService.initialize_achievements()
+        commenter = Achievement.query.filter_by(achievement_type=AchievementType.REGULAR_COMMENTER).first()
+        other = User(name="Other User", email="other@test.com", phone_number="+901234567891",
+                     password="hashed", role="customer")
+        db.session.add(other)
+        db.session.commit()
+        user_id, other_id = self.user.id, other.id
+        AchievementService.get_catalogue()
+
+        statements = self.count_statements()
+        self.assertEqual(AchievementService.users_with_achievement_type(
+            [user_id, other_id, user_id], AchievementType.REGULAR_COMMENTER), set())
+        self.assertEqual(len(statements), 1)
+
+        statements.clear()
+        AchievementService.get_user_achievements(user_id)
+        self.assertEqual(AchievementService.check_and_award_achievements(user_id), [])
+        # Only the activity counters are read
+        self.assertEqual(len(statements), 1)
+
+        # Committing an award drops the user's cached set
+        db.session.add(UserAchievement(user_id=other_id, achievement_id=commenter.id))
+        db.session.commit()
+        self.assertEqual(AchievementService.users_with_achievement_type(
+            [user_id, other_id], AchievementType.REGULAR_COMMENTER), {other_id})
+
+    def test_catalogue_load_racing_a_write_is_not_kept(self):
+        AchievementService.initialize_achievements()
+        cache = get_achievement_cache()
+        original_query = Achievement.query
+
+        class RacingQuery:
+            def order_by(self, *args):
+                cache.invalidate_catalogue()
+                return original_query.order_by(*args)
+
+        with patch.object(Achievement, 'query', RacingQuery()):
+            cache.catalogue()
+        with patch.object(Achievement, 'query') as mock_query:
+            mock_query.order_by.return_value = []
+            self.assertEqual(cache.catalogue(), {})
+
+
+class TestLRUCache(unittest.TestCase):
+    def test_evicts_least_recently_used_and_expires(self):
+        now = [0.0]
+        cache = LRUCache(maxsize=2, ttl=10, clock=lambda: now[0])
+        cache.set(1, "a")
+        cache.set(2, "b")
+        self.assertEqual(cache.get(1), "a")
+
+        cache.set(3, "c")
+        self.assertIsNone(cache.get(2))
+        self.assertEqual((cache.get(1), cache.get(3)), ("a", "c"))
+
+        now[0] = 10.0
+        self.assertIsNone(cache.get(1))
+        self.assertEqual(len(cache), 1)
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -1,9 +1,11 @@
 import unittest
 from unittest.mock import patch, MagicMock
-from datetime import datetime, UTC
+from datetime import date, datetime, timedelta, UTC
 from decimal import Decimal
 from flask import Flask
-from src.models import db, Restaurant, Purchase, PurchaseStatus, RestaurantComment
+from sqlalchemy import event
+from src.models import db, Restaurant, Purchase, PurchaseStatus, RestaurantComment, RestaurantDailyStats, \
+    RestaurantDailyDistrictStats, User, CommentBadge
 from src.services.analytics_service import RestaurantAnalyticsService
 
 
@@ -24,6 +26,32 @@ class TestRestaurantAnalyticsService(unittest.TestCase):
         db.drop_all()
         self.app_context.pop()
 
+    def add_purchase(self, quantity, total_price, district=None, purchase_date=None,
+                     status=PurchaseStatus.COMPLETED, restaurant_id=1):
+        purchase = Purchase(restaurant_id=restaurant_id, quantity=quantity, total_price=Decimal(total_price),
+                            status=status, delivery_district=district,
+                            purchase_date=purchase_date or datetime(2025, 5, 15, 9, 0))
+        db.session.add(purchase)
+        db.session.commit()
+        return purchase
+
+    def add_comment(self, user, text, timestamp, restaurant_id=1, badges=()):
+        purchase = self.add_purchase(quantity=1, total_price="1.00", restaurant_id=restaurant_id,
+                                     status=PurchaseStatus.PENDING)
+        comment = RestaurantComment(restaurant_id=restaurant_id, user_id=user.id, purchase_id=purchase.id,
+                                    comment=text, rating=Decimal('4.5'), timestamp=timestamp)
+        comment.badges = [CommentBadge(badge_name=name, is_positive=True) for name in badges]
+        db.session.add(comment)
+        db.session.commit()
+        return comment
+
+    def add_user(self, name="Test User"):
+        user = User(name=name, email=f"{name.replace(' ', '').lower()}@test.com", phone_number=f"+100000000{User.query.count()}",
+                    password="hashed", role="customer")
+        db.session.add(user)
+        db.session.commit()
+        return user
+
     def test_get_owner_analytics_no_restaurants(self):
         with patch('src.services.analytics_service.Restaurant.query') as mock_restaurant_query:
             mock_restaurant_query.filter_by.return_value.all.return_value = []
@@ -37,9 +65,17 @@ class TestRestaurantAnalyticsService(unittest.TestCase):
     def test_get_owner_analytics_with_data(self):
         test_date = datetime(2025, 5, 15, 11, 19, 48, tzinfo=UTC)
 
+        self.add_purchase(quantity=2, total_price="25.00", district="Test District",
+                          purchase_date=datetime(2025, 5, 10, 9, 0))
+        # Completed in another month, so not counted
+        self.add_purchase(quantity=5, total_price="50.00", district="Test District",
+                          purchase_date=datetime(2025, 4, 30, 23, 0))
+
+        user = self.add_user()
+        self.add_comment(user, "Older", datetime(2025, 5, 14, 10, 0))
+        self.add_comment(user, "Great food!", datetime(2025, 5, 15, 11, 19, 48), badges=["fresh"])
+
         with patch('src.services.analytics_service.Restaurant.query') as mock_restaurant_query, \
-                patch('src.services.analytics_service.Purchase.query') as mock_purchase_query, \
-                patch('src.services.analytics_service.RestaurantComment.query') as mock_comment_query, \
                 patch('src.services.analytics_service.datetime') as mock_datetime:
             mock_datetime.utcnow.return_value = test_date
 
@@ -51,21 +87,6 @@ class TestRestaurantAnalyticsService(unittest.TestCase):
 
             mock_restaurant_query.filter_by.return_value.all.return_value = [mock_restaurant]
 
-            mock_purchase = MagicMock()
-            mock_purchase.quantity = 2
-            mock_purchase.total_price = "25.00"
-            mock_purchase.delivery_district = "Test District"
-
-            mock_purchase_query.filter.return_value.all.return_value = [mock_purchase]
-
-            mock_comment = MagicMock()
-            mock_comment.user.name = "Test User"
-            mock_comment.rating = 4.5
-            mock_comment.comment = "Great food!"
-            mock_comment.timestamp = "2025-05-15T11:19:48+00:00"
-
-            mock_comment_query.filter_by.return_value.order_by.return_value.all.return_value = [mock_comment]
-
             response, status = RestaurantAnalyticsService.get_owner_analytics(1)
 
             self.assertEqual(status, 200)
@@ -75,6 +96,8 @@ class TestRestaurantAnalyticsService(unittest.TestCase):
             self.assertEqual(response['data']['monthly_stats']['period'], "2025-05")
             self.assertEqual(response['data']['regional_distribution']["Test District"], 1)
             self.assertEqual(response['data']['restaurant_ratings']["Test Restaurant"]["average_rating"], 4.5)
+            comments = response['data']['restaurant_ratings']["Test Restaurant"]["recent_comments"]
+            self.assertEqual([comment["comment"] for comment in comments], ["Great food!", "Older"])
 
     def test_get_restaurant_analytics_not_found(self):
         with patch('src.services.analytics_service.Restaurant.query') as mock_restaurant_query:
@@ -89,9 +112,17 @@ class TestRestaurantAnalyticsService(unittest.TestCase):
     def test_get_restaurant_analytics_with_data(self):
         test_date = datetime(2025, 5, 15, 11, 19, 48, tzinfo=UTC)
 
+        self.add_purchase(quantity=2, total_price="25.00", district="Test District",
+                          purchase_date=datetime(2025, 5, 10, 9, 0))
+        # Completed in another month, so not counted
+        self.add_purchase(quantity=5, total_price="50.00", district="Test District",
+                          purchase_date=datetime(2025, 4, 30, 23, 0))
+
+        user = self.add_user()
+        self.add_comment(user, "Older", datetime(2025, 5, 14, 10, 0))
+        self.add_comment(user, "Great food!", datetime(2025, 5, 15, 11, 19, 48), badges=["fresh"])
+
         with patch('src.services.analytics_service.Restaurant.query') as mock_restaurant_query, \
-                patch('src.services.analytics_service.Purchase.query') as mock_purchase_query, \
-                patch('src.services.analytics_service.RestaurantComment.query') as mock_comment_query, \
                 patch('src.services.analytics_service.datetime') as mock_datetime:
             mock_datetime.utcnow.return_value = test_date
 
@@ -103,22 +134,6 @@ class TestRestaurantAnalyticsService(unittest.TestCase):
 
             mock_restaurant_query.get.return_value = mock_restaurant
 
-            mock_purchase = MagicMock()
-            mock_purchase.quantity = 2
-            mock_purchase.total_price = "25.00"
-            mock_purchase.delivery_district = "Test District"
-
-            mock_purchase_query.filter.return_value.all.return_value = [mock_purchase]
-
-            mock_comment = MagicMock()
-            mock_comment.user.name = "Test User"
-            mock_comment.rating = 4.5
-            mock_comment.comment = "Great food!"
-            mock_comment.timestamp = "2025-05-15T11:19:48+00:00"
-            mock_comment.badges = []
-
-            mock_comment_query.filter_by.return_value.order_by.return_value.all.return_value = [mock_comment]
-
             response, status = RestaurantAnalyticsService.get_restaurant_analytics(1)
 
             self.assertEqual(status, 200)
@@ -129,6 +144,221 @@ class TestRestaurantAnalyticsService(unittest.TestCase):
             self.assertEqual(response['data']['regional_distribution']["Test District"], 1)
             self.assertEqual(response['data']['restaurant_stats']["average_rating"], 4.5)
             self.assertEqual(response['data']['restaurant_stats']["recent_comments"][0]["user_name"], "Test User")
+            self.assertEqual(response['data']['restaurant_stats']["recent_comments"][0]["badges"],
+                             [{"name": "fresh", "is_positive": True}])
+
+    def test_owner_analytics_query_count_does_not_grow_with_restaurants_or_comments(self):
+        owner = self.add_user("Owner")
+        customer = self.add_user("Customer")
+
+        def add_restaurants(count):
+            for _ in range(count):
+                restaurant = Restaurant(owner_id=owner.id, restaurantName=f"Restaurant {Restaurant.query.count()}",
+                                        category="Test", longitude=Decimal('28.97'), latitude=Decimal('41.01'))
+                db.session.add(restaurant)
+                db.session.commit()
+                for minute in range(7):
+                    self.add_comment(customer, f"Comment {minute}", datetime(2025, 5, 1, 12, minute),
+                                     restaurant_id=restaurant.id, badges=["fresh"])
+
+        def count_queries():
+            statements = []
+
+            def count(*args):
+                statements.append(args[2])
+
+            owner_id = owner.id
+            db.session.expire_all()
+            event.listen(db.engine, 'before_cursor_execute', count)
+            try:
+                response, status = RestaurantAnalyticsService.get_owner_analytics(owner_id)
+            finally:
+                event.remove(db.engine, 'before_cursor_execute', count)
+            self.assertEqual(status, 200)
+            return len(statements), response
+
+        add_restaurants(1)
+        few, _ = count_queries()
+        add_restaurants(3)
+        many, response = count_queries()
+
+        # Restaurants, the two rollup sums and the ranked comments with their users
+        self.assertEqual((few, many), (4, 4))
+        for stats in response['data']['restaurant_ratings'].values():
+            self.assertEqual([comment["comment"] for comment in stats["recent_comments"]],
+                             [f"Comment {minute}" for minute in range(6, 1, -1)])
+
+    def test_rollups_follow_status_transitions(self):
+        purchase = self.add_purchase(quantity=3, total_price="30.00", district="Kadikoy",
+                                     status=PurchaseStatus.ACCEPTED)
+        period = (date(2025, 5, 1), date(2025, 5, 31))
+
+        self.assertEqual(RestaurantAnalyticsService.get_period_stats([1], *period), (0, Decimal('0'), {}))
+
+        purchase.update_status(PurchaseStatus.COMPLETED)
+        db.session.commit()
+        self.assertEqual(RestaurantAnalyticsService.get_period_stats([1], *period),
+                         (3, Decimal('30.00'), {"Kadikoy": 1}))
+
+        # Leaving COMPLETED, even on an expired instance, takes the purchase back out
+        db.session.expire(purchase)
+        purchase.status = PurchaseStatus.REJECTED
+        db.session.commit()
+        self.assertEqual(RestaurantAnalyticsService.get_period_stats([1], *period), (0, Decimal('0'), {}))
+
+    def test_weekly_and_custom_periods_use_the_same_rollups(self):
+        self.add_purchase(quantity=1, total_price="10.00", purchase_date=datetime(2025, 5, 12, 8, 0))
+        self.add_purchase(quantity=2, total_price="20.00", purchase_date=datetime(2025, 5, 15, 8, 0))
+        self.add_purchase(quantity=4, total_price="40.00", purchase_date=datetime(2025, 5, 2, 8, 0))
+
+        week = RestaurantAnalyticsService.resolve_period('week', today=date(2025, 5, 15))
+        self.assertEqual(week, (date(2025, 5, 12), date(2025, 5, 15), "2025-W20"))
+        self.assertEqual(RestaurantAnalyticsService.get_period_stats([1], *week[:2])[:2], (3, Decimal('30.00')))
+
+        custom = RestaurantAnalyticsService.resolve_period(start_date="2025-05-01", end_date="2025-05-12")
+        self.assertEqual(custom[2], "2025-05-01/2025-05-12")
+        self.assertEqual(RestaurantAnalyticsService.get_period_stats([1], *custom[:2])[:2], (5, Decimal('50.00')))
+
+    def test_invalid_period_is_rejected(self):
+        response, status = RestaurantAnalyticsService.get_restaurant_analytics(
+            1, start_date="2025-05-12", end_date="2025-05-01")
+
+        self.assertEqual(status, 400)
+        self.assertFalse(response['success'])
+
+    def test_backfill_matches_incremental_rollups(self):
+        self.add_purchase(quantity=2, total_price="25.00", district="Kadikoy", purchase_date=datetime(2025, 5, 3, 23, 59))
+        self.add_purchase(quantity=1, total_price="5.50", district="Kadikoy", purchase_date=datetime(2025, 5, 4, 0, 1))
+        self.add_purchase(quantity=7, total_price="70.00", purchase_date=datetime(2025, 5, 4, 12, 0),
+                          status=PurchaseStatus.PENDING)
+        incremental = [(row.day, row.units_sold, row.revenue) for row in
+                       RestaurantDailyStats.query.order_by(RestaurantDailyStats.day)]
+
+        RestaurantDailyStats.query.delete()
+        RestaurantDailyDistrictStats.query.delete()
+        db.session.commit()
+        RestaurantAnalyticsService.rebuild_daily_stats(end_day=date(2025, 5, 31))
+
+        rebuilt = [(row.day, row.units_sold, row.revenue) for row in
+                   RestaurantDailyStats.query.order_by(RestaurantDailyStats.day)]
+        self.assertEqual(rebuilt, incremental)
+        self.assertEqual(rebuilt, [(date(2025, 5, 3), 2, Decimal('25.00')), (date(2025, 5, 4), 1, Decimal('5.50'))])
+        self.assertEqual(RestaurantAnalyticsService.get_period_stats([1], date(2025, 5, 1), date(2025, 5, 31))[2],
+                         {"Kadikoy": 2})
+
+
+    def add_restaurant(self, owner):
+        restaurant = Restaurant(owner_id=owner.id, restaurantName=f"Restaurant {Restaurant.query.count()}",
+                                category="Test", longitude=Decimal('28.97'), latitude=Decimal('41.01'))
+        db.session.add(restaurant)
+        db.session.commit()
+        return restaurant
+
+    def test_timeseries_buckets_rollups_by_day_week_and_month(self):
+        owner = self.add_user("Owner")
+        restaurant = self.add_restaurant(owner)
+        other = self.add_restaurant(owner)
+        customer = self.add_user("Customer")
+
+        self.add_purchase(quantity=2, total_price="20.00", purchase_date=datetime(2025, 5, 5, 9, 0),
+                          restaurant_id=restaurant.id)
+        self.add_purchase(quantity=1, total_price="7.50", purchase_date=datetime(2025, 5, 5, 18, 0),
+                          restaurant_id=other.id)
+        self.add_purchase(quantity=3, total_price="30.00", purchase_date=datetime(2025, 5, 12, 9, 0),
+                          restaurant_id=restaurant.id, status=PurchaseStatus.REJECTED)
+        self.add_purchase(quantity=1, total_price="10.00", purchase_date=datetime(2025, 6, 2, 9, 0),
+                          restaurant_id=restaurant.id)
+        self.add_comment(customer, "Good", datetime(2025, 5, 5, 10, 0), restaurant_id=restaurant.id)
+
+        response, status = RestaurantAnalyticsService.get_timeseries(
+            owner.id, 'day', start_date="2025-05-05", end_date="2025-05-07")
+        self.assertEqual(status, 200)
+        self.assertEqual(response['data']['restaurant_ids'], [restaurant.id, other.id])
+        self.assertEqual([bucket["start"] for bucket in response['data']['buckets']],
+                         ["2025-05-05T00:00:00", "2025-05-06T00:00:00", "2025-05-07T00:00:00"])
+        first = response['data']['buckets'][0]
+        self.assertEqual((first["revenue"], first["units_sold"], first["orders"]), ("27.50", 3, 2))
+        self.assertEqual((first["average_rating"], first["rating_count"]), (4.5, 1))
+        self.assertEqual(response['data']['buckets'][1]["revenue"], "0.00")
+        self.assertIsNone(response['data']['buckets'][1]["average_rating"])
+
+        response, _ = RestaurantAnalyticsService.get_timeseries(
+            owner.id, 'week', start_date="2025-05-07", end_date="2025-05-18")
+        weeks = response['data']['buckets']
+        self.assertEqual((response['data']['start_date'], response['data']['end_date']), ("2025-05-05", "2025-05-18"))
+        self.assertEqual([bucket["start"] for bucket in weeks], ["2025-05-05T00:00:00", "2025-05-12T00:00:00"])
+        self.assertEqual([bucket["orders"] for bucket in weeks], [2, 0])
+        self.assertEqual((weeks[1]["rejected_orders"], weeks[1]["rejection_rate"]), (1, 1.0))
+
+        response, _ = RestaurantAnalyticsService.get_timeseries(
+            owner.id, 'month', start_date="2025-05-01", end_date="2025-06-30", restaurant_id=restaurant.id)
+        months = response['data']['buckets']
+        self.assertEqual(response['data']['restaurant_ids'], [restaurant.id])
+        self.assertEqual([(bucket["revenue"], bucket["rejection_rate"]) for bucket in months],
+                         [("20.00", 0.5), ("10.00", 0.0)])
+
+    def test_hourly_timeseries_reads_raw_purchases(self):
+        owner = self.add_user("Owner")
+        restaurant = self.add_restaurant(owner)
+        self.add_purchase(quantity=2, total_price="20.00", purchase_date=datetime(2025, 5, 5, 9, 15),
+                          restaurant_id=restaurant.id)
+        self.add_purchase(quantity=1, total_price="5.00", purchase_date=datetime(2025, 5, 5, 9, 45),
+                          restaurant_id=restaurant.id, status=PurchaseStatus.REJECTED)
+        self.add_purchase(quantity=4, total_price="40.00", purchase_date=datetime(2025, 5, 5, 11, 0),
+                          restaurant_id=restaurant.id)
+
+        response, status = RestaurantAnalyticsService.get_timeseries(
+            owner.id, 'hour', start_date="2025-05-05", end_date="2025-05-05")
+
+        self.assertEqual(status, 200)
+        buckets = response['data']['buckets']
+        self.assertEqual(len(buckets), 24)
+        self.assertEqual((buckets[9]["revenue"], buckets[9]["units_sold"], buckets[9]["rejection_rate"]),
+                         ("20.00", 2, 0.5))
+        self.assertEqual(buckets[11]["orders"], 1)
+        self.assertEqual(sum(bucket["orders"] for bucket in buckets), 2)
+
+    def test_invalid_timeseries_requests(self):
+        owner = self.add_user("Owner")
+        restaurant = self.add_restaurant(owner)
+        stranger = self.add_user("Stranger")
+
+        _, status = RestaurantAnalyticsService.get_timeseries(owner.id, 'minute')
+        self.assertEqual(status, 400)
+        # A year of hours is far more than MAX_TIMESERIES_BUCKETS
+        _, status = RestaurantAnalyticsService.get_timeseries(
+            owner.id, 'hour', start_date="2025-01-01", end_date="2025-12-31")
+        self.assertEqual(status, 400)
+        _, status = RestaurantAnalyticsService.get_timeseries(stranger.id, restaurant_id=restaurant.id)
+        self.assertEqual(status, 404)
+
+    def test_reconcile_recounts_recent_days_and_backfill_the_history(self):
+        today = datetime.utcnow().replace(hour=9, minute=0, second=0, microsecond=0)
+        self.add_purchase(quantity=2, total_price="25.00", purchase_date=today - timedelta(days=30))
+        self.add_purchase(quantity=1, total_price="5.50", purchase_date=today)
+        RestaurantDailyStats.query.delete()
+        db.session.commit()
+
+        self.assertEqual(RestaurantAnalyticsService.reconcile_daily_stats(), {"rows": 1})
+        self.assertEqual([row.day for row in RestaurantDailyStats.query], [today.date()])
+
+        self.assertEqual(RestaurantAnalyticsService.backfill_daily_stats(), {"rows": 2})
+        self.assertEqual(sorted(row.units_sold for row in RestaurantDailyStats.query), [1, 2])
+
+    def test_backfill_counts_rejected_purchases(self):
+        self.add_purchase(quantity=2, total_price="25.00", purchase_date=datetime(2025, 5, 3, 12, 0),
+                          status=PurchaseStatus.REJECTED)
+        incremental = [(row.day, row.completed_purchases, row.rejected_purchases, row.revenue)
+                       for row in RestaurantDailyStats.query]
+
+        RestaurantDailyStats.query.delete()
+        db.session.commit()
+        RestaurantAnalyticsService.rebuild_daily_stats(end_day=date(2025, 5, 31))
+
+        rebuilt = [(row.day, row.completed_purchases, row.rejected_purchases, row.revenue)
+                   for row in RestaurantDailyStats.query]
+        self.assertEqual(rebuilt, incremental)
+        self.assertEqual(rebuilt, [(date(2025, 5, 3), 0, 1, Decimal('0.00'))])
 
 
 if __name__ == '__main__':
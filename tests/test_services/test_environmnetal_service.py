@@ -3,7 +3,9 @@ from unittest.mock import patch, MagicMock
 from datetime import datetime, timedelta, UTC
 from decimal import Decimal
 from flask import Flask
-from src.models import db, Purchase, PurchaseStatus, EnvironmentalContribution
+from sqlalchemy import event
+from src.models import db, Purchase, PurchaseStatus, EnvironmentalContribution, UserEnvironmentalTotal, \
+    UserEnvironmentalDaily
 from src.services.environmental_service import EnvironmentalService
 
 
@@ -70,8 +72,7 @@ class TestEnvironmentalService(unittest.TestCase):
         self.assertFalse(result)
 
     def test_get_user_contributions(self):
-        with patch('src.services.environmental_service.datetime') as mock_datetime:
-            mock_datetime.now.return_value = self.test_datetime
+        with patch('src.services.environmental_service._utcnow', return_value=self.test_datetime):
 
             contributions = [
                 EnvironmentalContribution(
@@ -99,8 +100,7 @@ class TestEnvironmentalService(unittest.TestCase):
             self.assertEqual(result['data']['unit'], 'kg CO2 equivalent')
 
     def test_get_all_users_contributions(self):
-        with patch('src.services.environmental_service.datetime') as mock_datetime:
-            mock_datetime.now.return_value = self.test_datetime
+        with patch('src.services.environmental_service._utcnow', return_value=self.test_datetime):
 
             contributions = [
                 EnvironmentalContribution(
@@ -136,5 +136,67 @@ class TestEnvironmentalService(unittest.TestCase):
             self.assertEqual(result['unit'], 'kg CO2 equivalent')
 
 
+    def totals(self):
+        totals = [(row.user_id, row.total_co2_avoided)
+                  for row in UserEnvironmentalTotal.query.order_by(UserEnvironmentalTotal.user_id)]
+        days = [(row.user_id, row.day, row.co2_avoided)
+                for row in UserEnvironmentalDaily.query.order_by(UserEnvironmentalDaily.user_id, UserEnvironmentalDaily.day)]
+        return totals, days
+
+    def test_totals_are_updated_incrementally_and_match_rebuild(self):
+        db.session.add_all([
+            EnvironmentalContribution(user_id=1, purchase_id=1, co2_avoided=Decimal('2.50'),
+                                      created_at=self.test_datetime),
+            EnvironmentalContribution(user_id=1, purchase_id=2, co2_avoided=Decimal('1.25'),
+                                      created_at=self.test_datetime - timedelta(days=40)),
+            EnvironmentalContribution(user_id=2, purchase_id=3, co2_avoided=Decimal('1.25'),
+                                      created_at=self.test_datetime)
+        ])
+        db.session.commit()
+        incremental = self.totals()
+
+        self.assertEqual(incremental[0], [(1, Decimal('3.75')), (2, Decimal('1.25'))])
+        self.assertEqual(len(incremental[1]), 3)
+        self.assertEqual(EnvironmentalService.rebuild_contribution_totals(), {"users": 2})
+        self.assertEqual(self.totals(), incremental)
+
+    def test_empty_totals_are_backfilled_by_a_rebuild(self):
+        db.session.add_all([
+            EnvironmentalContribution(user_id=1, purchase_id=1, co2_avoided=Decimal('2.50'),
+                                      created_at=self.test_datetime),
+            EnvironmentalContribution(user_id=2, purchase_id=2, co2_avoided=Decimal('1.25'),
+                                      created_at=self.test_datetime - timedelta(days=40))
+        ])
+        db.session.commit()
+        expected = self.totals()
+        # A database from before the totals tables has contributions but no totals
+        db.session.query(UserEnvironmentalTotal).delete()
+        db.session.query(UserEnvironmentalDaily).delete()
+        db.session.commit()
+
+        self.assertEqual(EnvironmentalService.rebuild_contribution_totals(), {"users": 2})
+        self.assertEqual(self.totals(), expected)
+
+    def test_get_user_contributions_reads_one_row(self):
+        db.session.add(EnvironmentalContribution(user_id=1, purchase_id=1, co2_avoided=Decimal('2.50')))
+        db.session.commit()
+        EnvironmentalService.get_user_contributions(1)
+        statements = []
+
+        def count(*args):
+            statements.append(args[2])
+
+        event.listen(db.engine, 'before_cursor_execute', count)
+        try:
+            result = EnvironmentalService.get_user_contributions(1)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', count)
+
+        self.assertEqual(len(statements), 1)
+        self.assertEqual(result['data']['total_co2_avoided'], 2.5)
+        self.assertEqual(result['data']['monthly_co2_avoided'], 2.5)
+        self.assertEqual(result['data']['rank'], 1)
+
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,220 @@
+import json
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+
+from flask import Flask
+
+from src.models import db, User, UserDevice
+from src.services.expo_push_dispatcher import ExpoPushDispatcher
+from src.services.notification_service import NotificationService
+
+
+class StubExpoServer:
+    """
+    Local HTTP server standing in for the Expo push API.
+
+    Each path has a queue of (status, body) responses; when a queue runs dry
+    the default handler answers with an "ok" ticket or receipt for every item.
+    """
+
+    def __init__(self):
+        self.requests = []
+        self.responses = {}
+        self.receipts = {}
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                payload = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                stub.requests.append((self.path, payload))
+
+                queued = stub.responses.get(self.path)
+                if queued:
+                    status, body = queued.pop(0)
+                elif self.path.endswith('/send'):
+                    status = 200
+                    body = {"data": [{"status": "ok", "id": f"ticket-{message['to']}"} for message in payload]}
+                else:
+                    status = 200
+                    body = {"data": {ticket_id: stub.receipts[ticket_id]
+                                     for ticket_id in payload["ids"] if ticket_id in stub.receipts}}
+
+                encoded = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(encoded)))
+                self.end_headers()
+                self.wfile.write(encoded)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def sends(self):
+        return [payload for path, payload in self.requests if path.endswith('/send')]
+
+
+class TestExpoPushDispatcher(unittest.TestCase):
+    def setUp(self):
+        self.stub = StubExpoServer()
+        self.stub.start()
+        self.dispatcher = ExpoPushDispatcher(
+            push_url=f"{self.stub.base_url}/send",
+            receipts_url=f"{self.stub.base_url}/getReceipts",
+            backoff_seconds=0,
+        )
+
+    def tearDown(self):
+        self.dispatcher.session.close()
+        self.stub.stop()
+
+    def messages(self, count):
+        return [{"to": f"ExponentPushToken[token-{i}]", "title": "Title", "body": "Body"} for i in range(count)]
+
+    def test_send_splits_into_batches(self):
+        result = self.dispatcher.send(self.messages(250))
+
+        self.assertEqual([len(batch) for batch in self.stub.sends()], [100, 100, 50])
+        self.assertEqual(result["sent"], 250)
+        self.assertEqual(result["failed_batches"], 0)
+        self.assertEqual(self.dispatcher.pending_receipt_count, 250)
+
+    def test_send_retries_throttled_and_failed_batches(self):
+        self.stub.responses['/send'] = [(429, {}), (503, {})]
+
+        result = self.dispatcher.send(self.messages(3))
+
+        self.assertEqual(len(self.stub.sends()), 3)
+        self.assertEqual(result["sent"], 3)
+
+    def test_send_gives_up_after_max_retries(self):
+        self.stub.responses['/send'] = [(500, {})] * 4
+
+        result = self.dispatcher.send(self.messages(3))
+
+        self.assertEqual(len(self.stub.sends()), 4)
+        self.assertEqual(result["failed"], 3)
+        self.assertEqual(result["failed_batches"], 1)
+
+    def test_send_does_not_retry_client_errors(self):
+        self.stub.responses['/send'] = [(400, {"errors": [{"code": "VALIDATION_ERROR"}]})]
+
+        result = self.dispatcher.send(self.messages(2))
+
+        self.assertEqual(len(self.stub.sends()), 1)
+        self.assertEqual(result["failed_batches"], 1)
+
+    def test_send_reports_unregistered_tokens_from_tickets(self):
+        self.stub.responses['/send'] = [(200, {"data": [
+            {"status": "ok", "id": "ticket-0"},
+            {"status": "error", "message": "not registered", "details": {"error": "DeviceNotRegistered"}},
+            {"status": "error", "message": "too big", "details": {"error": "MessageTooBig"}},
+        ]})]
+
+        result = self.dispatcher.send(self.messages(3))
+
+        self.assertEqual(result["sent"], 1)
+        self.assertEqual(result["failed"], 2)
+        self.assertEqual(result["dead_tokens"], ["ExponentPushToken[token-1]"])
+        self.assertEqual(self.dispatcher.pending_receipt_count, 1)
+
+    def test_check_receipts(self):
+        self.dispatcher.send(self.messages(3))
+        self.stub.receipts = {
+            "ticket-ExponentPushToken[token-0]": {"status": "ok"},
+            "ticket-ExponentPushToken[token-1]": {"status": "error", "details": {"error": "DeviceNotRegistered"}},
+        }
+
+        dead_tokens = self.dispatcher.check_receipts()
+
+        self.assertEqual(dead_tokens, ["ExponentPushToken[token-1]"])
+        # The receipt of the third ticket is not ready yet
+        self.assertEqual(self.dispatcher.pending_receipt_count, 1)
+
+    def test_check_receipts_respects_min_age(self):
+        self.dispatcher.send(self.messages(2))
+
+        self.assertEqual(self.dispatcher.check_receipts(min_age_seconds=3600), [])
+        self.assertEqual([path for path, _ in self.stub.requests if path.endswith('/getReceipts')], [])
+
+
+class TestPushReceiptProcessing(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config['TESTING'] = True
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+        db.init_app(self.app)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        user = User(name="Test User", email="test@test.com", phone_number="+901234567890",
+                    password="hashedpassword", role="customer")
+        db.session.add(user)
+        db.session.commit()
+        db.session.add_all([
+            UserDevice(user_id=user.id, push_token="alive", device_type="ios", is_active=True),
+            UserDevice(user_id=user.id, push_token="gone", device_type="ios", is_active=True),
+        ])
+        db.session.commit()
+
+        self.stub = StubExpoServer()
+        self.stub.start()
+        self.dispatcher = ExpoPushDispatcher(
+            push_url=f"{self.stub.base_url}/send",
+            receipts_url=f"{self.stub.base_url}/getReceipts",
+            backoff_seconds=0,
+        )
+        patcher = patch('src.services.notification_service.get_push_dispatcher', return_value=self.dispatcher)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.dispatcher.session.close()
+        self.stub.stop()
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_dead_tokens_are_deactivated_from_receipts(self):
+        self.assertTrue(NotificationService.send_push_notification(["alive", "gone"], "Title", "Body"))
+        self.stub.receipts = {
+            "ticket-ExponentPushToken[alive]": {"status": "ok"},
+            "ticket-ExponentPushToken[gone]": {"status": "error", "details": {"error": "DeviceNotRegistered"}},
+        }
+
+        deactivated = NotificationService.process_push_receipts(min_age_seconds=0)
+
+        self.assertEqual(deactivated, 1)
+        self.assertTrue(UserDevice.query.filter_by(push_token="alive").first().is_active)
+        self.assertFalse(UserDevice.query.filter_by(push_token="gone").first().is_active)
+
+    def test_dead_tokens_are_deactivated_from_tickets(self):
+        self.stub.responses['/send'] = [(200, {"data": [
+            {"status": "ok", "id": "ticket-alive"},
+            {"status": "error", "details": {"error": "DeviceNotRegistered"}},
+        ]})]
+
+        NotificationService.send_push_notification(["alive", "gone"], "Title", "Body")
+
+        self.assertFalse(UserDevice.query.filter_by(push_token="gone").first().is_active)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,11 +1,11 @@
 import unittest
 from unittest.mock import patch, MagicMock
-from datetime import datetime, UTC
+from datetime import datetime, timedelta, UTC
 from decimal import Decimal
 from flask import Flask
-from src.models import db, User, DiscountEarned, Purchase
+from src.models import db, User, DiscountEarned, Purchase, UserDiscountTotal, UserDiscountDaily
 from src.services.gamification_services import add_discount_point, get_user_rankings, get_single_user_rank, \
-    get_monthly_user_rankings, get_single_user_monthly_rank
+    get_monthly_user_rankings, get_single_user_monthly_rank, get_user_rank_neighbourhood, rebuild_discount_leaderboard
 
 
 class TestGamificationService(unittest.TestCase):
@@ -157,5 +157,127 @@ class TestGamificationService(unittest.TestCase):
         self.assertEqual(response['total_discount'], 0.0)
 
 
+class TestDiscountLeaderboard(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config['TESTING'] = True
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+
+        db.init_app(self.app)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        self.now = datetime(2025, 5, 15, 11, 32, 25)
+        self.users = [User(name=f"User {i}", email=f"user{i}@test.com", phone_number=f"+90123456789{i}",
+                           password="hashed", role="customer") for i in range(6)]
+        db.session.add_all(self.users)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def earn(self, user, discount, earned_at=None):
+        db.session.add(DiscountEarned(user_id=user.id, discount=Decimal(discount), earned_at=earned_at or self.now))
+        db.session.commit()
+
+    def leaderboard(self):
+        totals = [(row.user_id, row.total_discount) for row in UserDiscountTotal.query.order_by(UserDiscountTotal.user_id)]
+        days = [(row.user_id, row.day, row.discount)
+                for row in UserDiscountDaily.query.order_by(UserDiscountDaily.user_id, UserDiscountDaily.day)]
+        return totals, days
+
+    def test_leaderboard_is_updated_incrementally_and_matches_rebuild(self):
+        self.earn(self.users[0], "10.00", self.now - timedelta(days=40))
+        self.earn(self.users[0], "2.50")
+        self.earn(self.users[1], "4.00")
+        discount = DiscountEarned.query.filter_by(user_id=self.users[1].id).first()
+        db.session.delete(discount)
+        db.session.commit()
+        incremental = self.leaderboard()
+
+        self.assertEqual(incremental[0], [(self.users[0].id, Decimal('12.50')), (self.users[1].id, Decimal('0.00'))])
+        self.assertEqual(rebuild_discount_leaderboard(), {"users": 1})
+        rebuilt = self.leaderboard()
+        self.assertEqual(rebuilt[0], incremental[0][:1])
+        self.assertEqual(rebuilt[1], [row for row in incremental[1] if row[2]])
+
+    def test_empty_leaderboard_is_backfilled_by_a_rebuild(self):
+        self.earn(self.users[0], "10.00", self.now - timedelta(days=40))
+        self.earn(self.users[1], "4.00")
+        expected = self.leaderboard()
+        # A database from before the leaderboard tables has discount points but no totals
+        db.session.query(UserDiscountTotal).delete()
+        db.session.query(UserDiscountDaily).delete()
+        db.session.commit()
+
+        self.assertEqual(rebuild_discount_leaderboard(), {"users": 2})
+        self.assertEqual(self.leaderboard(), expected)
+
+    def test_rankings_pages_share_ranks_between_equal_totals(self):
+        for user, discount in zip(self.users, ["50.00", "30.00", "30.00", "30.00", "10.00"]):
+            self.earn(user, discount)
+
+        rankings, status = get_user_rankings()
+        self.assertEqual(status, 200)
+        self.assertEqual([entry['rank'] for entry in rankings], [1, 2, 2, 2, 5])
+        # Equal totals are ordered by user id, descending as strings like a Redis sorted set does
+        self.assertEqual([entry['user_id'] for entry in rankings],
+                         [user.id for user in (self.users[0], self.users[3], self.users[2], self.users[1], self.users[4])])
+
+        # A page starting inside a tie keeps the tie's rank
+        page, _ = get_user_rankings(limit=2, offset=2)
+        self.assertEqual([(entry['user_id'], entry['rank']) for entry in page],
+                         [(self.users[2].id, 2), (self.users[1].id, 2)])
+        page, _ = get_user_rankings(limit=2, offset=4)
+        self.assertEqual([(entry['user_id'], entry['rank']) for entry in page], [(self.users[4].id, 5)])
+
+        response, _ = get_single_user_rank(self.users[3].id)
+        self.assertEqual((response['rank'], response['total_discount']), (2, 30.0))
+        response, _ = get_single_user_rank(self.users[5].id)
+        self.assertEqual((response['rank'], response['total_discount']), (6, 0.0))
+
+    def test_neighbourhood_around_user(self):
+        for user, discount in zip(self.users, ["60.00", "50.00", "40.00", "30.00", "20.00", "10.00"]):
+            self.earn(user, discount)
+
+        response, status = get_user_rank_neighbourhood(self.users[3].id, radius=1)
+
+        self.assertEqual(status, 200)
+        self.assertEqual(response['rank'], 4)
+        self.assertEqual([(entry['user_id'], entry['rank']) for entry in response['rankings']],
+                         [(self.users[2].id, 3), (self.users[3].id, 4), (self.users[4].id, 5)])
+
+        response, _ = get_user_rank_neighbourhood(self.users[0].id, radius=2)
+        self.assertEqual([entry['rank'] for entry in response['rankings']], [1, 2, 3])
+
+        _, status = get_user_rank_neighbourhood(self.users[0].id, radius=1000)
+        self.assertEqual(status, 400)
+        _, status = get_user_rank_neighbourhood(999)
+        self.assertEqual(status, 404)
+
+    def test_monthly_rankings_sum_the_last_thirty_daily_buckets(self):
+        self.earn(self.users[0], "100.00", self.now - timedelta(days=30))
+        self.earn(self.users[0], "5.00", self.now - timedelta(days=29))
+        self.earn(self.users[1], "20.00", self.now)
+
+        with patch('src.services.gamification_services.datetime') as mock_datetime:
+            mock_datetime.now.return_value = self.now
+
+            data = get_monthly_user_rankings().get_json()
+            self.assertEqual([(entry['user_id'], entry['total_discount'], entry['rank']) for entry in data],
+                             [(self.users[1].id, 20.0, 1), (self.users[0].id, 5.0, 2)])
+
+            data = get_single_user_monthly_rank(self.users[0].id)[0].get_json()
+            self.assertEqual((data['rank'], data['total_discount']), (2, 5.0))
+
+            response, _ = get_user_rank_neighbourhood(self.users[1].id, radius=1, monthly=True)
+            self.assertEqual([entry['user_id'] for entry in response['rankings']],
+                             [self.users[1].id, self.users[0].id])
+
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
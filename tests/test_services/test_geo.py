@@ -0,0 +1,49 @@
+import unittest
+from decimal import Decimal
+import numpy as np
+from src.utils.geo import haversine, haversine_distances, distances_within, geohash
+
+
+class TestGeo(unittest.TestCase):
+    def test_haversine_known_distance(self):
+        # Istanbul (Sultanahmet) to Ankara (Kizilay), roughly 350km
+        distance = haversine(41.0054, 28.9768, 39.9208, 32.8541)
+        self.assertAlmostEqual(distance, 351, delta=3)
+
+    def test_vectorized_matches_scalar(self):
+        lats = [41.0, 41.1, 40.5, -33.9]
+        lons = [29.0, 29.2, 28.1, 151.2]
+        distances = haversine_distances(41.0, 29.0, lats, lons)
+        for distance, lat, lon in zip(distances, lats, lons):
+            self.assertAlmostEqual(distance, haversine(41.0, 29.0, lat, lon), places=6)
+
+    def test_many_origins(self):
+        distances = haversine_distances([41.0, 40.0], [29.0, 28.0], [41.0, 40.0, 39.0], [29.0, 28.0, 27.0])
+        self.assertEqual(distances.shape, (2, 3))
+        self.assertAlmostEqual(distances[0, 0], 0.0)
+        self.assertAlmostEqual(distances[1, 1], 0.0)
+
+    def test_distances_within_applies_max_distance(self):
+        _, mask = distances_within(
+            Decimal('41.0'), Decimal('29.0'),
+            [Decimal('41.01'), Decimal('41.01'), Decimal('41.5')],
+            [Decimal('29.0'), Decimal('29.0'), Decimal('29.0')],
+            radius_km=10,
+            max_distances=[None, 0.5, None]
+        )
+        self.assertEqual(mask.tolist(), [True, False, False])
+
+    def test_distances_within_empty(self):
+        distances, mask = distances_within(41.0, 29.0, [], [], radius_km=5)
+        self.assertEqual(len(distances), 0)
+        self.assertEqual(mask.dtype, np.bool_)
+
+    def test_geohash_known_value_and_prefixes(self):
+        self.assertEqual(geohash(57.64911, 10.40744, 11), 'u4pruydqqvj')
+        # Nearby points share their larger cells
+        self.assertEqual(geohash(41.0082, 28.9784, 4), geohash(41.0100, 28.9900, 4))
+        self.assertTrue(geohash(41.0082, 28.9784, 5).startswith(geohash(41.0082, 28.9784, 4)))
+
+
+if __name__ == '__main__':
+    unittest.main()
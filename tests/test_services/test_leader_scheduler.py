@@ -0,0 +1,121 @@
+import unittest
+from datetime import datetime, timedelta, UTC
+
+from flask import Flask
+
+from src.models import db, SchedulerLease, ScheduledJobRun
+from src.schedulers.leader_scheduler import LeaderScheduler
+
+
+class TestLeaderScheduler(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config['TESTING'] = True
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+
+        db.init_app(self.app)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        # Two schedulers stand in for two worker processes
+        self.first = LeaderScheduler(self.app, name='test')
+        self.second = LeaderScheduler(self.app, name='test')
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def expire_lease(self):
+        db.session.get(SchedulerLease, 'test').expires_at = datetime.now(UTC) - timedelta(seconds=1)
+        db.session.commit()
+
+    def test_only_one_process_acquires_the_lease(self):
+        self.assertTrue(self.first.try_acquire())
+        self.assertFalse(self.second.try_acquire())
+
+        self.assertTrue(self.first.try_acquire())
+        self.assertTrue(self.first.is_leader)
+        self.assertFalse(self.second.is_leader)
+        self.assertEqual(db.session.get(SchedulerLease, 'test').owner, self.first.owner)
+
+    def test_expired_lease_is_taken_over(self):
+        self.first.try_acquire()
+        self.expire_lease()
+
+        self.assertTrue(self.second.try_acquire())
+        self.assertFalse(self.first.try_acquire())
+        self.assertFalse(self.first.is_leader)
+
+    def test_released_lease_is_taken_over(self):
+        self.first.try_acquire()
+        self.first.release()
+
+        self.assertFalse(self.first.is_leader)
+        self.assertTrue(self.second.try_acquire())
+
+    def test_jobs_run_on_the_leader_only(self):
+        calls = []
+        for scheduler in (self.first, self.second):
+            scheduler.add_job(func=lambda: calls.append(1), id='job', name='Test job', minutes=5)
+
+        self.first.try_acquire()
+        self.second.try_acquire()
+        for scheduler in (self.first, self.second):
+            scheduler.scheduler.get_job('job').func()
+
+        self.assertEqual(len(calls), 1)
+
+    def test_runs_are_recorded(self):
+        self.first.add_job(func=lambda: {"deleted": 3}, id='ok_job', name='Succeeds', hours=1)
+        self.first.add_job(func=lambda: 1 / 0, id='failing_job', name='Fails', hours=1)
+
+        self.first.run_job('ok_job')
+        self.first.run_job('ok_job')
+        self.first.run_job('failing_job')
+
+        ok_run = db.session.get(ScheduledJobRun, 'ok_job')
+        self.assertEqual(ok_run.run_count, 2)
+        self.assertEqual(ok_run.last_status, 'succeeded')
+        failing_run = db.session.get(ScheduledJobRun, 'failing_job')
+        self.assertEqual(failing_run.failure_count, 1)
+        self.assertIn('division by zero', failing_run.last_error)
+
+        jobs = {job["id"]: job for job in self.second.get_jobs()["jobs"]}
+        self.assertEqual(jobs, {})
+        jobs = {job["id"]: job for job in self.first.get_jobs()["jobs"]}
+        self.assertEqual(jobs['ok_job']["last_run"]["last_result"], {"deleted": 3})
+        self.assertEqual(jobs['ok_job']["trigger_args"], {"hours": 1})
+
+    def test_once_jobs_run_on_the_leader_until_they_succeed(self):
+        calls, failures = [], [ZeroDivisionError()]
+
+        def backfill():
+            calls.append(1)
+            if failures:
+                raise failures.pop()
+            return {"users": 2}
+
+        for scheduler in (self.first, self.second):
+            scheduler.add_once_job(func=backfill, id='backfill_job', name='Back-fill')
+
+        self.first.try_acquire()
+        self.assertEqual(self.second.run_once_jobs(), [])
+        self.assertEqual(self.first.run_once_jobs(), ['backfill_job'])
+        self.assertEqual(db.session.get(ScheduledJobRun, 'backfill_job').last_status, 'failed')
+
+        self.assertEqual(self.first.run_once_jobs(), ['backfill_job'])
+        self.assertEqual(self.first.run_once_jobs(), [])
+        self.assertEqual(len(calls), 2)
+
+        # A process taking the lease over sees the recorded run and skips the job
+        self.first.release()
+        self.second.try_acquire()
+        self.assertEqual(self.second.run_once_jobs(), [])
+        self.assertEqual(len(calls), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,164 @@
+import unittest
+from datetime import datetime, UTC
+from decimal import Decimal
+from unittest.mock import MagicMock
+
+from flask import Flask
+
+from src.models import db, EnvironmentalContribution
+from src.services.environmental_service import EnvironmentalService, co2_leaderboard
+from src.services.leaderboards import Leaderboard, get_leaderboard_store
+from src.utils.leaderboard_store import InMemoryLeaderboardStore, RedisLeaderboardStore
+
+
+class TestInMemoryLeaderboardStore(unittest.TestCase):
+    def setUp(self):
+        self.store = InMemoryLeaderboardStore()
+        self.store.replace('board', {'1': 10.0, '2': 30.0, '3': 20.0, '4': 20.0})
+
+    def test_range_orders_by_score_then_member_descending(self):
+        self.assertEqual(self.store.range('board', 0, 3),
+                         [('2', 30.0), ('4', 20.0), ('3', 20.0), ('1', 10.0)])
+        self.assertEqual(self.store.range('board', 1, 2), [('4', 20.0), ('3', 20.0)])
+        self.assertEqual(self.store.range('board', 3, 10), [('1', 10.0)])
+        self.assertEqual(self.store.range('board', 5, 10), [])
+
+    def test_increment_moves_members(self):
+        self.assertEqual(self.store.increment('board', '1', 25.0), 35.0)
+        self.assertEqual(self.store.increment('board', '5', 1.0), 1.0)
+
+        self.assertEqual(self.store.position('board', '1'), 0)
+        self.assertEqual(self.store.position('board', '5'), 4)
+        self.assertEqual(self.store.size('board'), 5)
+        self.assertIsNone(self.store.position('board', '6'))
+
+    def test_count_above_is_strict(self):
+        self.assertEqual(self.store.count_above('board', 20.0), 1)
+        self.assertEqual(self.store.count_above('board', 19.0), 3)
+        self.assertEqual(self.store.count_above('board', 30.0), 0)
+        self.assertEqual(self.store.count_above('missing', 0.0), 0)
+
+    def test_replace_and_delete(self):
+        self.store.replace('board', {})
+
+        self.assertTrue(self.store.exists('board'))
+        self.assertEqual(self.store.size('board'), 0)
+        self.store.delete('board')
+        self.assertFalse(self.store.exists('board'))
+
+    def test_board_expires_max_age_after_it_was_replaced(self):
+        now = [0.0]
+        store = InMemoryLeaderboardStore(max_age_seconds=60, clock=lambda: now[0])
+        store.replace('board', {'1': 10.0})
+        store.increment('other', '1', 1.0)
+
+        now[0] = 59.0
+        self.assertTrue(store.exists('board'))
+        # Only a replace seeds a board with every process's writes
+        self.assertFalse(store.exists('other'))
+        now[0] = 60.0
+        self.assertFalse(store.exists('board'))
+        store.replace('board', {'1': 12.0})
+        self.assertTrue(store.exists('board'))
+
+
+class TestRedisLeaderboardStore(unittest.TestCase):
+    def setUp(self):
+        self.client = MagicMock()
+        self.store = RedisLeaderboardStore(self.client, prefix='lb:')
+
+    def test_reads_are_single_sorted_set_commands(self):
+        self.client.zrevrange.return_value = [(b'2', 30.0), (b'4', 20.0)]
+        self.client.zscore.return_value = 20.0
+        self.client.zrevrank.return_value = 1
+        self.client.zcount.return_value = 1
+
+        self.assertEqual(self.store.range('board', 0, 1), [('2', 30.0), ('4', 20.0)])
+        self.client.zrevrange.assert_called_once_with('lb:board', 0, 1, withscores=True)
+        self.assertEqual(self.store.score('board', '4'), 20.0)
+        self.assertEqual(self.store.position('board', '4'), 1)
+        self.assertEqual(self.store.count_above('board', 20.0), 1)
+        self.client.zcount.assert_called_once_with('lb:board', '(20.0', '+inf')
+
+    def test_replace_swaps_the_board_in_one_transaction(self):
+        pipeline = self.client.pipeline.return_value
+
+        self.store.replace('board', {'1': 10.0})
+
+        self.client.pipeline.assert_called_once_with(transaction=True)
+        pipeline.zadd.assert_called_once()
+        loading_key = pipeline.zadd.call_args[0][0]
+        pipeline.rename.assert_called_once_with(loading_key, 'lb:board')
+        pipeline.set.assert_called_once_with('lb:board:loaded', 1)
+        pipeline.execute.assert_called_once()
+
+
+class TestLeaderboard(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config['TESTING'] = True
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+
+        db.init_app(self.app)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def add_contribution(self, user_id, purchase_id, co2_avoided):
+        contribution = EnvironmentalContribution(user_id=user_id, purchase_id=purchase_id,
+                                                 co2_avoided=Decimal(co2_avoided), created_at=datetime.now(UTC))
+        db.session.add(contribution)
+        return contribution
+
+    def test_board_is_seeded_on_first_read_and_scores_stay_exact(self):
+        load_scores = MagicMock(return_value=[(1, Decimal('0.10')), (2, Decimal('0.30'))])
+        leaderboard = Leaderboard('test', load_scores)
+
+        # Not loaded yet, so the seed is expected to hold this already
+        leaderboard.record(1, 5.00)
+        self.assertEqual(leaderboard.rank(1), 2)
+        leaderboard.record(1, 0.20)
+
+        # 0.10 + 0.20 equals 0.30 exactly, so users 1 and 2 tie
+        load_scores.assert_called_once()
+        self.assertEqual(leaderboard.score(1), 0.3)
+        self.assertEqual([rank for _, _, rank in leaderboard.page()], [1, 1])
+
+    def test_contributions_reach_the_board_on_commit_only(self):
+        self.add_contribution(1, 1, "2.50")
+        db.session.commit()
+        self.assertEqual(co2_leaderboard.score(1), 2.5)
+
+        self.add_contribution(2, 2, "5.00")
+        db.session.flush()
+        db.session.rollback()
+        self.assertEqual(co2_leaderboard.score(2), 0.0)
+
+        self.add_contribution(2, 3, "1.25")
+        db.session.commit()
+        self.assertEqual(get_leaderboard_store().range('co2_avoided', 0, 5), [('1', 250.0), ('2', 125.0)])
+
+    def test_environmental_leaderboard_pages_and_ranks(self):
+        for user_id, purchase_id, co2_avoided in [(1, 1, "1.25"), (2, 2, "3.75"), (3, 3, "2.50"), (1, 4, "1.25")]:
+            self.add_contribution(user_id, purchase_id, co2_avoided)
+        db.session.commit()
+
+        result = EnvironmentalService.get_all_users_contributions(limit=2, offset=1)
+
+        self.assertEqual([(entry['user_id'], entry['rank'], entry['total_co2_avoided']) for entry in result['data']],
+                         [(3, 2, 2.5), (1, 2, 2.5)])
+        self.assertEqual(result['data'][1]['monthly_co2_avoided'], 2.5)
+        self.assertEqual(EnvironmentalService.get_user_contributions(2)['data']['rank'], 1)
+
+        entries, index = co2_leaderboard.around(4, radius=1)
+        self.assertEqual((entries, index), ([(1, 2.5, 2), (4, 0.0, 4)], 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,156 @@
+import unittest
+from datetime import datetime, timedelta, UTC
+from decimal import Decimal
+
+from flask import Flask
+from werkzeug.security import generate_password_hash
+
+from src.models import db, Restaurant, Listing, User, Purchase, PurchaseStatus, UserCart, RestaurantDailyStats
+from src.schedulers.listing_scheduler import update_all_listings
+
+
+class TestListingScheduler(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config['TESTING'] = True
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+
+        db.init_app(self.app)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        self.test_user = User(
+            name="Test Owner",
+            email="owner@test.com",
+            phone_number="+1234567890",
+            password=generate_password_hash("password123"),
+            role="owner",
+            email_verified=True
+        )
+        db.session.add(self.test_user)
+        db.session.commit()
+
+        self.test_restaurant = Restaurant(
+            owner_id=self.test_user.id,
+            restaurantName="Test Restaurant",
+            restaurantDescription="Test Description",
+            longitude=28.979530,
+            latitude=41.015137,
+            category="Test Category",
+            workingDays="Monday,Tuesday",
+            workingHoursStart="09:00",
+            workingHoursEnd="22:00",
+            pickup=True,
+            delivery=True
+        )
+        db.session.add(self.test_restaurant)
+        db.session.commit()
+
+        self.now = datetime.now(UTC)
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def add_listing(self, hours_left: float, age_hours: float) -> int:
+        listing = Listing(
+            restaurant_id=self.test_restaurant.id,
+            title="Test Listing",
+            original_price=Decimal('10.99'),
+            count=5,
+            consume_within=24,
+            consume_within_type='HOURS',
+            expires_at=self.now + timedelta(hours=hours_left),
+            created_at=self.now - timedelta(hours=age_hours),
+            fresh_score=100.0,
+            update_count=0
+        )
+        db.session.add(listing)
+        db.session.commit()
+        return listing.id
+
+    def test_freshness_is_derived_at_read_time(self):
+        days_id = self.add_listing(hours_left=39, age_hours=13)
+        hours_id = self.add_listing(hours_left=11, age_hours=13)
+
+        days_listing = db.session.get(Listing, days_id)
+        self.assertAlmostEqual(days_listing.current_fresh_score, 75.0, places=2)
+        self.assertEqual((days_listing.current_consume_within, days_listing.current_consume_within_type), (2, 'DAYS'))
+        self.assertEqual(days_listing.to_dict()["fresh_score"], 75.0)
+
+        hours_listing = db.session.get(Listing, hours_id)
+        self.assertEqual((hours_listing.current_consume_within, hours_listing.current_consume_within_type),
+                         (11, 'HOURS'))
+
+    def test_freshness_sql_expressions_match_python(self):
+        fresh_id = self.add_listing(hours_left=44, age_hours=4)
+        stale_id = self.add_listing(hours_left=10, age_hours=14)
+
+        rows = db.session.query(
+            Listing.id, Listing.current_fresh_score, Listing.current_consume_within,
+            Listing.current_consume_within_type
+        ).order_by(Listing.current_fresh_score.desc()).all()
+
+        self.assertEqual([row.id for row in rows], [fresh_id, stale_id])
+        for row in rows:
+            listing = db.session.get(Listing, row.id)
+            self.assertAlmostEqual(row.current_fresh_score, listing.current_fresh_score, places=1)
+            self.assertEqual(row.current_consume_within, listing.current_consume_within)
+            self.assertEqual(row.current_consume_within_type, listing.current_consume_within_type)
+
+        filtered = Listing.query.filter(Listing.current_fresh_score > 50).all()
+        self.assertEqual([listing.id for listing in filtered], [fresh_id])
+
+    def test_live_listings_are_not_written(self):
+        listing_id = self.add_listing(hours_left=46, age_hours=2)
+
+        stats = update_all_listings()
+
+        listing = db.session.get(Listing, listing_id)
+        self.assertEqual(listing.fresh_score, 100.0)
+        self.assertEqual(listing.update_count, 0)
+        self.assertEqual(stats["deleted"], 0)
+        self.assertIn("duration_seconds", stats)
+
+    def test_near_expiry_listings_are_deleted_and_purchases_rejected(self):
+        listing_id = self.add_listing(hours_left=5, age_hours=19)
+        kept_id = self.add_listing(hours_left=30, age_hours=2)
+
+        pending = Purchase(user_id=self.test_user.id, listing_id=listing_id,
+                           restaurant_id=self.test_restaurant.id, total_price=Decimal('10.99'))
+        completed = Purchase(user_id=self.test_user.id, listing_id=listing_id,
+                             restaurant_id=self.test_restaurant.id, total_price=Decimal('10.99'),
+                             status=PurchaseStatus.COMPLETED)
+        cart_entry = UserCart(user_id=self.test_user.id, listing_id=listing_id,
+                              restaurant_id=self.test_restaurant.id)
+        db.session.add_all([pending, completed, cart_entry])
+        db.session.commit()
+        pending_id, completed_id = pending.id, completed.id
+
+        stats = update_all_listings(chunk_size=1)
+
+        self.assertIsNone(db.session.get(Listing, listing_id))
+        self.assertIsNotNone(db.session.get(Listing, kept_id))
+        self.assertEqual(db.session.get(Purchase, pending_id).status, PurchaseStatus.REJECTED)
+        self.assertEqual(db.session.get(Purchase, completed_id).status, PurchaseStatus.COMPLETED)
+        self.assertIsNone(db.session.get(Purchase, pending_id).listing_id)
+        self.assertEqual(UserCart.query.count(), 0)
+        self.assertEqual(stats["deleted"], 1)
+        self.assertEqual(stats["purchases_rejected"], 1)
+        # The analytics rollups count the bulk rejection like one made through the ORM
+        rollup = RestaurantDailyStats.query.one()
+        self.assertEqual((rollup.completed_purchases, rollup.rejected_purchases), (1, 1))
+
+    def test_expired_listings_are_skipped(self):
+        self.add_listing(hours_left=-1, age_hours=30)
+
+        stats = update_all_listings()
+
+        self.assertEqual(stats["deleted"], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,146 @@
+import unittest
+from datetime import datetime, timedelta, UTC
+from unittest.mock import patch
+
+from flask import Flask
+
+from src.models import db, User, UserDevice, NotificationOutbox
+from src.services.notification_queue import NotificationQueue
+from src.services.notification_service import NotificationService
+
+
+class TestNotificationQueue(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config['TESTING'] = True
+        self.app.config['BACKGROUND_TASKS_ASYNC'] = True
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+
+        db.init_app(self.app)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        self.user = User(
+            name="Queue User",
+            email="queue@test.com",
+            phone_number="+1234567890",
+            password="hashed",
+            role="customer",
+            email_verified=True
+        )
+        db.session.add(self.user)
+        db.session.commit()
+
+        db.session.add(UserDevice(
+            user_id=self.user.id,
+            push_token="ExponentPushToken[queue-token]",
+            device_type="ios",
+            is_active=True
+        ))
+        db.session.commit()
+
+        self.queue = NotificationQueue(max_attempts=2, retry_backoff_seconds=0)
+        self.queue_patch = patch('src.services.notification_service.notification_queue', self.queue)
+        self.queue_patch.start()
+
+    def tearDown(self):
+        self.queue_patch.stop()
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    @patch.object(NotificationService, 'send_push_notification')
+    def test_send_enqueues_instead_of_sending(self, mock_send):
+        success = NotificationService.send_notification_to_user(self.user.id, "Title", "Body", {"type": "test"})
+
+        self.assertTrue(success)
+        mock_send.assert_not_called()
+        entry = NotificationOutbox.query.one()
+        self.assertEqual(entry.status, NotificationOutbox.STATUS_PENDING)
+        self.assertEqual(entry.payload_data, {"title": "Title", "body": "Body", "data": {"type": "test"}})
+        self.assertEqual(self.queue.get_metrics()["depth"], 1)
+
+    @patch.object(NotificationService, 'send_push_notification', return_value=True)
+    def test_process_batch_delivers_and_records_latency(self, mock_send):
+        NotificationService.send_notification_to_user(self.user.id, "Title", "Body")
+
+        self.assertEqual(self.queue.process_batch(), 1)
+
+        mock_send.assert_called_once_with(["ExponentPushToken[queue-token]"], "Title", "Body", None)
+        entry = NotificationOutbox.query.one()
+        self.assertEqual(entry.status, NotificationOutbox.STATUS_SENT)
+        metrics = self.queue.get_metrics()
+        self.assertEqual(metrics["depth"], 0)
+        self.assertEqual(metrics["delivered"], 1)
+        self.assertEqual(metrics["latency_seconds"]["samples"], 1)
+
+    @patch.object(NotificationService, 'send_push_notification', return_value=False)
+    def test_failed_delivery_is_retried_then_given_up(self, mock_send):
+        NotificationService.send_notification_to_user(self.user.id, "Title", "Body")
+
+        self.queue.process_batch()
+        entry = NotificationOutbox.query.one()
+        self.assertEqual(entry.status, NotificationOutbox.STATUS_PENDING)
+        self.assertEqual(entry.attempts, 1)
+
+        self.queue.process_batch()
+        db.session.refresh(entry)
+        self.assertEqual(entry.status, NotificationOutbox.STATUS_FAILED)
+        self.assertEqual(entry.attempts, 2)
+        self.assertEqual(mock_send.call_count, 2)
+        self.assertEqual(self.queue.get_metrics()["failed"], 1)
+
+    @patch.object(NotificationService, 'send_push_notification', return_value=True)
+    def test_stale_processing_entry_is_redelivered(self, mock_send):
+        # A worker claimed this entry and died before marking it sent
+        db.session.add(NotificationOutbox(
+            channel=NotificationOutbox.CHANNEL_EXPO,
+            user_id=self.user.id,
+            payload='{"title": "Title", "body": "Body", "data": null}',
+            status=NotificationOutbox.STATUS_PROCESSING,
+            attempts=1,
+            locked_at=datetime.now(UTC) - timedelta(seconds=self.queue.lease_seconds + 1)
+        ))
+        db.session.commit()
+
+        self.assertEqual(self.queue.process_batch(), 1)
+        self.assertEqual(NotificationOutbox.query.one().status, NotificationOutbox.STATUS_SENT)
+        mock_send.assert_called_once()
+
+    @patch.object(NotificationService, 'send_push_notification', return_value=True)
+    def test_fresh_processing_entry_is_not_claimed_twice(self, mock_send):
+        NotificationService.send_notification_to_user(self.user.id, "Title", "Body")
+        self.assertEqual(len(self.queue._claim()), 1)
+
+        self.assertEqual(self.queue.process_batch(), 0)
+        mock_send.assert_not_called()
+
+    @patch.object(NotificationService, 'send_push_notification', return_value=True)
+    def test_sends_inline_when_background_tasks_are_off(self, mock_send):
+        self.app.config['BACKGROUND_TASKS_ASYNC'] = False
+
+        self.assertTrue(NotificationService.send_notification_to_user(self.user.id, "Title", "Body"))
+
+        mock_send.assert_called_once()
+        self.assertEqual(NotificationOutbox.query.count(), 0)
+
+    def test_user_without_devices_is_not_queued(self):
+        other = User(name="Other", email="other@test.com", phone_number="+1987654321",
+                     password="hashed", role="customer", email_verified=True)
+        db.session.add(other)
+        db.session.commit()
+
+        self.assertFalse(NotificationService.send_notification_to_user(other.id, "Title", "Body"))
+        self.assertEqual(NotificationOutbox.query.count(), 0)
+
+    @patch.object(NotificationService, 'process_push_receipts', return_value=2)
+    def test_receipts_are_polled_once_per_interval(self, mock_receipts):
+        self.assertEqual(self.queue.poll_receipts_if_due(), 2)
+        self.assertEqual(self.queue.poll_receipts_if_due(), 0)
+        mock_receipts.assert_called_once_with()
+
+
+if __name__ == '__main__':
+    unittest.main()
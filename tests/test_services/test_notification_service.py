@@ -66,7 +66,7 @@ class TestNotificationService(unittest.TestCase):
 
 
 
-    @patch('requests.post')
+    @patch('requests.Session.post')
     def test_send_push_notification(self, mock_post):
         """Test sending push notifications"""
         # Mock successful response
@@ -95,6 +95,52 @@ class TestNotificationService(unittest.TestCase):
         self.assertEqual(notification['body'], "Test Body")
         self.assertEqual(notification['data'], {"custom": "data"})
 
+    @patch('requests.Session.post')
+    def test_send_push_notification_batches(self, mock_post):
+        """Test that large sends are split into Expo-sized batches"""
+        mock_response = MagicMock()
+        mock_response.status_code = 200
+        mock_response.json.return_value = {"data": "success"}
+        mock_post.return_value = mock_response
+
+        tokens = [f"token-{i}" for i in range(250)]
+        success = NotificationService.send_push_notification(tokens, "Title", "Body")
+
+        self.assertTrue(success)
+        self.assertEqual(mock_post.call_count, 3)
+        batch_sizes = [len(call[1]['json']) for call in mock_post.call_args_list]
+        self.assertEqual(batch_sizes, [100, 100, 50])
+
+    @patch('src.services.notification_service.NotificationService.send_push_notification')
+    def test_send_notification_to_users(self, mock_send):
+        """Test bulk sending to the mobile devices of many users"""
+        mock_send.return_value = True
+        other_user = User(
+            name="other",
+            email="other@test.com",
+            phone_number="+1234567891",
+            password=generate_password_hash("password123"),
+            role="customer"
+        )
+        db.session.add(other_user)
+        db.session.commit()
+
+        db.session.add_all([
+            UserDevice(user_id=self.user.id, push_token="token-a", device_type="ios", is_active=True),
+            UserDevice(user_id=self.user.id, push_token="token-b", device_type="android", is_active=True),
+            UserDevice(user_id=other_user.id, push_token="token-c", device_type="ios", is_active=False),
+            UserDevice(user_id=other_user.id, push_token="web-placeholder", device_type="web", is_active=True),
+        ])
+        db.session.commit()
+
+        notified = NotificationService.send_notification_to_users(
+            [self.user.id, other_user.id], "Title", "Body"
+        )
+
+        self.assertEqual(notified, 1)
+        mock_send.assert_called_once()
+        self.assertEqual(sorted(mock_send.call_args[0][0]), ["token-a", "token-b"])
+
     def test_update_push_token(self):
         """Test updating push token"""
         success, message = NotificationService.update_push_token(
@@ -0,0 +1,121 @@
+import unittest
+from decimal import Decimal
+
+from flask import Flask
+
+from src.models import db, Purchase, Restaurant, User, CustomerAddress, PurchaseStatus, RestaurantPopularity, \
+    UserFavorites
+from src.services.popularity_index import PopularityIndex, popularity_index
+from src.services.recommendation_system_service import RestaurantRecommendationSystemService
+
+# Istanbul and Ankara are far enough apart to share no geohash cell
+ISTANBUL = (Decimal('41.008200'), Decimal('28.978400'))
+ANKARA = (Decimal('39.920800'), Decimal('32.854100'))
+
+
+class TestPopularityIndex(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config['TESTING'] = True
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+
+        db.init_app(self.app)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        popularity_index.reset()
+
+        self.owner = User(name="Owner", email="owner@test.com", phone_number="+1000000000",
+                          password="hashed", role="owner")
+        self.customer = User(name="Customer", email="customer@test.com", phone_number="+1000000001",
+                             password="hashed", role="customer")
+        db.session.add_all([self.owner, self.customer])
+        db.session.commit()
+
+        self.istanbul_cafe = self.add_restaurant("Istanbul Cafe", "Cafe", ISTANBUL, purchases=2)
+        self.istanbul_bakery = self.add_restaurant("Istanbul Bakery", "Bakery", ISTANBUL, purchases=1)
+        self.ankara_cafe = self.add_restaurant("Ankara Cafe", "Cafe", ANKARA, purchases=5)
+        self.ankara_bakery = self.add_restaurant("Ankara Bakery", "Bakery", ANKARA, purchases=0)
+        db.session.commit()
+
+        self.index = PopularityIndex(list_size=3)
+
+    def tearDown(self):
+        popularity_index.reset()
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def add_restaurant(self, name, category, location, purchases):
+        restaurant = Restaurant(owner_id=self.owner.id, restaurantName=name, category=category,
+                                latitude=location[0], longitude=location[1])
+        db.session.add(restaurant)
+        db.session.flush()
+        for _ in range(purchases):
+            db.session.add(Purchase(user_id=self.customer.id, restaurant_id=restaurant.id, quantity=1,
+                                    total_price=Decimal('10.00'), status=PurchaseStatus.COMPLETED))
+        # Purchases that never completed do not count
+        db.session.add(Purchase(user_id=self.customer.id, restaurant_id=restaurant.id, quantity=1,
+                                total_price=Decimal('10.00'), status=PurchaseStatus.PENDING))
+        return restaurant
+
+    def test_global_and_category_rankings(self):
+        self.index.refresh()
+
+        self.assertEqual(self.index.lookup(),
+                         [self.ankara_cafe.id, self.istanbul_cafe.id, self.istanbul_bakery.id])
+        self.assertEqual(self.index.lookup(categories=["Bakery"]),
+                         [self.istanbul_bakery.id, self.ankara_bakery.id, self.ankara_cafe.id])
+
+    def test_area_ranking_comes_first_and_is_topped_up(self):
+        self.index.refresh()
+
+        self.assertEqual(self.index.lookup(*ISTANBUL),
+                         [self.istanbul_cafe.id, self.istanbul_bakery.id, self.ankara_cafe.id])
+        # Restaurants nobody bought from yet still rank in their area
+        self.assertEqual(self.index.lookup(*ANKARA, limit=2), [self.ankara_cafe.id, self.ankara_bakery.id])
+
+    def test_rankings_are_persisted_and_loaded_by_other_processes(self):
+        self.index.refresh()
+        other = PopularityIndex(list_size=3)
+
+        self.assertEqual(other.lookup(*ISTANBUL), self.index.lookup(*ISTANBUL))
+        self.assertEqual(other.generated_at.replace(tzinfo=None), self.index.generated_at.replace(tzinfo=None))
+        self.assertEqual(RestaurantPopularity.query.filter_by(scope='global').count(), 3)
+
+    def test_rankings_are_computed_before_the_first_refresh(self):
+        self.assertEqual(self.index.lookup()[0], self.ankara_cafe.id)
+        self.assertEqual(RestaurantPopularity.query.count(), 0)
+
+    def test_fallback_uses_primary_address(self):
+        db.session.add(CustomerAddress(user_id=self.customer.id, title="Home", latitude=ISTANBUL[0],
+                                       longitude=ISTANBUL[1], is_primary=True))
+        db.session.commit()
+
+        response, status = RestaurantRecommendationSystemService.get_fallback_recommendations(self.customer.id)
+
+        self.assertEqual(status, 200)
+        self.assertEqual(response["data"][:2], [self.istanbul_cafe.id, self.istanbul_bakery.id])
+
+        response, _ = RestaurantRecommendationSystemService.get_fallback_recommendations()
+        self.assertEqual(response["data"][0], self.ankara_cafe.id)
+
+    def test_fallback_uses_preferred_categories(self):
+        newcomer = User(name="Newcomer", email="newcomer@test.com", phone_number="+1000000002",
+                        password="hashed", role="customer")
+        db.session.add(newcomer)
+        db.session.flush()
+        db.session.add(UserFavorites(user_id=newcomer.id, restaurant_id=self.ankara_bakery.id))
+        db.session.commit()
+
+        self.assertEqual(RestaurantRecommendationSystemService.get_preferred_categories(newcomer.id), ["Bakery"])
+        response, status = RestaurantRecommendationSystemService.get_fallback_recommendations(newcomer.id)
+
+        self.assertEqual(status, 200)
+        self.assertEqual(response["data"], [self.istanbul_bakery.id, self.ankara_bakery.id,
+                                            self.ankara_cafe.id, self.istanbul_cafe.id])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,345 @@
+import threading
+import time
+import unittest
+from datetime import datetime, timedelta, UTC
+from decimal import Decimal
+from unittest.mock import MagicMock
+
+import numpy as np
+from flask import Flask
+from sqlalchemy import event
+from sklearn.neighbors import NearestNeighbors
+
+from src.models import db, Purchase, Listing, Restaurant, User, PurchaseStatus
+from src.services.recommendation_model_registry import ItemSimilarityModel, RecommendationModelRegistry, TopKSimilarityTable, \
+    listing_recommendation_models, restaurant_recommendation_models, record_completed_purchase
+from src.services.recommendation_system_service import RecommendationSystemService, \
+    RestaurantRecommendationSystemService
+
+ENTRIES = [
+    (1, 10, 2.0), (1, 11, 1.0),
+    (2, 10, 1.0), (2, 12, 3.0),
+    (3, 11, 1.0), (3, 12, 1.0), (3, 13, 1.0),
+    (4, 13, 5.0),
+]
+
+
+class TestItemSimilarityModel(unittest.TestCase):
+    def test_neighbors_match_dense_knn(self):
+        model = ItemSimilarityModel.from_entries(ENTRIES)
+
+        dense = np.zeros((4, 4))
+        for item_id, user_id, value in ENTRIES:
+            dense[item_id - 1, user_id - 10] += value
+        distances, indices = NearestNeighbors(metric='cosine', algorithm='brute').fit(dense).kneighbors(
+            dense[[0]], n_neighbors=4)
+        # Items sharing no user with item 1 score 0 and are left out
+        expected = [(int(i) + 1, float(1 - d)) for i, d in zip(indices[0], distances[0]) if i != 0 and d < 1]
+
+        actual = model.neighbors(1, 3)
+        self.assertEqual([item_id for item_id, _ in actual], [item_id for item_id, _ in expected])
+        for (_, similarity), (_, expected_similarity) in zip(actual, expected):
+            self.assertAlmostEqual(similarity, expected_similarity)
+
+    def test_with_updates_returns_new_model(self):
+        model = ItemSimilarityModel.from_entries(ENTRIES)
+
+        updated = model.with_updates([(5, 14, 1.0), (1, 10, 1.0)])
+
+        self.assertEqual(len(model), 4)
+        self.assertEqual(len(updated), 5)
+        self.assertEqual(model.matrix[model.item_index[1], model.user_index[10]], 2.0)
+        self.assertEqual(updated.matrix[updated.item_index[1], updated.user_index[10]], 3.0)
+        self.assertIn(5, updated)
+
+    def test_binary_model_caps_values(self):
+        model = ItemSimilarityModel.from_entries([(1, 10, 1.0), (1, 10, 1.0)], binary=True)
+
+        self.assertEqual(model.matrix.max(), 1.0)
+
+    def test_neighbors_respects_limit(self):
+        model = ItemSimilarityModel.from_entries(ENTRIES)
+
+        self.assertEqual(model.neighbors(3, 1), model.neighbors(3, 3)[:1])
+
+    def test_unknown_item_has_no_neighbors(self):
+        self.assertEqual(ItemSimilarityModel.from_entries(ENTRIES).neighbors(99, 3), [])
+
+    def test_neighbors_many_matches_single_lookups(self):
+        model = ItemSimilarityModel.from_entries(ENTRIES)
+
+        batch = model.neighbors_many([1, 3, 99, 1], 2)
+
+        self.assertEqual(set(batch), {1, 3})
+        self.assertEqual(batch[1], model.neighbors(1, 2))
+        self.assertEqual(batch[3], model.neighbors(3, 2))
+
+
+class TestTopKSimilarityTable(unittest.TestCase):
+    def test_table_matches_live_scoring(self):
+        model = ItemSimilarityModel.from_entries(ENTRIES)
+        table = TopKSimilarityTable(model, top_k=2, chunk_size=3)
+
+        for item_id in model.item_ids:
+            precomputed, live = table.neighbors(item_id, 2), model.neighbors(item_id, 2)
+            self.assertEqual([rec_id for rec_id, _ in precomputed], [rec_id for rec_id, _ in live])
+            for (_, score), (_, live_score) in zip(precomputed, live):
+                self.assertAlmostEqual(score, live_score, places=5)
+        self.assertIsNotNone(table.generated_at)
+
+    def test_table_cannot_answer_unknown_items_or_larger_k(self):
+        table = TopKSimilarityTable(ItemSimilarityModel.from_entries(ENTRIES), top_k=2)
+
+        self.assertIsNone(table.neighbors(99, 2))
+        self.assertIsNone(table.neighbors(1, 3))
+
+
+class TestRecommendationModelRegistry(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config['TESTING'] = True
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+
+    def tearDown(self):
+        self.app_context.pop()
+
+    def test_model_is_built_once_and_updated_incrementally(self):
+        load_entries = MagicMock(return_value=ENTRIES)
+        registry = RecommendationModelRegistry('test', load_entries)
+
+        first = registry.get_model()
+        self.assertIs(registry.get_model(), first)
+
+        registry.record(5, 10, 1.0)
+        updated = registry.get_model()
+
+        self.assertIsNot(updated, first)
+        self.assertIn(5, updated)
+        self.assertNotIn(5, first)
+        load_entries.assert_called_once()
+
+    def test_updates_looked_up_during_a_rebuild_survive_it(self):
+        registry = RecommendationModelRegistry('test', MagicMock(return_value=ENTRIES))
+        registry.get_model()
+
+        def load_entries():
+            # A purchase completes and is looked up while the rebuild reads the database
+            registry.record(5, 10, 1.0)
+            self.assertIn(5, registry.get_model())
+            return ENTRIES
+
+        registry.load_entries = load_entries
+        registry.rebuild()
+
+        self.assertIn(5, registry.get_model())
+
+    def test_concurrent_first_lookups_build_once(self):
+        def load_entries():
+            time.sleep(0.05)
+            return ENTRIES
+
+        load_entries = MagicMock(side_effect=load_entries)
+        registry = RecommendationModelRegistry('test', load_entries)
+        models = []
+
+        def lookup():
+            with self.app.app_context():
+                models.append(registry.get_model())
+
+        threads = [threading.Thread(target=lookup) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        load_entries.assert_called_once()
+        self.assertEqual(len({id(model) for model in models}), 1)
+
+    def test_items_added_after_build_fall_back_to_live_scoring(self):
+        registry = RecommendationModelRegistry('test', MagicMock(return_value=ENTRIES), top_k=2)
+        self.assertEqual(registry.neighbors(1, 2), registry._table.neighbors(1, 2))
+        self.assertIsNotNone(registry.table_generated_at)
+
+        registry.record(5, 10, 1.0)
+
+        self.assertNotIn(5, registry._table)
+        self.assertEqual([item_id for item_id, _ in registry.neighbors(5, 2)], [1, 2])
+        self.assertEqual(registry.neighbors_many([1, 5], 2), {1: registry.neighbors(1, 2), 5: registry.neighbors(5, 2)})
+
+    def test_items_updated_after_build_are_scored_against_the_live_model(self):
+        registry = RecommendationModelRegistry('test', MagicMock(return_value=ENTRIES), top_k=2)
+        registry.get_model()
+        stale = registry._table.neighbors(4, 2)
+
+        registry.record(4, 10, 5.0)
+
+        live = registry.get_model().neighbors(4, 2)
+        self.assertNotEqual(live, stale)
+        self.assertEqual(registry.neighbors(4, 2), live)
+        self.assertEqual(registry.neighbors_many([4], 2), {4: live})
+
+        registry.rebuild()
+        self.assertEqual(registry.neighbors(4, 2), registry._table.neighbors(4, 2))
+
+    def test_dirty_threshold_triggers_rebuild(self):
+        load_entries = MagicMock(return_value=ENTRIES)
+        registry = RecommendationModelRegistry('test', load_entries, dirty_threshold=2)
+        registry.get_model()
+
+        registry.record(5, 10, 1.0)
+        registry.record(6, 10, 1.0)
+        registry.get_model()
+
+        self.assertEqual(load_entries.call_count, 2)
+        self.assertNotIn(5, registry.get_model())
+
+    def test_stale_model_is_rebuilt(self):
+        load_entries = MagicMock(return_value=ENTRIES)
+        registry = RecommendationModelRegistry('test', load_entries, rebuild_interval_seconds=0)
+
+        registry.get_model()
+        registry.get_model()
+
+        self.assertGreaterEqual(load_entries.call_count, 2)
+
+
+class TestRecommendationServicesWithRegistry(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config['TESTING'] = True
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+
+        db.init_app(self.app)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        listing_recommendation_models.reset()
+        restaurant_recommendation_models.reset()
+
+        self.users = [User(name=f"User {i}", email=f"user{i}@test.com", phone_number=f"+100000000{i}",
+                           password="hashed", role="customer") for i in range(3)]
+        db.session.add_all(self.users)
+        db.session.commit()
+
+        self.restaurants = [Restaurant(owner_id=self.users[0].id, restaurantName=f"Restaurant {i}",
+                                       category="Test", longitude=Decimal('28.97'), latitude=Decimal('41.01'))
+                            for i in range(3)]
+        db.session.add_all(self.restaurants)
+        db.session.commit()
+
+        self.listings = [Listing(restaurant_id=restaurant.id, title=f"Listing {i}", original_price=Decimal('10.00'),
+                                 consume_within=24, expires_at=datetime.now(UTC) + timedelta(hours=24))
+                         for i, restaurant in enumerate(self.restaurants)]
+        db.session.add_all(self.listings)
+        db.session.commit()
+
+        # Users 0 and 1 bought listings 0 and 1, user 2 bought listing 2
+        for user, listing in [(0, 0), (0, 1), (1, 0), (1, 1), (2, 2)]:
+            self.add_purchase(self.users[user], self.listings[listing])
+        db.session.commit()
+
+    def tearDown(self):
+        listing_recommendation_models.reset()
+        restaurant_recommendation_models.reset()
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def add_purchase(self, user, listing):
+        purchase = Purchase(user_id=user.id, listing_id=listing.id, restaurant_id=listing.restaurant_id,
+                            quantity=1, total_price=Decimal('10.00'), status=PurchaseStatus.COMPLETED)
+        db.session.add(purchase)
+        return purchase
+
+    def test_listing_recommendations(self):
+        response, status = RecommendationSystemService.get_recommendations_for_listing(self.listings[0].id)
+
+        self.assertEqual(status, 200)
+        self.assertEqual(response["data"][0], self.listings[1].id)
+
+    def test_restaurant_recommendations(self):
+        response, status = RestaurantRecommendationSystemService.get_recommendations_by_user(self.users[0].id)
+
+        # Restaurants 0 and 1 share both buyers, restaurant 2 shares none
+        self.assertEqual(status, 200)
+        self.assertEqual(set(response["data"][:2]), {self.restaurants[0].id, self.restaurants[1].id})
+
+    def test_restaurant_recommendations_query_count_does_not_grow_with_history(self):
+        RestaurantRecommendationSystemService.get_recommendations_by_user(self.users[0].id)
+        statements = []
+
+        def count(*args):
+            statements.append(args[2])
+
+        event.listen(db.engine, 'before_cursor_execute', count)
+        try:
+            response, status = RestaurantRecommendationSystemService.get_recommendations_by_user(self.users[0].id)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', count)
+
+        # One query for the user's restaurants, one for which recommendations still exist
+        self.assertEqual(status, 200)
+        self.assertEqual(len(statements), 2)
+
+    def test_batch_listing_recommendations_hydrate_cards_in_one_query(self):
+        listing_ids = [self.listings[0].id, self.listings[1].id, 999]
+        RecommendationSystemService.get_batch_recommendations(listing_ids)
+        statements = []
+
+        def count(*args):
+            statements.append(args[2])
+
+        event.listen(db.engine, 'before_cursor_execute', count)
+        try:
+            response, status = RecommendationSystemService.get_batch_recommendations(listing_ids)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', count)
+
+        self.assertEqual(status, 200)
+        self.assertEqual(len(statements), 1)
+        self.assertEqual(response["recommendations"], [
+            {"listing_id": self.listings[0].id, "data": [self.listings[1].id]},
+            {"listing_id": self.listings[1].id, "data": [self.listings[0].id]},
+            {"listing_id": 999, "data": []},
+        ])
+        self.assertEqual({card["id"] for card in response["listings"]}, {self.listings[0].id, self.listings[1].id})
+        self.assertEqual({card["id"] for card in response["restaurants"]},
+                         {self.restaurants[0].id, self.restaurants[1].id})
+
+    def test_batch_listing_recommendations_limit_request_size(self):
+        response, status = RecommendationSystemService.get_batch_recommendations(list(range(1000)))
+
+        self.assertEqual(status, 400)
+
+    def test_batch_user_recommendations_include_restaurant_and_listing_cards(self):
+        response, status = RestaurantRecommendationSystemService.get_batch_recommendations_by_user(self.users[0].id)
+
+        self.assertEqual(status, 200)
+        self.assertEqual([card["id"] for card in response["restaurants"]], response["data"])
+        self.assertEqual({card["restaurant_id"] for card in response["listings"]}, set(response["data"]))
+
+        self.listings[1].expires_at = datetime.now(UTC) - timedelta(hours=1)
+        db.session.commit()
+        response, status = RestaurantRecommendationSystemService.get_batch_recommendations_by_user(self.users[0].id)
+
+        self.assertIn(self.restaurants[1].id, response["data"])
+        self.assertNotIn(self.listings[1].id, {card["id"] for card in response["listings"]})
+
+    def test_completed_purchase_updates_model_without_rebuild(self):
+        first = listing_recommendation_models.get_model()
+        purchase = self.add_purchase(self.users[2], self.listings[0])
+        db.session.commit()
+
+        record_completed_purchase(purchase)
+        updated = listing_recommendation_models.get_model()
+
+        row, col = updated.item_index[self.listings[0].id], updated.user_index[self.users[2].id]
+        self.assertEqual(updated.matrix[row, col], 1.0)
+        self.assertEqual(first.matrix[first.item_index[self.listings[0].id]].sum(), 2.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
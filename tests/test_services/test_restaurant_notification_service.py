@@ -54,9 +54,9 @@ class TestRestaurantNotificationService(unittest.TestCase):
         db.drop_all()
         self.app_context.pop()
 
-    @patch('src.services.notification_service.NotificationService.send_notification_to_user')
+    @patch('src.services.notification_service.NotificationService.send_notification_to_users')
     def test_notify_users_about_new_restaurant(self, mock_send_notification):
-        mock_send_notification.return_value = True
+        mock_send_notification.return_value = 1
         result = notify_users_about_new_restaurant(1)
         self.assertEqual(result, 1)
         mock_send_notification.assert_called_once()
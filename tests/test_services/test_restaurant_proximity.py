@@ -0,0 +1,125 @@
+import unittest
+from flask import Flask
+from src.models import db, Restaurant, User
+from src.services.restaurant_service import get_restaurants_in_proximity, get_flash_deals_service
+
+
+class TestRestaurantProximity(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config['TESTING'] = True
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+
+        db.init_app(self.app)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        self.owner = User(
+            name="Test Owner",
+            email="owner@test.com",
+            phone_number="+1234567890",
+            password="hashedpassword",
+            role="owner"
+        )
+        db.session.add(self.owner)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def _add_restaurant(self, name, lat, lon, max_delivery_distance=None, flash_deals_available=False):
+        restaurant = Restaurant(
+            owner_id=self.owner.id,
+            restaurantName=name,
+            category="Test",
+            latitude=lat,
+            longitude=lon,
+            maxDeliveryDistance=max_delivery_distance,
+            flash_deals_available=flash_deals_available
+        )
+        db.session.add(restaurant)
+        db.session.commit()
+        return restaurant
+
+    def _names(self, response):
+        return [r['restaurantName'] for r in response['restaurants']]
+
+    def test_proximity_results_sorted_by_distance(self):
+        self._add_restaurant("Far", 41.05, 29.0)
+        self._add_restaurant("Near", 41.001, 29.0)
+        self._add_restaurant("Out of range", 42.0, 29.0)
+        self._add_restaurant("Does not deliver this far", 41.02, 29.0, max_delivery_distance=1)
+
+        response, status = get_restaurants_in_proximity(41.0, 29.0, 10)
+
+        self.assertEqual(status, 200)
+        self.assertEqual(self._names(response), ["Near", "Far"])
+
+    def test_bounding_box_filter(self):
+        self._add_restaurant("Inside", 41.05, 29.05)
+        self._add_restaurant("Outside", 41.2, 29.0)
+
+        restaurants = Restaurant.query.filter(Restaurant.bounding_box_filter(41.0, 29.0, 10)).all()
+
+        self.assertEqual([r.restaurantName for r in restaurants], ["Inside"])
+
+    def test_flash_deals_within_radius(self):
+        self._add_restaurant("Flash far", 41.2, 29.0, flash_deals_available=True)
+        self._add_restaurant("Flash near", 41.01, 29.0, flash_deals_available=True)
+        self._add_restaurant("No flash", 41.0, 29.0)
+
+        response, status = get_flash_deals_service(41.0, 29.0, 10)
+
+        self.assertEqual(status, 200)
+        self.assertEqual(self._names(response), ["Flash near"])
+
+    def test_proximity_follows_create_update_and_delete(self):
+        restaurant = self._add_restaurant("Moving", 41.0, 29.0)
+        response, status = get_restaurants_in_proximity(41.0, 29.0, 1)
+        self.assertEqual(self._names(response), ["Moving"])
+
+        restaurant.latitude = 45.0
+        db.session.commit()
+        response, status = get_restaurants_in_proximity(45.0, 29.0, 1)
+        self.assertEqual(self._names(response), ["Moving"])
+        response, status = get_restaurants_in_proximity(41.0, 29.0, 1)
+        self.assertEqual(status, 404)
+
+        db.session.delete(restaurant)
+        db.session.commit()
+        response, status = get_restaurants_in_proximity(45.0, 29.0, 1)
+        self.assertEqual(status, 404)
+
+    def test_rolled_back_changes_are_not_returned(self):
+        restaurant = self._add_restaurant("Stays", 41.0, 29.0)
+        get_restaurants_in_proximity(41.0, 29.0, 1)
+
+        restaurant.latitude = 45.0
+        db.session.flush()
+        db.session.rollback()
+
+        response, status = get_restaurants_in_proximity(41.0, 29.0, 1)
+        self.assertEqual(self._names(response), ["Stays"])
+
+    def test_rows_written_outside_this_session_are_found(self):
+        self._add_restaurant("Seen", 41.0, 29.0)
+        get_restaurants_in_proximity(41.0, 29.0, 1)
+
+        # Bulk inserts skip the session events, like a row written by another worker
+        db.session.bulk_insert_mappings(Restaurant, [{
+            "owner_id": self.owner.id, "restaurantName": "Elsewhere", "category": "Test",
+            "latitude": 41.001, "longitude": 29.0, "listings": 0, "ratingCount": 0,
+            "pickup": True, "delivery": True, "flash_deals_available": False, "flash_deals_count": 0,
+        }])
+        db.session.commit()
+
+        response, status = get_restaurants_in_proximity(41.0, 29.0, 1)
+        self.assertEqual(self._names(response), ["Seen", "Elsewhere"])
+
+
+if __name__ == '__main__':
+    unittest.main()
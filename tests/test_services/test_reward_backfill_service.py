@@ -0,0 +1,140 @@
+import unittest
+from datetime import datetime
+from decimal import Decimal
+
+from flask import Flask
+
+from src.models import db, DiscountEarned, EnvironmentalContribution, Listing, Purchase, PurchaseStatus, Restaurant, \
+    User, UserDiscountTotal, UserEnvironmentalTotal
+from src.services.environmental_service import EnvironmentalService, co2_leaderboard
+from src.services.gamification_services import add_discount_points, discount_leaderboard
+from src.services.reward_backfill_service import backfill_rewards, link_legacy_discount_points
+
+
+class TestRewardBackfillService(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config['TESTING'] = True
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+
+        db.init_app(self.app)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        self.users = [User(name=f"User {i}", email=f"user{i}@test.com", phone_number=f"+90123456780{i}",
+                           password="hashed", role="customer") for i in range(2)]
+        db.session.add_all(self.users)
+        db.session.commit()
+        restaurant = Restaurant(owner_id=self.users[0].id, restaurantName="Restaurant", category="Test",
+                                longitude=Decimal('28.97'), latitude=Decimal('41.01'))
+        db.session.add(restaurant)
+        db.session.commit()
+        self.listing = Listing(restaurant_id=restaurant.id, title="Listing", original_price=Decimal('10.00'),
+                               consume_within=24, expires_at=datetime(2025, 6, 1))
+        db.session.add(self.listing)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def add_purchase(self, user, quantity, total_price, purchase_date, status=PurchaseStatus.COMPLETED):
+        purchase = Purchase(user_id=user.id, listing_id=self.listing.id, restaurant_id=self.listing.restaurant_id,
+                            quantity=quantity, total_price=Decimal(total_price), status=status,
+                            purchase_date=purchase_date)
+        db.session.add(purchase)
+        db.session.commit()
+        return purchase
+
+    def test_backfill_records_missing_rewards_in_chunks(self):
+        # A point recorded before points were linked to purchases covers the purchase it matches
+        db.session.add(DiscountEarned(user_id=self.users[0].id, discount=Decimal('4.00'),
+                                      earned_at=datetime(2025, 5, 1, 12, 0)))
+        db.session.commit()
+        self.add_purchase(self.users[0], 1, "6.00", datetime(2025, 5, 1, 9, 0))
+        recorded = self.add_purchase(self.users[0], 2, "15.00", datetime(2025, 5, 2, 9, 0))
+        EnvironmentalService.record_contribution_for_purchase(recorded.id)
+        for day in range(3, 6):
+            self.add_purchase(self.users[1], 3, "21.00", datetime(2025, 5, day, 9, 0))
+        self.add_purchase(self.users[1], 1, "5.00", datetime(2025, 5, 6, 9, 0), status=PurchaseStatus.PENDING)
+        progress = []
+
+        result = backfill_rewards(chunk_size=2, progress=lambda *args: progress.append(args[:3]))
+
+        self.assertEqual((result["contributions"]["missing"], result["contributions"]["recorded"]), (4, 4))
+        self.assertEqual((result["discount_points"]["missing"], result["discount_points"]["recorded"]), (4, 4))
+        self.assertEqual(result["discount_points"]["linked"], 1)
+        self.assertEqual(progress, [("contributions", 2, 4), ("contributions", 4, 4),
+                                    ("discount_points", 2, 4), ("discount_points", 4, 4)])
+
+        contribution = EnvironmentalContribution.query.filter_by(user_id=self.users[1].id).first()
+        self.assertEqual(contribution.co2_avoided, Decimal('3.75'))
+        self.assertEqual(contribution.created_at.date(), datetime(2025, 5, 3).date())
+        discounts = {point.purchase_id: point.discount for point in DiscountEarned.query if point.purchase_id}
+        self.assertEqual(sorted(discounts.values()), [Decimal('4.00'), Decimal('5.00'), Decimal('9.00'),
+                                                      Decimal('9.00'), Decimal('9.00')])
+
+        # Bulk inserted rows still reach the totals and leaderboards
+        self.assertEqual(db.session.get(UserEnvironmentalTotal, self.users[1].id).total_co2_avoided, Decimal('11.25'))
+        self.assertEqual(db.session.get(UserDiscountTotal, self.users[1].id).total_discount, Decimal('27.00'))
+        self.assertEqual(co2_leaderboard.score(self.users[1].id), 11.25)
+        self.assertEqual(discount_leaderboard.score(self.users[0].id), 9.0)
+
+        rerun = backfill_rewards(chunk_size=2)
+        self.assertEqual((rerun["contributions"]["recorded"], rerun["discount_points"]["recorded"]), (0, 0))
+
+    def test_imported_history_older_than_legacy_points_is_backfilled(self):
+        covered = self.add_purchase(self.users[0], 1, "6.00", datetime(2025, 5, 1, 9, 0))
+        db.session.add(DiscountEarned(user_id=self.users[0].id, discount=Decimal('4.00'),
+                                      earned_at=datetime(2025, 5, 1, 12, 0)))
+        # A point of a purchase that no longer exists matches no purchase made before it
+        db.session.add(DiscountEarned(user_id=self.users[1].id, discount=Decimal('3.00'),
+                                      earned_at=datetime(2025, 3, 1, 12, 0)))
+        db.session.commit()
+        # Imported later, but dated before the legacy points
+        imported = [self.add_purchase(self.users[0], 2, "15.00", datetime(2025, 3, 1, 9, 0)),
+                    self.add_purchase(self.users[1], 1, "8.00", datetime(2025, 4, 1, 9, 0))]
+
+        result = backfill_rewards()
+
+        self.assertEqual(result["discount_points"]["linked"], 1)
+        self.assertEqual(result["discount_points"]["recorded"], 2)
+        linked = {point.purchase_id: point.discount for point in DiscountEarned.query if point.purchase_id}
+        self.assertEqual(linked, {covered.id: Decimal('4.00'), imported[0].id: Decimal('5.00'),
+                                  imported[1].id: Decimal('2.00')})
+        self.assertEqual(link_legacy_discount_points(), 0)
+
+    def test_accepted_purchases_earn_discount_points(self):
+        # Points are awarded on acceptance, before the purchase is completed
+        accepted = self.add_purchase(self.users[0], 1, "6.00", datetime(2025, 5, 1, 9, 0),
+                                     status=PurchaseStatus.ACCEPTED)
+        db.session.add(DiscountEarned(user_id=self.users[0].id, discount=Decimal('4.00'),
+                                      earned_at=datetime(2025, 5, 1, 12, 0)))
+        db.session.commit()
+        missing = self.add_purchase(self.users[1], 1, "7.00", datetime(2025, 5, 2, 9, 0),
+                                    status=PurchaseStatus.ACCEPTED)
+
+        result = backfill_rewards()
+
+        self.assertEqual(result["discount_points"]["linked"], 1)
+        self.assertEqual(result["discount_points"]["recorded"], 1)
+        self.assertEqual(result["contributions"]["recorded"], 0)
+        linked = {point.purchase_id: point.discount for point in DiscountEarned.query}
+        self.assertEqual(linked, {accepted.id: Decimal('4.00'), missing.id: Decimal('3.00')})
+
+    def test_batch_variants_skip_purchases_already_covered(self):
+        purchase = self.add_purchase(self.users[0], 2, "15.00", datetime(2025, 5, 2, 9, 0))
+        pending = self.add_purchase(self.users[0], 1, "5.00", datetime(2025, 5, 2, 9, 0),
+                                    status=PurchaseStatus.PENDING)
+
+        self.assertEqual(EnvironmentalService.record_contributions_for_purchases([purchase.id, pending.id]), 1)
+        self.assertEqual(EnvironmentalService.record_contributions_for_purchases([purchase.id]), 0)
+        self.assertEqual(add_discount_points([purchase.id, 999]), 1)
+        self.assertEqual(add_discount_points([purchase.id]), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+import unittest
+
+from flask import Flask
+from sqlalchemy import inspect
+
+from src.models import db
+from src.models.schema_upgrades import upgrade_schema
+
+
+class TestSchemaUpgrades(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config['TESTING'] = True
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+
+        db.init_app(self.app)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_columns_and_indexes_added_to_existing_tables(self):
+        # discountearned as created before points referenced their purchase
+        with db.engine.begin() as connection:
+            connection.execute(db.text("DROP TABLE discountearned"))
+            connection.execute(db.text(
+                "CREATE TABLE discountearned (id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL, "
+                "discount DECIMAL(10, 2) NOT NULL, earned_at DATETIME NOT NULL)"
+            ))
+            connection.execute(db.text(
+                "INSERT INTO discountearned (user_id, discount, earned_at) VALUES (1, 4.00, '2025-05-01 12:00:00')"
+            ))
+
+        self.assertEqual(upgrade_schema(), ['discountearned.purchase_id', 'discountearned.idx_discount_earned_purchase'])
+
+        inspector = inspect(db.engine)
+        self.assertIn('purchase_id', {column['name'] for column in inspector.get_columns('discountearned')})
+        self.assertIn('idx_discount_earned_purchase',
+                      {index['name'] for index in inspector.get_indexes('discountearned')})
+        self.assertEqual(db.session.execute(db.text("SELECT purchase_id FROM discountearned")).scalar(), None)
+        self.assertEqual(upgrade_schema(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,198 @@
+import base64
+import json
+import os
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from flask import Flask
+
+from src.models import db, User, UserDevice
+from src.services.web_push_dispatcher import WebPushDispatcher
+from src.services.web_push_notification_service import WebPushNotificationService
+
+
+def b64url(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def generate_vapid_private_key() -> str:
+    pem = ec.generate_private_key(ec.SECP256R1()).private_bytes(
+        encoding=serialization.Encoding.PEM,
+        format=serialization.PrivateFormat.PKCS8,
+        encryption_algorithm=serialization.NoEncryption()
+    ).decode()
+    return "".join(line for line in pem.splitlines() if "PRIVATE KEY" not in line)
+
+
+class StubPushServer:
+    """Local push service; answers each path with the status set in statuses (201 by default)."""
+
+    def __init__(self, delay: float = 0):
+        self.requests = []
+        self.statuses = {}
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                self.rfile.read(int(self.headers['Content-Length']))
+                stub.requests.append((self.path, self.headers.get('Authorization')))
+                time.sleep(delay)
+                self.send_response(stub.statuses.get(self.path, 201))
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def subscription(self, path: str) -> dict:
+        receiver = ec.generate_private_key(ec.SECP256R1()).public_key().public_bytes(
+            serialization.Encoding.X962, serialization.PublicFormat.UncompressedPoint
+        )
+        return {
+            "endpoint": f"http://127.0.0.1:{self.server.server_address[1]}{path}",
+            "keys": {"p256dh": b64url(receiver), "auth": b64url(os.urandom(16))},
+        }
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class TestWebPushDispatcher(unittest.TestCase):
+    def setUp(self):
+        self.dispatcher = WebPushDispatcher(vapid_private_key=generate_vapid_private_key())
+
+    def test_vapid_headers_are_signed_once_per_audience(self):
+        with patch.object(self.dispatcher._get_vapid(), 'sign', wraps=self.dispatcher._get_vapid().sign) as sign:
+            first = self.dispatcher.vapid_headers("https://fcm.googleapis.com/fcm/send/a")
+            second = self.dispatcher.vapid_headers("https://fcm.googleapis.com/fcm/send/b")
+            other = self.dispatcher.vapid_headers("https://updates.push.services.mozilla.com/wpush/v2/c")
+
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, other)
+        self.assertEqual(sign.call_count, 2)
+
+    def test_vapid_headers_are_resigned_when_claims_near_expiry(self):
+        endpoint = "https://fcm.googleapis.com/fcm/send/a"
+        self.dispatcher.vapid_headers(endpoint)
+        audience = "https://fcm.googleapis.com"
+        headers, _ = self.dispatcher._signed[audience]
+        self.dispatcher._signed[audience] = (headers, int(time.time()) + 60)
+
+        self.dispatcher.vapid_headers(endpoint)
+
+        self.assertGreater(self.dispatcher._signed[audience][1], int(time.time()) + 60)
+
+    def test_send_reports_accepted_and_gone_subscriptions(self):
+        with StubPushServer() as server:
+            server.statuses = {"/gone": 410, "/error": 500}
+            subscriptions = [
+                (1, server.subscription("/ok")),
+                (2, server.subscription("/gone")),
+                (3, server.subscription("/error")),
+            ]
+
+            sent, gone = self.dispatcher.send(subscriptions, {"notification": {"title": "Hi"}})
+
+        self.assertEqual(sent, 1)
+        self.assertEqual(gone, [2])
+        self.assertEqual(len(server.requests), 3)
+        self.assertTrue(all(auth.startswith("vapid t=") for _, auth in server.requests))
+
+    def test_send_runs_in_parallel(self):
+        with StubPushServer(delay=0.3) as server:
+            subscriptions = [(i, server.subscription(f"/{i}")) for i in range(4)]
+
+            started = time.monotonic()
+            sent, _ = self.dispatcher.send(subscriptions, {"notification": {"title": "Hi"}})
+            elapsed = time.monotonic() - started
+
+        self.assertEqual(sent, 4)
+        self.assertLess(elapsed, 0.9)
+
+    def test_send_without_vapid_key_fails(self):
+        dispatcher = WebPushDispatcher(vapid_private_key=None)
+        with StubPushServer() as server:
+            sent, gone = dispatcher.send([(1, server.subscription("/ok"))], {})
+
+        self.assertEqual((sent, gone), (0, []))
+        self.assertEqual(server.requests, [])
+
+
+class TestWebPushDelivery(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config['TESTING'] = True
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+
+        db.init_app(self.app)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        self.user = User(
+            name="Web User",
+            email="web@test.com",
+            phone_number="+1234567890",
+            password="hashed",
+            role="customer",
+            email_verified=True
+        )
+        db.session.add(self.user)
+        db.session.commit()
+
+        self.dispatcher = WebPushDispatcher(vapid_private_key=generate_vapid_private_key())
+        self.dispatcher_patch = patch(
+            'src.services.web_push_notification_service.get_web_push_dispatcher',
+            return_value=self.dispatcher
+        )
+        self.dispatcher_patch.start()
+
+    def tearDown(self):
+        self.dispatcher_patch.stop()
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def add_web_device(self, subscription: dict) -> UserDevice:
+        device = UserDevice(
+            user_id=self.user.id,
+            push_token=f"web_{self.user.id}_{len(UserDevice.query.all())}",
+            web_push_token=json.dumps(subscription),
+            device_type="web",
+            is_active=True
+        )
+        db.session.add(device)
+        db.session.commit()
+        return device
+
+    def test_expired_subscriptions_are_deactivated(self):
+        with StubPushServer() as server:
+            server.statuses = {"/gone": 410}
+            live = self.add_web_device(server.subscription("/live"))
+            expired = self.add_web_device(server.subscription("/gone"))
+
+            success = WebPushNotificationService.send_notification_to_user_web(
+                self.user.id, "Title", "Body", tag="order"
+            )
+
+        self.assertTrue(success)
+        self.assertTrue(db.session.get(UserDevice, live.id).is_active)
+        self.assertFalse(db.session.get(UserDevice, expired.id).is_active)
+
+
+if __name__ == '__main__':
+    unittest.main()